@@ -6,8 +6,65 @@ Following tutorial:
 https://realpython.com/python-testing/#writing-your-first-test
 '''
 
+import os
+import re
+import csv
+import gzip
+import pickle
+import json
+import time
+import random
+import tempfile
+from io import StringIO
 import unittest
-from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten
+from unittest import mock
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, Zettel, Instruments, STAGES, SectionSummary
+from zettelkasten_txt_to_csv.batch import convert_batch, find_inputs
+from zettelkasten_txt_to_csv.benchmark import LegacyZettelkasten, synthetic_txt, synthetic_csv, import_time, SLOW_IMPORTS
+from zettelkasten_txt_to_csv.benchmark import run_suite, save_baseline, load_baseline, compare_baseline, write_synthetic_txt, SUITE_STAGES
+from zettelkasten_txt_to_csv.search import SearchIndex
+from zettelkasten_txt_to_csv.graph import ParentIndex
+from zettelkasten_txt_to_csv.snapshot import load_snapshot
+from zettelkasten_txt_to_csv.pipeline import convert_pipeline
+from zettelkasten_txt_to_csv.strategy import Context, convert_pipeline as pipeline_strategy
+from zettelkasten_txt_to_csv.dedup import DuplicateFinder
+from zettelkasten_txt_to_csv.notes import read_ahead, NoteImporter
+from zettelkasten_txt_to_csv.attachments import AttachmentStore
+from zettelkasten_txt_to_csv import columnar
+from zettelkasten_txt_to_csv.columnar import ColumnarLibrary
+from zettelkasten_txt_to_csv.service import serve
+from zettelkasten_txt_to_csv import roundtrip
+from datetime import datetime, date
+from zettelkasten_txt_to_csv.strategy import import_markdown
+from zettelkasten_txt_to_csv.__main__ import main
+
+SAMPLE_TXT = '''Intro before any subtitle [index] 1 [title] First card [zettel] Plants need light; water too.
+[reference] Smith 2019 [keyword] plants
+
+Soil
+
+[index] [title] Loam [zettel] Loam is a mix of sand, silt and clay.
+[reference] Jones [keyword] soil
+[index] 44077.123 [zettel] Compost: decomposed organic matter [keyword] soil
+
+
+Watering
+
+[index] [zettel] Water in the morning [reference] Blog [keyword] water
+[index] 2 [title] Drip [zettel] Drip irrigation saves water. [parent] 1
+'''
+
+def write_sample(folder, name = 'sample.txt', contents = SAMPLE_TXT):
+	'''Write sample zettelkasten into folder and return its path'''
+	file_path = os.path.join(folder, name).replace('\\', '/')
+	with open(file_path, 'w', encoding = 'utf-8') as my_file: my_file.write(contents)
+	return file_path
+
+def content_fields(library):
+	'''Key-independent view of library: title, reference, keyword, and zettel of non-section cards'''
+	return [(value['title'], value['reference'], value['keyword'],
+		'' if value['zettel'].startswith('Section header.') else value['zettel'])
+		for key, value in dict(library).items()]
 
 class TestZettelkasten(unittest.TestCase):
 	'''Unit test for key functions of zettelkasten converter'''
@@ -104,6 +161,1188 @@ class TestZkn_TXT(unittest.TestCase):
 		global zkn
 		del zkn
 
+class TestZkn_UID(unittest.TestCase):
+	'''Unit test for timestamp key allocation'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+
+	def test_keys_increase(self):
+		'''Keys should be unique and strictly increasing without sleeping'''
+		keys = [zkn.timestamp() for _ in range(10000)]
+		self.assertEqual(len(keys), len(set(keys)))
+		self.assertEqual(keys, sorted(keys, key = float))
+
+	def test_seeded_keys(self):
+		'''Seeded keys should repeat exactly in Googlesheets format'''
+		result = [zkn.timestamp() for _ in range(3)]
+		correct_answer = ['44077.50000000', '44077.50000001', '44077.50000002']
+		self.assertEqual(result, correct_answer)
+		self.assertEqual(Zettelkasten(seed = 44077.5).uid.reserve(3), correct_answer)
+
+	def test_clock_keys(self):
+		'''Unseeded keys should follow the clock'''
+		key = Zettelkasten().timestamp()
+		self.assertRegex(key, r'^\d{5}\.\d{8}$')
+		self.assertGreater(float(key), 44000)
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+
+class TestZkn_Stream(unittest.TestCase):
+	'''Unit test for streaming text import'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name)
+
+	def test_stream_matches_import(self):
+		'''Streaming in small chunks should give the same zettels as import_txt_zk'''
+		correct_answer = content_fields(zkn.import_txt_zk(file_path = self.file_path))
+		for chunk_size in (1, 7, 4096):
+			result = content_fields(zkn.iter_txt_zk(file_path = self.file_path, chunk_size = chunk_size))
+			self.assertEqual(result, correct_answer)
+
+	def test_export_stream(self):
+		'''Exporters should consume the stream directly'''
+		stream = zkn.iter_txt_zk(file_path = self.file_path)
+		zkn.export_zk_csv(zkn.extract_filepath(self.file_path), stream)
+		with open(f"{zkn.extract_filepath(self.file_path)}_{zkn.master_key}.csv", encoding = 'utf-8') as my_file:
+			result = len(my_file.readlines())
+		self.assertEqual(result, 8)
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+		self.folder.cleanup()
+
+class TestZkn_Lexer(unittest.TestCase):
+	'''Unit test for single pass tokenizer'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+
+	def test_tokenize(self):
+		'''Subtitles and field markers should come out of one pass in order'''
+		result = list(zkn.tokenize('[index] 1 [title] A\n\nSoil\n\n[zettel] b'))
+		correct_answer = [('field', (0, 7)), ('field', (10, 17)), ('section', (19, 27)), ('field', (27, 35))]
+		self.assertEqual(result, correct_answer)
+
+	def test_field_aliases(self):
+		'''Field names should resolve regardless of case or partial spelling'''
+		result = [zkn.field_name(name) for name in ('[Title]', '[subtitle]', '[INDEX]', '[x]')]
+		correct_answer = ['title', 'title', 'index', '']
+		self.assertEqual(result, correct_answer)
+
+	def test_matches_legacy(self):
+		'''Single pass import should give the same library as the original regex path, which also
+		dropped the last character of each section'''
+		for contents in (SAMPLE_TXT, synthetic_txt(sections = 5, zettels = 20)):
+			file_path = write_sample(self.folder.name, contents = contents)
+			result = Zettelkasten(seed = 44077).import_txt_zk(file_path = file_path)
+			correct_answer = LegacyZettelkasten(seed = 44077).import_txt_zk(file_path = file_path)
+			self.assertEqual(len(result), len(correct_answer))
+			for fields, legacy_fields in zip(content_fields(result), content_fields(correct_answer)):
+				self.assertEqual([field if field == legacy else field[:-1] for field, legacy in zip(fields, legacy_fields)], list(legacy_fields))
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+		self.folder.cleanup()
+
+class TestZkn_Parallel(unittest.TestCase):
+	'''Unit test for multi-process text import'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name, contents = SAMPLE_TXT + synthetic_txt(sections = 20, zettels = 10))
+
+	def test_parallel_matches_serial(self):
+		'''Parallel import should be identical to serial import, keys included'''
+		correct_answer = Zettelkasten(seed = 44077).import_txt_zk(file_path = self.file_path)
+		result = Zettelkasten(seed = 44077).import_txt_zk(file_path = self.file_path, workers = 2)
+		self.assertEqual(list(result.items()), list(correct_answer.items()))
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Incremental(unittest.TestCase):
+	'''Unit test for incremental text import with manifest'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name)
+		zkn = Zettelkasten()
+		self.library = zkn.import_txt_incremental(file_path = self.file_path)
+		zkn.save_manifest()
+
+	def test_first_run(self):
+		'''Without manifest everything should be imported'''
+		correct_answer = content_fields(Zettelkasten().import_txt_zk(file_path = self.file_path))
+		self.assertEqual(content_fields(self.library), correct_answer)
+
+	def test_unchanged(self):
+		'''Re-run on unchanged file should return nothing'''
+		result = Zettelkasten().import_txt_incremental(file_path = self.file_path)
+		self.assertEqual(result, {})
+
+	def test_changed_zettel(self):
+		'''Only changed zettel and its index card should be returned, with old keys elsewhere'''
+		write_sample(self.folder.name, contents = SAMPLE_TXT.replace('in the morning', 'at dusk'))
+		result = Zettelkasten().import_txt_incremental(file_path = self.file_path)
+		self.assertEqual([value['zettel'] for value in result.values()][1], 'Water at dusk')
+		self.assertEqual(len(result), 2)
+		section_key, zettel_key = result
+		self.assertIn(section_key, self.library)
+		self.assertNotIn(zettel_key, self.library)
+		drip_key = next(key for key, value in self.library.items() if value['title'] == 'Drip')
+		self.assertIn(drip_key, result[section_key]['zettel'])
+
+	def test_repeated_content(self):
+		'''Zettels with the same content should each keep their own key'''
+		twins = SAMPLE_TXT + '[index] [title] Twin [zettel] Same text\n[index] [title] Twin [zettel] Same text\n'
+		write_sample(self.folder.name, contents = twins)
+		zkn = Zettelkasten()
+		library = zkn.import_txt_incremental(file_path = self.file_path)
+		zkn.save_manifest()
+		twin_keys = [key for key, value in library.items() if value['title'] == 'Twin']
+		write_sample(self.folder.name, contents = twins + '[index] [title] New [zettel] Added\n')
+		result = Zettelkasten().import_txt_incremental(file_path = self.file_path)
+		self.assertEqual([value['title'] for value in result.values()], ['Watering', 'New'])
+		section_key = next(iter(result))
+		self.assertTrue(all(key in result[section_key]['zettel'] for key in twin_keys))
+
+	def test_shared_content(self):
+		'''Same zettel in a changed and an unchanged section should not take the unchanged one's key'''
+		alpha = 'Alpha\n\n[index] [title] Shared [zettel] Same text\n\n'
+		beta = 'Beta\n\n[index] [title] Shared [zettel] Same text\n[index] [title] Other [zettel] {}\n\n'
+		for order in ((alpha, beta), (beta, alpha)):
+			with self.subTest(first = order[0].split()[0]):
+				contents = 'Notes [index] [title] Start [zettel] First\n\n' + ''.join(order)
+				write_sample(self.folder.name, contents = contents.format('Before'))
+				zkn = Zettelkasten()
+				library = zkn.import_txt_incremental(file_path = self.file_path)
+				zkn.save_manifest()
+				cards = {value['title']: key for key, value in library.items() if value['title'] in ('Alpha', 'Beta')}
+				shared = {library[value['parent']]['title']: key for key, value in library.items() if value['title'] == 'Shared'}
+				write_sample(self.folder.name, contents = contents.format('After'))
+				result = Zettelkasten().import_txt_incremental(file_path = self.file_path)
+				self.assertEqual([value['title'] for value in result.values()], ['Beta', 'Other'])
+				self.assertEqual(next(iter(result)), cards['Beta'])
+				self.assertIn(shared['Beta'], result[cards['Beta']]['zettel'])
+				self.assertNotIn(shared['Alpha'], result[cards['Beta']]['zettel'])
+				os.remove(os.path.join(self.folder.name, 'sample_manifest.json'))
+
+	def test_command_line(self):
+		'''--incremental should save the manifest with the outputs and then export only changes'''
+		output_dir = os.path.join(self.folder.name, 'out')
+		self.assertEqual(main([self.file_path, '-f', 'csv', '-o', output_dir, '--incremental']), 0)
+		self.assertIn('sample_manifest.json', os.listdir(output_dir))
+		write_sample(self.folder.name, contents = SAMPLE_TXT.replace('in the morning', 'at dusk'))
+		self.assertEqual(main([self.file_path, '-f', 'csv', '-o', output_dir, '--incremental', '--force']), 0)
+		newest = max((os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.endswith('.csv')), key = os.path.getmtime)
+		self.assertEqual([value['zettel'] for value in Zettelkasten().import_csv_zk(file_path = newest).values()][1], 'Water at dusk')
+		self.assertRaises(SystemExit, main, [self.file_path, '--incremental', '--stream'])
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Zettel(unittest.TestCase):
+	'''Unit test for compact zettel records'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.zettel = Zettel(parent = '1', title = 'Loam', zettel = 'Sand, silt and clay')
+
+	def test_mapping_view(self):
+		'''Zettel should read, write and compare like the dictionary it replaces'''
+		self.zettel['keyword'] = 'soil'
+		self.assertEqual(self.zettel.keyword, 'soil')
+		self.assertEqual(self.zettel['title'], 'Loam')
+		correct_answer = dict(parent = '1', title = 'Loam', zettel = 'Sand, silt and clay', reference = '', keyword = 'soil')
+		self.assertEqual(dict(self.zettel), correct_answer)
+		self.assertEqual(self.zettel, correct_answer)
+		with self.assertRaises(KeyError): self.zettel['colour'] = 'brown'
+
+	def test_compact(self):
+		'''Zettel should have no per-instance dictionary and survive pickling'''
+		self.assertFalse(hasattr(self.zettel, '__dict__'))
+		self.assertEqual(pickle.loads(pickle.dumps(self.zettel)), self.zettel)
+
+	def test_import_records(self):
+		'''Imported library should hold Zettel records'''
+		with tempfile.TemporaryDirectory() as folder:
+			library = Zettelkasten().import_txt_zk(file_path = write_sample(folder))
+		self.assertTrue(all(type(value) is Zettel for value in library.values()))
+
+class TestZkn_CSVLoader(unittest.TestCase):
+	'''Unit test for direct csv import'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = synthetic_csv(os.path.join(self.folder.name, 'synthetic.csv'), rows = 50)
+
+	def test_matches_legacy(self):
+		'''Direct loader should match the row to text path, which also dropped the last character'''
+		result = zkn.import_csv_zk(file_path = self.file_path)
+		correct_answer = LegacyZettelkasten(seed = 44077.5).import_csv_zk(file_path = self.file_path)
+		self.assertEqual(list(result), list(correct_answer))
+		for key, value in result.items():
+			self.assertEqual(dict(value, keyword = value['keyword'][:-1]), dict(correct_answer[key]))
+
+	def test_export_round_trip(self):
+		'''Semicolon csv without header, as written by export_zk_csv, should import unchanged'''
+		library = zkn.import_csv_zk(file_path = self.file_path)
+		zkn.export_zk_csv(os.path.join(self.folder.name, 'export'), library)
+		result = Zettelkasten().import_csv_zk(file_path = os.path.join(self.folder.name, f"export_{zkn.master_key}.csv"))
+		self.assertEqual(list(result.items()), list(library.items()))
+
+	def test_duplicates(self):
+		'''Repeated keys should keep their first row'''
+		with open(self.file_path, 'a', encoding = 'utf-8') as my_file:
+			my_file.write('44077.00000,,Repeat,Repeated zettel,,\n')
+		result = zkn.import_csv_zk(file_path = self.file_path)
+		self.assertEqual(len(result), 50)
+		self.assertNotEqual(result['44077.00000']['title'], 'Repeat')
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+		self.folder.cleanup()
+
+class TestZkn_Export(unittest.TestCase):
+	'''Unit test for buffered atomic exports'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+		zkn.library = zkn.import_txt_zk(file_path = write_sample(self.folder.name))
+		self.file_path = os.path.join(self.folder.name, 'export')
+
+	def test_gzip(self):
+		'''Compressed output should hold the same text as plain output'''
+		for export in (zkn.export_zk_csv, zkn.export_zk_txt):
+			plain_path = export(self.file_path, zkn.library)
+			gzip_path = export(self.file_path, zkn.library, compress = True)
+			self.assertEqual(gzip_path, plain_path + '.gz')
+			with open(plain_path, 'rb') as plain, gzip.open(gzip_path, 'rb') as compressed:
+				self.assertEqual(compressed.read(), plain.read())
+
+	def test_batches(self):
+		'''Txt output should not depend on batch size'''
+		with open(zkn.export_zk_txt(self.file_path, zkn.library, batch_size = 1), 'rb') as my_file: correct_answer = my_file.read()
+		with open(zkn.export_zk_txt(self.file_path, zkn.library, batch_size = 3), 'rb') as my_file: result = my_file.read()
+		self.assertEqual(result, correct_answer)
+
+	def test_atomic(self):
+		'''Failed export should leave no output or temporary file behind'''
+		def broken_stream():
+			yield from zkn.library.items()
+			raise RuntimeError('Interrupted export')
+		with self.assertRaises(RuntimeError): zkn.export_zk_csv(self.file_path, broken_stream())
+		self.assertEqual(os.listdir(self.folder.name), ['sample.txt'])
+
+	def test_failed_close(self):
+		'''Export failing while flushing its last writes should leave no temporary file behind'''
+		with mock.patch.object(gzip.GzipFile, 'flush', side_effect = OSError('No space left on device')):
+			with self.assertRaises(OSError): zkn.export_zk_txt(self.file_path, zkn.library, compress = True)
+		self.assertEqual(os.listdir(self.folder.name), ['sample.txt'])
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+		self.folder.cleanup()
+
+class TestZkn_Batch(unittest.TestCase):
+	'''Unit test for directory conversion'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		write_sample(self.folder.name, 'first.txt')
+		write_sample(self.folder.name, 'second.txt')
+		with open(os.path.join(self.folder.name, 'broken.csv'), 'wb') as my_file: my_file.write(b'index,zettel\n\xff\xfe\n')
+
+	def test_batch(self):
+		'''Each good file should convert, broken file should fail alone'''
+		for workers in (1, 2):
+			results = convert_batch(self.folder.name, formats = ('csv',), workers = workers, force = True)
+			self.assertEqual([os.path.basename(result['file']) for result in results], ['broken.csv', 'first.txt', 'second.txt'])
+			self.assertTrue(results[0]['error'].startswith('UnicodeDecodeError'))
+			self.assertEqual([result['zettels'] for result in results[1:]], [8, 8])
+			self.assertTrue(all(os.path.exists(output) for result in results[1:] for output in result['outputs']))
+
+	def test_up_to_date(self):
+		'''Second run should skip files with newer outputs, and never read outputs as inputs'''
+		convert_batch(self.folder.name, workers = 1)
+		self.assertEqual(len(find_inputs(self.folder.name)), 3)
+		results = convert_batch(self.folder.name, workers = 1)
+		self.assertEqual([os.path.basename(result['file']) for result in results], ['broken.csv'])
+
+	def test_output_dir(self):
+		'''Outputs should go to output_dir, glob should select inputs'''
+		output_dir = os.path.join(self.folder.name, 'out')
+		results = convert_batch(os.path.join(self.folder.name, '*.txt'), output_dir = output_dir, workers = 1)
+		self.assertEqual(len(results), 2)
+		self.assertEqual(len(os.listdir(output_dir)), 4)
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_CLI(unittest.TestCase):
+	'''Unit test for python -m command line'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name)
+		self.output_dir = os.path.join(self.folder.name, 'out')
+
+	def outputs(self):
+		return sorted(os.listdir(self.output_dir))
+
+	def test_convert(self):
+		'''Directory input should write the chosen format into output directory'''
+		self.assertEqual(main([self.folder.name, '--format', 'csv', '--output-dir', self.output_dir]), 0)
+		self.assertEqual(len(self.outputs()), 1)
+		self.assertTrue(self.outputs()[0].endswith('.csv'))
+
+	def test_stream(self):
+		'''Streamed conversion should give matching keys in both formats'''
+		self.assertEqual(main([self.file_path, '--stream', '-o', self.output_dir]), 0)
+		csv_name, txt_name = self.outputs()
+		with open(os.path.join(self.output_dir, csv_name), encoding = 'utf-8', newline = '') as my_file:
+			keys = [row[0] for row in csv.reader(my_file, delimiter = ';')]
+		with open(os.path.join(self.output_dir, txt_name), encoding = 'utf-8') as my_file: text = my_file.read()
+		self.assertEqual(len(keys), 8)
+		self.assertEqual(keys, re.findall(r'\[index\] (\S+)', text))
+
+	def test_exit_status(self):
+		'''Missing input and failed conversion should give non-zero exit status'''
+		self.assertEqual(main([os.path.join(self.folder.name, 'missing.txt')]), 2)
+		broken_path = os.path.join(self.folder.name, 'broken.csv')
+		with open(broken_path, 'wb') as my_file: my_file.write(b'\xff\xfe\n')
+		self.assertEqual(main([broken_path, '-o', self.output_dir]), 1)
+		with mock.patch.object(Zettelkasten, 'find_file') as find_file, self.assertRaises(SystemExit) as context: main([])
+		self.assertEqual(context.exception.code, 2) # usage error, no file dialog without a display
+		find_file.assert_not_called()
+
+	def test_lazy_imports(self):
+		'''Command line should start without loading tkinter or other slow modules'''
+		seconds, modules = import_time(repeat = 1)
+		self.assertGreater(seconds, 0)
+		self.assertEqual([name for name in SLOW_IMPORTS if name in modules], [])
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Benchmark(unittest.TestCase):
+	'''Unit test for benchmark suite and baseline comparison'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.report = run_suite(sizes = (200,), per_section = 50, words = 10, repeat = 1, isolate = False)
+
+	def test_suite(self):
+		'''Every stage should report time, throughput and zettel count'''
+		self.assertEqual(list(self.report['results']), [f"{stage}/200" for stage in SUITE_STAGES])
+		for result in self.report['results'].values():
+			self.assertGreaterEqual(result['zettels'], 200)
+			self.assertGreater(result['zettels_per_second'], 0)
+
+	def test_baseline(self):
+		'''Saved baseline should load back and show no regression against itself'''
+		baseline = load_baseline(save_baseline(os.path.join(self.folder.name, 'baseline.json'), self.report))
+		self.assertEqual(baseline, self.report)
+		self.assertEqual(compare_baseline(baseline, self.report), [])
+
+	def test_regression(self):
+		'''Slower stage beyond threshold should be flagged, within threshold should not'''
+		slower = {name: dict(result, zettels_per_second = result['zettels_per_second'] * 0.7)
+			for name, result in self.report['results'].items()}
+		regressions = compare_baseline(self.report, dict(self.report, results = slower), threshold = 0.2)
+		self.assertEqual(len(regressions), len(SUITE_STAGES))
+		self.assertEqual(compare_baseline(self.report, dict(self.report, results = slower), threshold = 0.4), [])
+
+	def test_synthetic_file(self):
+		'''Written synthetic file should match synthetic text'''
+		file_path = write_synthetic_txt(os.path.join(self.folder.name, 'synthetic.txt'), 3, 4)
+		with open(file_path, 'r', encoding = 'utf-8') as my_file: self.assertEqual(my_file.read(), synthetic_txt(3, 4))
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Instruments(unittest.TestCase):
+	'''Unit test for stage timers and counters'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name)
+
+	def test_disabled(self):
+		'''Instruments should be off by default, leaving hot methods unwrapped'''
+		zkn = Zettelkasten()
+		self.assertFalse(zkn.instruments.enabled)
+		self.assertNotIn('clean_text', vars(zkn))
+		zkn.import_txt_zk(file_path = self.file_path)
+		self.assertEqual(zkn.instruments.report(), dict(seconds = {}, calls = {}, counters = {}))
+
+	def test_stages(self):
+		'''Import and export should time every stage and count zettels'''
+		zkn = Zettelkasten(seed = 44077.5, instruments = True)
+		zkn.library = zkn.import_txt_zk(file_path = self.file_path)
+		zkn.export_zk_csv(os.path.join(self.folder.name, 'export'), zkn.library)
+		report = zkn.instruments.report()
+		self.assertEqual(tuple(report['seconds']), STAGES)
+		self.assertEqual(report['counters']['zettels'], 8)
+		self.assertEqual(report['calls']['keys'], 2 + 3 + 4) # master and section keys, section cards, zettels without index
+		self.assertEqual(json.load(open(zkn.instruments.save_report(os.path.join(self.folder.name, 'report.json')))), report)
+
+	def test_counters(self):
+		'''Duplicate keys and unidentified fields should be counted'''
+		file_path = write_sample(self.folder.name, 'errors.txt', '\n\nErrors\n\n[index] 44077.1 [zettel] One '
+			'[index] 44077.1 [zettel] Two [bogus] Three [index] 3 [title] Four [zettel] Five: six\n')
+		zkn = Zettelkasten(instruments = True)
+		library = zkn.import_txt_zk(file_path = file_path)
+		self.assertEqual(zkn.instruments.counters['duplicates'], 1)
+		self.assertEqual(zkn.instruments.counters['unidentified fields'], 1)
+		self.assertIn(('Four', 'Five: six'), [(zettel.title, zettel.zettel) for zettel in library.values()])
+
+	def test_exclusive(self):
+		'''Time in a nested stage should not also count towards the outer stage'''
+		instruments = Instruments()
+		with instruments.timer('export'):
+			with instruments.timer('read'): time.sleep(0.05)
+		self.assertGreaterEqual(instruments.seconds['read'], 0.05)
+		self.assertLess(instruments.seconds['export'], 0.05)
+
+	def test_profile(self):
+		'''Profile hook should save cProfile stats'''
+		file_path = os.path.join(self.folder.name, 'profile.out')
+		zkn = Zettelkasten()
+		with zkn.instruments.profile(file_path): zkn.import_txt_zk(file_path = self.file_path)
+		self.assertTrue(os.path.getsize(file_path) > 0)
+
+	def test_cli_report(self):
+		'''Command line report should hold stage timers of each file'''
+		report_path = os.path.join(self.folder.name, 'report.json')
+		self.assertEqual(main([self.file_path, '-o', os.path.join(self.folder.name, 'out'), '--report', report_path]), 0)
+		with open(report_path, encoding = 'utf-8') as my_file: reports = json.load(my_file)
+		self.assertEqual(list(reports), [self.file_path])
+		self.assertIn('export', reports[self.file_path]['seconds'])
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_MemoryMap(unittest.TestCase):
+	'''Unit test for memory mapped txt reader'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+
+	def assertSameImport(self, contents, newline = '\n'):
+		'''Mapped import and stream should give the same library as decoded text'''
+		file_path = os.path.join(self.folder.name, 'mapped.txt')
+		with open(file_path, 'w', encoding = 'utf-8', newline = newline) as my_file: my_file.write(contents)
+		correct_answer = Zettelkasten(seed = 44077.5).import_txt_zk(file_path = file_path)
+		self.assertEqual(Zettelkasten(seed = 44077.5).import_txt_zk(file_path = file_path, memory_map = True), correct_answer)
+		self.assertEqual(dict(Zettelkasten(seed = 44077.5).iter_txt_zk(file_path, memory_map = True)),
+			dict(Zettelkasten(seed = 44077.5).iter_txt_zk(file_path)))
+		return correct_answer
+
+	def test_sample(self):
+		'''Sample should import the same with either line ending'''
+		self.assertEqual(len(self.assertSameImport(SAMPLE_TXT)), 8)
+		self.assertEqual(len(self.assertSameImport(SAMPLE_TXT, '\r\n')), 8)
+		self.assertEqual(len(self.assertSameImport(SAMPLE_TXT, '\r')), 8)
+		self.assertSameImport('\n\nSoil\r\n\r[index] [zettel] Mixed\r\rendings\n\r\nWater\r\r\n[index] [zettel] Two\r')
+
+	def test_unicode(self):
+		'''Multibyte subtitles, markers and final character should match the text pattern'''
+		library = self.assertSameImport('\n\nGärten und Bäume\n\n[index] [tïtle] Ignored [zettel] Ünïcode text [keyword] é\n'
+			'\n\nNot — a subtitle\n\n[index] [title] Dash [zettel] Em — dash é')
+		self.assertIn('Gärten und Bäume', [zettel.title for zettel in library.values()])
+
+	def test_long_subtitle(self):
+		'''Lines over 100 characters should not split sections'''
+		self.assertSameImport(f"\n\n{'x' * 101}\n\n[index] [zettel] One\n\n{'ü' * 100}\n\n[index] [zettel] Two\n")
+
+	def test_empty(self):
+		'''Empty file should give an empty library'''
+		self.assertEqual(self.assertSameImport(''), {})
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Summaries(unittest.TestCase):
+	'''Unit test for section index cards built eagerly, lazily or not at all'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.file_path = write_sample(self.folder.name)
+		self.eager = Zettelkasten(seed = 44077.5).import_txt_zk(file_path = self.file_path)
+
+	def test_index_text(self):
+		'''Joined index text should match the original concatenation'''
+		library = {f"44077.{number:08d}": Zettel(title = f"Title {number}" if number % 3 else '') for number in range(100)}
+		self.assertEqual(Zettelkasten().generate_index_text(library), LegacyZettelkasten().generate_index_text(library))
+
+	def test_lazy(self):
+		'''Lazy summaries should read, export and pickle as the eager text'''
+		zkn = Zettelkasten(seed = 44077.5)
+		lazy = zkn.import_txt_zk(file_path = self.file_path, summaries = 'lazy')
+		cards = [zettel.zettel for zettel in lazy.values() if isinstance(zettel.zettel, SectionSummary)]
+		self.assertEqual(len(cards), 3)
+		self.assertEqual(lazy, self.eager)
+		self.assertIs(type(pickle.loads(pickle.dumps(cards[0]))), str)
+		export_path = os.path.join(self.folder.name, 'export')
+		with open(zkn.export_zk_txt(export_path, lazy), 'rb') as my_file: result = my_file.read()
+		with open(zkn.export_zk_txt(export_path, self.eager), 'rb') as my_file: correct_answer = my_file.read()
+		self.assertEqual(result, correct_answer)
+
+	def test_skip(self):
+		'''Skipped summaries should leave index cards empty and zettels unchanged'''
+		skipped = Zettelkasten(seed = 44077.5).import_txt_zk(file_path = self.file_path, summaries = 'skip')
+		self.assertFalse(any(zettel.zettel.startswith('Section header.') for zettel in skipped.values()))
+		self.assertEqual(content_fields(skipped), content_fields(self.eager))
+		with self.assertRaises(ValueError): Zettelkasten().import_txt_zk(file_path = self.file_path, summaries = 'never')
+
+	def tearDown(self):
+		'''Run after every component test'''
+		self.folder.cleanup()
+
+class TestZkn_Search(unittest.TestCase):
+	'''Unit test for inverted index and queries'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+		self.index = SearchIndex()
+		zkn.library = zkn.import_txt_zk(file_path = write_sample(self.folder.name), index = self.index)
+		self.titles = lambda keys: sorted(zkn.library[key].title for key in keys)
+
+	def test_words(self):
+		'''Word queries should match title and zettel text, but not index card summaries'''
+		self.assertEqual(len(self.index), 8)
+		self.assertEqual(self.titles(self.index.query('water')), ['', 'Drip', 'First card'])
+		self.assertEqual(self.titles(self.index.query('Water MORNING')), [''])
+		self.assertEqual(self.titles(self.index.query('loam compost', mode = 'or')), ['Compost', 'Loam'])
+		self.assertEqual(self.index.query('loam compost'), set())
+		self.assertEqual(self.index.query('section header'), set())
+
+	def test_prefix(self):
+		'''Prefix query should match every word starting with it'''
+		self.assertEqual(self.titles(self.index.query('wat*')), ['', 'Drip', 'First card', 'Watering'])
+		self.assertEqual(self.titles(self.index.query('wat* drip*')), ['Drip'])
+
+	def test_fields(self):
+		'''Keyword, reference and parent should match whole values'''
+		self.assertEqual(self.titles(self.index.query('keyword:SOIL')), ['Compost', 'Loam'])
+		self.assertEqual(self.titles(self.index.query('reference:"smith 2019" water')), ['First card'])
+		soil_key = next(key for key, zettel in zkn.library.items() if zettel.title == 'Soil')
+		self.assertEqual(self.titles(self.index.query(f"parent:{soil_key}")), ['Compost', 'Loam'])
+
+	def test_save_load(self):
+		'''Loaded index should answer as the saved one, and take new zettels'''
+		loaded = SearchIndex.load(self.index.save(os.path.join(self.folder.name, 'index.pickle')))
+		for query in ('water', 'wat*', 'keyword:water', 'reference:jones loam', 'nothing'):
+			self.assertEqual(loaded.query(query), self.index.query(query))
+		loaded.add('44077.9', Zettel(title = 'Watering can', zettel = 'Metal can'))
+		self.assertEqual(self.titles(loaded.query('wat* can') - {'44077.9'}), [])
+		self.assertEqual(len(SearchIndex.load(loaded.save(os.path.join(self.folder.name, 'index.pickle'))).query('metal')), 1)
+
+	def test_stream(self):
+		'''Index filled while streaming should match index filled on import'''
+		index = SearchIndex()
+		library = dict(Zettelkasten(seed = 44077.5).iter_txt_zk(write_sample(self.folder.name), index = index))
+		self.assertEqual(sorted(len(index.query(word)) for word in ('water', 'soil', 'drip')),
+			sorted(len(self.index.query(word)) for word in ('water', 'soil', 'drip')))
+		self.assertEqual(len(index), len(library))
+
+	def tearDown(self):
+		'''Run after every component test'''
+		global zkn
+		del zkn
+		self.folder.cleanup()
+
+NESTED_TXT = '''Garden
+
+[index] 1 [title] Soil [zettel] Ground for plants
+[index] 2 [title] Loam [zettel] Sand, silt and clay [parent] 1
+[index] 3 [title] Clay loam [zettel] Heavy loam [parent] 2
+[index] [title] Water [zettel] Needed daily
+'''
+
+class TestZkn_Graph(unittest.TestCase):
+	'''Unit test for parent and child index'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.library = {key: Zettel(parent = parent) for key, parent in
+			[('a', 'top'), ('b', 'a'), ('c', 'b'), ('d', 'a'), ('x', 'y'), ('y', 'x'), ('z', 'x'), ('s', 's')]}
+		self.graph = ParentIndex(self.library)
+
+	def test_links(self):
+		'''Children should keep library order, with outside parents as extra nodes'''
+		self.assertEqual(len(self.graph), 9)
+		self.assertEqual(self.graph.children_of('a'), ['b', 'd'])
+		self.assertEqual(self.graph.parent('a'), 'top')
+		self.assertIsNone(self.graph.parent('top'))
+		self.assertEqual(self.graph.roots(), ['top'])
+		self.assertRaises(KeyError, self.graph.parent, 'missing')
+
+	def test_subtree(self):
+		'''Subtree should be depth first and stop where a cycle returns'''
+		self.assertEqual(self.graph.subtree('top'), ['top', 'a', 'b', 'c', 'd'])
+		self.assertEqual(self.graph.subtree('a', include_root = False), ['b', 'c', 'd'])
+		self.assertEqual(self.graph.subtree('x'), ['x', 'y', 'z'])
+		self.assertEqual(self.graph.subtree('s'), ['s'])
+
+	def test_depth_cycles(self):
+		'''Depth should count ancestors, and cycles should be found once each'''
+		self.assertEqual([self.graph.depth(key) for key in ('top', 'a', 'c', 'x', 'z', 's')], [0, 1, 3, -1, -1, -1])
+		self.assertEqual(self.graph.cycles(), [['x', 'y'], ['s']])
+		self.assertEqual(self.graph.ancestors('c'), ['b', 'a', 'top'])
+		self.assertEqual(self.graph.ancestors('z'), ['x', 'y'])
+
+	def test_ordered_items(self):
+		'''Export order should put every card after its parent, and keep every card'''
+		self.assertEqual([key for key, _ in self.graph.ordered_items(self.library)], ['a', 'b', 'c', 'd', 'x', 'y', 'z', 's'])
+
+	def test_nested_import(self):
+		'''Parent naming a short index should nest cards below each other, in every import path'''
+		with tempfile.TemporaryDirectory() as folder:
+			file_path = write_sample(folder, contents = NESTED_TXT)
+			for options in (dict(), dict(workers = 2), dict(memory_map = True)):
+				zkn = Zettelkasten(seed = 44077.5)
+				library = zkn.import_txt_zk(file_path = file_path, **options)
+				keys = {zettel.title: key for key, zettel in library.items()}
+				graph = ParentIndex(library)
+				self.assertEqual([library[key].title for key in graph.subtree(keys['Soil'])], ['Soil', 'Loam', 'Clay loam'])
+				self.assertEqual(graph.depth(keys['Clay loam']), graph.depth(keys['Water']) + 2)
+
+			# csv export keeps the nesting when read back
+			zkn = Zettelkasten(seed = 44077.5)
+			library = zkn.import_txt_zk(file_path = file_path)
+			read_back = Zettelkasten().import_csv_zk(file_path = zkn.export_zk_csv(os.path.join(folder, 'nested'), library))
+			self.assertEqual(ParentIndex(read_back).subtree(keys['Soil']), ParentIndex(library).subtree(keys['Soil']))
+
+class TestZkn_Snapshot(unittest.TestCase):
+	'''Unit test for binary snapshot export and reload'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		global zkn
+		zkn = Zettelkasten(diagnostics = False, seed = 44077.5)
+		self.folder = tempfile.TemporaryDirectory()
+		zkn.library = zkn.import_txt_zk(file_path = write_sample(self.folder.name))
+		# unusual values: non-ascii, separator inside a value, missing parent, repeated values
+		zkn.library['44077.9'] = Zettel(parent = None, title = 'Café', zettel = 'nul \x00 inside', keyword = 'soil')
+		self.file_path = zkn.export_zk_snapshot(os.path.join(self.folder.name, 'sample'), zkn.library)
+		self.expected = {key: tuple(zettel[field] or '' for field in zettel) for key, zettel in zkn.library.items()}
+		self.rows = lambda library: {key: tuple(zettel[field] for field in zettel) for key, zettel in library.items()}
+
+	def test_round_trip(self):
+		'''Snapshot should reload every field of every zettel, in order'''
+		self.assertTrue(self.file_path.endswith('.snapshot'))
+		library = zkn.import_snapshot_zk(file_path = self.file_path)
+		self.assertEqual(list(library), list(self.expected))
+		self.assertEqual(self.rows(library), self.expected)
+
+	def test_lazy(self):
+		'''Lazy library should read the same zettels from the mapped file'''
+		with zkn.import_snapshot_zk(file_path = self.file_path, lazy = True) as library:
+			self.assertEqual(len(library), 9)
+			self.assertEqual(library['44077.9'].title, 'Café')
+			self.assertEqual(self.rows(library), self.expected)
+			self.assertRaises(KeyError, library.__getitem__, 'missing')
+
+	def test_bad_file(self):
+		'''Other files should be refused'''
+		other_path = os.path.join(self.folder.name, 'other.snapshot')
+		with open(other_path, 'wb') as my_file: my_file.write(b'[index] 44077.1 [zettel] text')
+		self.assertRaises(ValueError, load_snapshot, other_path)
+		self.assertRaises(ValueError, load_snapshot, other_path, True)
+		self.assertEqual(zkn.import_snapshot_zk(file_path = write_sample(self.folder.name)), {})
+
+	def test_convert(self):
+		'''Command line should write snapshots alongside, and read them back as input'''
+		output_dir = os.path.join(self.folder.name, 'out')
+		self.assertEqual(main([os.path.join(self.folder.name, 'sample.txt'), '--snapshot', '-o', output_dir]), 0)
+		snapshot_name = next(name for name in os.listdir(output_dir) if name.endswith('.snapshot'))
+		self.assertEqual(main([os.path.join(output_dir, snapshot_name), '-f', 'csv', '-o', self.folder.name]), 0)
+		csv_name = next(name for name in os.listdir(self.folder.name) if name.endswith('.csv'))
+		self.assertEqual(len(Zettelkasten().import_csv_zk(file_path = os.path.join(self.folder.name, csv_name))), 8)
+
+class TestZkn_Pipeline(unittest.TestCase):
+	'''Unit test for asyncio read, parse and write pipeline'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.inputs = [write_sample(self.folder.name, f"sample{number}.txt") for number in range(3)]
+		zkn = Zettelkasten(seed = 44077.5)
+		self.inputs.append(zkn.export_zk_csv(os.path.join(self.folder.name, 'exported'), zkn.import_txt_zk(file_path = self.inputs[0])))
+		self.output_dir = os.path.join(self.folder.name, 'out')
+
+	def read_csv(self, name):
+		with open(os.path.join(self.output_dir, name), encoding = 'utf-8', newline = '') as my_file:
+			return list(csv.reader(my_file, delimiter = ';'))
+
+	def test_convert(self):
+		'''Every format of every input should come from one parse, matching the batch conversion'''
+		results = convert_pipeline(self.inputs, ('csv', 'txt', 'snapshot'), self.output_dir, workers = 2)
+		self.assertEqual([result['file'] for result in results], self.inputs)
+		self.assertEqual([result['zettels'] for result in results], [8] * 4)
+		for result in results:
+			self.assertEqual(result['error'], '')
+			csv_path, txt_path, snapshot_path = result['outputs']
+			rows = self.read_csv(os.path.basename(csv_path))
+			with open(txt_path, encoding = 'utf-8') as my_file: self.assertEqual([row[0] for row in rows], re.findall(r'\[index\] (\S+)', my_file.read()))
+			self.assertEqual([row[0] for row in rows], list(load_snapshot(snapshot_path)))
+
+		batch_dir = os.path.join(self.folder.name, 'batch')
+		convert_batch(self.inputs[0], ('csv',), batch_dir)
+		batch_library = Zettelkasten().import_csv_zk(file_path = os.path.join(batch_dir, os.listdir(batch_dir)[0]))
+		pipeline_library = Zettelkasten().import_csv_zk(file_path = results[0]['outputs'][0])
+		self.assertEqual(content_fields(pipeline_library), content_fields(batch_library))
+
+	def test_errors(self):
+		'''A failing input should be reported without stopping the others'''
+		bad_path = os.path.join(self.folder.name, 'bad.txt')
+		with open(bad_path, 'wb') as my_file: my_file.write(b'\xff not utf-8')
+		results = convert_pipeline([bad_path] + self.inputs[:2], ('csv',), self.output_dir, workers = 1)
+		self.assertTrue(results[0]['error'].startswith('UnicodeDecodeError'))
+		self.assertEqual([len(result['outputs']) for result in results], [0, 1, 1])
+		self.assertEqual(convert_pipeline(self.inputs[:2], ('csv',), self.output_dir), [])
+
+	def test_cli_strategy(self):
+		'''Command line and Context should both drive the pipeline'''
+		self.assertEqual(main(self.inputs[:2] + ['--pipeline', '-o', self.output_dir]), 0)
+		self.assertEqual(len(os.listdir(self.output_dir)), 4)
+		self.assertRaises(SystemExit, main, self.inputs[:2] + ['--pipeline', '--stream'])
+		context = Context(pipeline_strategy())
+		context.do_some_business_logic(dict(inputs = self.inputs[2:3], formats = ('txt',), output_dir = self.output_dir))
+		self.assertEqual(len(os.listdir(self.output_dir)), 5)
+
+DUPLICATES_TXT = SAMPLE_TXT + '''
+
+Merged export
+
+[index] [title] loam [zettel]   loam is a mix of sand,  silt and clay. [reference] Brown [keyword] soil, texture
+[index] [title] Mulch [zettel] Mulch keeps water in the soil
+'''
+
+class TestZkn_Dedup(unittest.TestCase):
+	'''Unit test for exact and near duplicate detection'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		text = ('the quick brown fox jumps over the lazy dog while birds sing in tall green trees by the river '
+			'and the farmer walks slowly across his wide field to check the young corn before the summer rain comes')
+		self.library = dict(a = Zettel(zettel = text, keyword = 'fox'), b = Zettel(zettel = text.upper() + '  ', keyword = 'dog'),
+			c = Zettel(zettel = text.replace('lazy', 'sleepy')), d = Zettel(zettel = 'Something else entirely'),
+			e = Zettel(parent = 'b', zettel = 'Child of a duplicate'), f = Zettel(zettel = 'Section header. a, b'))
+
+	def test_find(self):
+		'''Exact and near duplicates should group under the first key'''
+		groups = DuplicateFinder().find(self.library)
+		self.assertEqual(groups, [dict(kind = 'near', keep = 'a', duplicates = ['c', 'b'], similarity = 0.846)])
+		self.assertEqual(DuplicateFinder(similarity = 0.9).find(self.library)[0]['duplicates'], ['b'])
+		self.assertEqual(DuplicateFinder(near = False).find(self.library)[0]['kind'], 'exact')
+
+	def test_clusters(self):
+		'''Groups joined through later members of a bucket should report their similarity'''
+		rng = random.Random(2)
+		words = [f"word{number}" for number in range(500)]
+		library = {}
+		for cluster in range(20):
+			text = [rng.choice(words) for _ in range(30)]
+			for copy in range(6):
+				edited = list(text)
+				edited[rng.randrange(30)] = rng.choice(words)
+				library[f"{cluster}.{copy}"] = Zettel(zettel = ' '.join(edited))
+		groups = DuplicateFinder().find(library)
+		self.assertTrue(groups)
+		for group in groups:
+			self.assertTrue(all(key.split('.')[0] == group['keep'].split('.')[0] for key in group['duplicates']))
+			self.assertTrue(0.8 <= group['similarity'] <= 1.0)
+
+	def test_merge_flag(self):
+		'''Merge should keep one zettel with joined keywords, flag should only mark duplicates'''
+		flagged = {key: Zettel(*zettel.values()) for key, zettel in self.library.items()}
+		DuplicateFinder().apply(flagged, 'flag')
+		self.assertEqual(flagged['b'].keyword, 'dog, duplicate of a')
+		self.assertEqual(len(flagged), 6)
+		DuplicateFinder().apply(self.library, 'merge')
+		self.assertEqual(sorted(self.library), ['a', 'd', 'e', 'f'])
+		self.assertEqual(self.library['a'].keyword, 'fox, dog')
+		self.assertEqual(self.library['e'].parent, 'a')
+		self.assertRaises(ValueError, DuplicateFinder().apply, self.library, 'delete')
+
+	def test_merge_index_cards(self):
+		'''Merged duplicates should be taken out of the index cards of their sections'''
+		with tempfile.TemporaryDirectory() as folder:
+			library = Zettelkasten().import_txt_zk(file_path = write_sample(folder, contents = DUPLICATES_TXT))
+		DuplicateFinder().apply(library, 'merge')
+		cards = [str(zettel.zettel) for zettel in library.values() if str(zettel.zettel).startswith('Section header.')]
+		listed = [entry.split(',')[0] for card in cards for entry in card[len('Section header. '):].split('. ') if entry]
+		self.assertEqual(sorted(listed), sorted(key for key, zettel in library.items() if not str(zettel.zettel).startswith('Section header.')))
+		self.assertTrue(cards[-1].endswith('Mulch. '))
+
+	def test_convert(self):
+		'''Command line should merge duplicates of a merged export before writing, with a report'''
+		with tempfile.TemporaryDirectory() as folder:
+			file_path = write_sample(folder, contents = DUPLICATES_TXT)
+			output_dir = os.path.join(folder, 'out')
+			self.assertEqual(main([file_path, '-f', 'csv', '--dedup', 'merge', '-o', output_dir]), 0)
+			report_name = next(name for name in os.listdir(output_dir) if name.endswith('.duplicates.json'))
+			with open(os.path.join(output_dir, report_name), encoding = 'utf-8') as my_file: groups = json.load(my_file)
+			self.assertEqual([group['kind'] for group in groups], ['exact'])
+			csv_name = next(name for name in os.listdir(output_dir) if name.endswith('.csv'))
+			library = Zettelkasten().import_csv_zk(file_path = os.path.join(output_dir, csv_name))
+			self.assertEqual(len(library), 10)
+			self.assertRaises(SystemExit, main, [file_path, '--dedup', 'merge', '--stream'])
+
+SAMPLE_ENEX = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE en-export SYSTEM "http://xml.evernote.com/pub/evernote-export3.dtd">
+<en-export application="Evernote">
+<note><title>Loam</title><content><![CDATA[<en-note><div>Loam is a mix of sand;</div><div>silt &amp; clay.</div></en-note>]]></content>
+<tag>soil</tag><tag>texture</tag><note-attributes><source-url>https://example.org/loam</source-url></note-attributes>
+<resource><data encoding="base64">aGVsbG8=</data></resource></note>
+<note><title>Gardening</title><content><![CDATA[<en-note><div>[index] 1 [title] Compost [zettel] Compost feeds the soil</div>
+<div>[index] 2 [parent] 1 [title] Worms [zettel] Worms turn compost [keyword] worms, soil.</div></en-note>]]></content></note>
+<note><title>Mulch</title><content><![CDATA[<en-note><p>Mulch keeps water in</p></en-note>]]></content></note>
+</en-export>
+'''
+
+SAMPLE_MARKDOWN = '''Intro before any heading.
+
+# Beds
+
+## Raised beds
+Raised beds drain well.
+
+### Height
+Knee height is easiest.
+
+## Paths
+# Watering
+Water early.
+'''
+
+class TestZkn_Notes(unittest.TestCase):
+	'''Unit test for Evernote and Markdown importers'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.zkn = Zettelkasten(seed = 44000)
+
+	def tearDown(self):
+		'''Run after every test'''
+		self.folder.cleanup()
+
+	def test_enex(self):
+		'''Plain notes should be zettels of one section, notes with field markers sections of their own'''
+		library = self.zkn.import_notes_zk(file_path = write_sample(self.folder.name, 'export.enex', SAMPLE_ENEX))
+		titles = [zettel.title for zettel in library.values()]
+		self.assertEqual(titles, ['Gardening', 'Compost', 'Worms', 'export', 'Loam', 'Mulch'])
+		loam = next(zettel for zettel in library.values() if zettel.title == 'Loam')
+		self.assertEqual((loam.zettel, loam.reference, loam.keyword), ('Loam is a mix of sand, silt & clay.', 'https://example.org/loam', 'soil, texture'))
+		keys = list(library)
+		self.assertEqual(library[keys[2]].parent, keys[1]) # [parent] 1 nests under the compost card
+		self.assertEqual(library[keys[4]].parent, keys[3])
+
+	def test_markdown_headings(self):
+		'''Single Markdown file should split into sections at # and nest deeper headings'''
+		library = self.zkn.import_notes_zk(file_path = write_sample(self.folder.name, 'beds.md', SAMPLE_MARKDOWN))
+		cards = {zettel.title: (key, zettel) for key, zettel in library.items()}
+		self.assertEqual(list(cards), ['beds', '', 'Beds', 'Raised beds', 'Height', 'Paths', 'Watering'])
+		self.assertEqual(cards['Height'][1].parent, cards['Raised beds'][0])
+		self.assertEqual(cards['Paths'][1].zettel, 'Paths')
+		self.assertEqual(cards['Raised beds'][1].parent, cards['Beds'][0])
+		self.assertEqual([zettel.zettel for zettel in library.values() if not zettel.title], ['Intro before any heading.', 'Water early.'])
+		self.assertEqual(len(self.zkn.import_notes_zk(file_path = write_sample(self.folder.name, 'other.rtf'))), 0)
+
+	def test_vault(self):
+		'''Folder of Markdown should give a zettel per file, with a section per folder and front matter fields'''
+		vault = os.path.join(self.folder.name, 'vault')
+		os.makedirs(os.path.join(vault, 'ideas'))
+		write_sample(vault, 'seeds.md', '---\ntitle: Seeds\ntags: [seeds, sowing]\nsource: "Brown 2020"\n---\nSow in spring: not too deep.\n')
+		for number in range(12): write_sample(os.path.join(vault, 'ideas'), f"idea{number:02}.md", f"# Idea {number}\n\nText {number}\n")
+		write_sample(vault, 'skipped.txt')
+		library = import_markdown().do_algorithm(dict(file_path = vault + os.sep, threads = 2))
+		sections = [zettel.title for zettel in library.values() if zettel.zettel.startswith('Section header.')]
+		self.assertEqual(sections, ['vault', 'vault/ideas'])
+		seeds = next(zettel for zettel in library.values() if zettel.title == 'Seeds')
+		self.assertEqual((seeds.zettel, seeds.reference, seeds.keyword), ('Sow in spring: not too deep.', 'Brown 2020', 'seeds, sowing'))
+		self.assertEqual([zettel.title for zettel in library.values()][-2:], ['Idea 10', 'Idea 11'])
+		self.assertEqual(list(read_ahead(list(range(50)), str, 3, 2)), list(map(str, range(50))))
+
+	def test_interface(self):
+		'''An importer without notes should fail when it is made, not on the first file'''
+		class Incomplete(NoteImporter): endings = ('.x',)
+		self.assertRaises(TypeError, Incomplete)
+
+	def test_convert(self):
+		'''Command line should convert .enex and .html notes like other inputs'''
+		write_sample(self.folder.name, 'export.enex', SAMPLE_ENEX)
+		write_sample(self.folder.name, 'page.html', '<html><head><title>Shade</title><meta name="keywords" content="shade">'
+			'<style>p {}</style></head><body><p>Ferns grow in shade.</p><script>x = 1</script></body></html>')
+		output_dir = os.path.join(self.folder.name, 'out')
+		self.assertEqual(main([self.folder.name, '-f', 'csv', '-o', output_dir]), 0)
+		libraries = {name.split('_')[0]: Zettelkasten().import_csv_zk(file_path = os.path.join(output_dir, name)) for name in os.listdir(output_dir)}
+		self.assertEqual(sorted(libraries), ['export', 'page'])
+		self.assertEqual(len(libraries['export']), 6)
+		self.assertEqual([(zettel.title, zettel.zettel, zettel.keyword) for zettel in libraries['page'].values()][1], ('Shade', 'Ferns grow in shade.', 'shade'))
+
+IMAGES_ENEX = '''<?xml version="1.0" encoding="UTF-8"?>
+<en-export>
+<note><title>Loam</title><content><![CDATA[<en-note><div>Loam.</div><en-media type="image/png" hash="0"/></en-note>]]></content>
+<resource><data encoding="base64">iVBORw0K
+GgoAAAAN</data><mime>image/png</mime></resource>
+<resource><data encoding="base64">aGVsbG8=</data><mime>text/plain</mime><resource-attributes><file-name>hello.TXT</file-name></resource-attributes></resource></note>
+<note><title>Again</title><content><![CDATA[<en-note><div>Same image.</div></en-note>]]></content>
+<resource><data encoding="base64">iVBORw0KGgoAAAAN</data><mime>image/png</mime></resource></note>
+<note><title>Broken</title><content><![CDATA[<en-note><div>Bad data.</div></en-note>]]></content>
+<resource><data encoding="base64">!!!notbase64</data><mime>image/png</mime></resource></note>
+</en-export>
+'''
+
+class TestZkn_Attachments(unittest.TestCase):
+	'''Unit test for content addressed attachment store'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.store_path = os.path.join(self.folder.name, 'store')
+
+	def tearDown(self):
+		'''Run after every test'''
+		self.folder.cleanup()
+
+	def test_store(self):
+		'''Same contents should be written once, and not again on a second run'''
+		with AttachmentStore(self.store_path, threads = 2) as store:
+			futures = [store.add('aGVsbG8=', 'text/plain') for _ in range(20)] + [store.add_file(write_sample(self.folder.name, 'hello.md', 'hello world'))]
+		paths = {future.result() for future in futures}
+		self.assertEqual(len(paths), 2)
+		self.assertEqual((store.written, store.skipped), (2, 19))
+		path = min(paths)
+		self.assertEqual(os.path.relpath(path, self.store_path).replace(os.sep, '/')[:3], '2c/')
+		with open(path, 'rb') as my_file: self.assertEqual(my_file.read(), b'hello')
+		with AttachmentStore(self.store_path) as store: store.add('aGVsbG8=').result()
+		self.assertEqual((store.written, store.skipped), (0, 1))
+
+	def test_notes(self):
+		'''Resources and images should be stored and referenced from their zettel, bad data reported'''
+		file_path = write_sample(self.folder.name, 'export.enex', IMAGES_ENEX)
+		library = Zettelkasten().import_notes_zk(file_path = file_path, attachments = self.store_path)
+		references = {zettel.title: zettel.reference.split(', ') for zettel in library.values() if zettel.reference}
+		self.assertEqual(sorted(references), ['Again', 'Loam'])
+		self.assertEqual(references['Again'], references['Loam'][:1])
+		self.assertTrue(references['Loam'][0].endswith('.png') and references['Loam'][1].endswith('.txt'))
+		self.assertTrue(all(map(os.path.isfile, references['Loam'])))
+		self.assertEqual(len(Zettelkasten().import_notes_zk(file_path = file_path)), 4)
+		write_sample(self.folder.name, 'image.png', 'png')
+		markdown_path = write_sample(self.folder.name, 'image.md', 'See ![a](data:image/gif;base64,R0lGODlh) ![b](image.png) ![c](https://x.org/c.png)\n')
+		zettel = list(Zettelkasten().import_notes_zk(file_path = markdown_path, attachments = self.store_path).values())[1]
+		self.assertEqual(zettel.zettel, 'See ![b](image.png) ![c](https://x.org/c.png)')
+		self.assertEqual([os.path.splitext(path)[1] for path in zettel.reference.split(', ')], ['.gif', '.png'])
+		output_dir = os.path.join(self.folder.name, 'out')
+		self.assertEqual(main([file_path, '-f', 'csv', '-o', output_dir, '--attachments', self.store_path]), 0)
+		self.assertRaises(SystemExit, main, [file_path, '--pipeline', '--attachments', self.store_path])
+
+class TestZkn_Columnar(unittest.TestCase):
+	'''Unit test for columnar library, with and without NumPy'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+		self.zkn = Zettelkasten(seed = 44000)
+		self.library = self.zkn.import_txt_zk(file_path = write_sample(self.folder.name))
+		self.library['notakey'] = Zettel(title = 'Odd; "quoted"', zettel = 'Two\nlines')
+		self.numpy = columnar.numpy
+
+	def tearDown(self):
+		'''Run after every test'''
+		columnar.numpy = self.numpy
+		self.folder.cleanup()
+
+	def read(self, file_path):
+		with open(file_path, encoding = 'utf-8', newline = '') as my_file: return my_file.read()
+
+	def test_export(self):
+		'''Columns should export exactly as the library does, as csv, tsv or snapshot'''
+		columns = ColumnarLibrary.from_library(self.library)
+		keys = list(self.library)
+		self.assertEqual(columns.column('index'), keys)
+		base = os.path.join(self.folder.name, 'out')
+		expected = self.read(self.zkn.export_zk_csv(base, self.library))
+		self.assertEqual(self.read(columns.export_csv(base + '.csv')), expected)
+		self.assertEqual(self.read(Zettelkasten().export_zk_csv(base, ColumnarLibrary.from_library(self.library.items()))), expected)
+		with open(self.zkn.export_zk_tsv(base, columns), encoding = 'utf-8', newline = '') as my_file:
+			self.assertEqual(list(csv.reader(my_file, delimiter = '\t')), [list(row) for row in columns.rows()])
+		self.assertEqual(list(Zettelkasten().import_csv_zk(file_path = columns.export_csv(base + '_header.csv', ',', header = True))), keys)
+		snapshot_path = columns.save_snapshot(base + '.snapshot')
+		self.assertEqual(ColumnarLibrary.from_snapshot(snapshot_path).text_columns, columns.text_columns)
+		self.assertEqual(load_snapshot(snapshot_path), columns.to_library())
+		self.assertRaises(ValueError, ColumnarLibrary, columns.text_columns[1:])
+
+	def test_sort_between(self):
+		'''Sorting and date ranges should agree with and without NumPy'''
+		for module in {self.numpy, None}:
+			columnar.numpy = module
+			columns = ColumnarLibrary.from_library(self.library)
+			keys = columns.column('index')
+			self.assertEqual(list(columns.serial[:2]), [44000.00000002, 44000.00000003])
+			self.assertEqual(columns.sort(descending = True).column('index')[-1], 'notakey')
+			self.assertEqual(columns.sort().column('index'), sorted(keys[:-1], key = float) + ['notakey'])
+			self.assertEqual(columns.sort('title').column('title')[:2], ['', ''])
+			self.assertEqual(columns.between('44000.00000003', 44000.00000005).column('index'), ['44000.00000003', '44000.00000004'])
+			self.assertEqual(len(columns.between(date(2020, 6, 1))), len(columns) - 1)
+			self.assertEqual(len(columns.between(end = datetime(2020, 6, 1))), 0)
+			self.assertEqual(columns.take([3, 0]).column('title'), [columns.column('title')[3], columns.column('title')[0]])
+
+	def test_convert(self):
+		'''Command line should write tsv, and convert snapshots through columns'''
+		file_path = write_sample(self.folder.name)
+		self.assertEqual(main([file_path, '--snapshot', '-f', 'tsv']), 0)
+		snapshot_path = next(os.path.join(self.folder.name, name) for name in os.listdir(self.folder.name) if name.endswith('.snapshot'))
+		output_dir = os.path.join(self.folder.name, 'out')
+		self.assertEqual(main([snapshot_path, '-f', 'csv', '-o', output_dir]), 0)
+		csv_path = os.path.join(output_dir, os.listdir(output_dir)[0])
+		self.assertEqual(list(Zettelkasten().import_csv_zk(file_path = csv_path)), list(load_snapshot(snapshot_path)))
+
+class TestZkn_Service(unittest.TestCase):
+	'''Unit test for conversion service with warm workers'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		'''Run after every test'''
+		self.folder.cleanup()
+
+	def test_serve(self):
+		'''Each request should get one result by id, between ready and closed, bad requests failing alone'''
+		file_path = write_sample(self.folder.name)
+		output_dir = os.path.join(self.folder.name, 'out')
+		requests = [dict(id = number, file = file_path, formats = ['csv'], output_dir = output_dir) for number in range(6)]
+		requests += [dict(id = 'tsv', file = file_path, formats = ['tsv', 'snapshot'], output_dir = output_dir, compress = True)]
+		requests += [dict(id = 'missing', file = os.path.join(self.folder.name, 'missing.txt')), dict(id = 'pdf', file = file_path, formats = ['pdf'])]
+		lines = [json.dumps(request) for request in requests] + ['', 'not json']
+		output = StringIO()
+		self.assertEqual(serve(StringIO('\n'.join(lines)), output, workers = 2, pending = 1), 3)
+		replies = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual(replies[0], dict(event = 'ready', workers = 2))
+		self.assertEqual(replies[-1], dict(event = 'closed', converted = 7, failed = 3))
+		results = {reply['id']: reply for reply in replies[1:-1]}
+		self.assertEqual(sorted(results, key = str), [0, 1, 2, 3, 4, 5, None, 'missing', 'pdf', 'tsv'])
+		self.assertEqual({results[number]['zettels'] for number in range(6)}, {len(Zettelkasten().import_txt_zk(file_path = file_path))})
+		self.assertTrue(all(os.path.isfile(path) for result in results.values() for path in result.get('outputs', ())))
+		self.assertEqual([os.path.splitext(path)[1] for path in results['tsv']['outputs']], ['.gz', '.snapshot'])
+		self.assertIn('FileNotFoundError', results['missing']['error'])
+		self.assertIn('Unknown formats', results['pdf']['error'])
+		self.assertIn('JSONDecodeError', results[None]['error'])
+		self.assertRaises(SystemExit, main, [file_path, '--serve'])
+
+	def test_bad_requests(self):
+		'''Requests of the wrong types should each get an error, and later requests still convert'''
+		file_path = write_sample(self.folder.name)
+		bad = ['{"id": 1, "file": "x.txt", "formats": 5}', '{"id": 2, "file": "x.txt", "formats": [["csv"]]}',
+			'{"id": 3, "file": "x.txt", "output_dir": 5}', '{"id": 4, "file": ["x.txt"]}', '[1, 2]', '"text"']
+		good = json.dumps(dict(id = 'good', file = file_path, formats = ['csv'], output_dir = os.path.join(self.folder.name, 'out')))
+		output = StringIO()
+		self.assertEqual(serve(StringIO('\n'.join(bad + [good])), output, workers = 1), len(bad))
+		replies = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual([reply['id'] for reply in replies[1:-1]], [1, 2, 3, 4, None, None, 'good'])
+		self.assertTrue(all(reply['error'] for reply in replies[1:-2]))
+		self.assertEqual(replies[-2]['error'], '')
+		self.assertEqual(replies[-1], dict(event = 'closed', converted = 1, failed = len(bad)))
+
+class TestZkn_RoundTrip(unittest.TestCase):
+	'''Unit test for export and import round trips'''
+
+	def setUp(self):
+		'''Run before every subsequent test'''
+		self.folder = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		'''Run after every test'''
+		self.folder.cleanup()
+
+	def test_fuzz(self):
+		'''Random libraries should come back through every pair, with throughput of each direction'''
+		report = roundtrip.fuzz(runs = 8, size = 30)
+		self.assertEqual(report['failures'], [])
+		self.assertEqual(len(report['results']), 2 * len(roundtrip.PAIRS))
+		self.assertTrue(all(result['zettels'] == 240 and result['zettels_per_second'] > 0 for result in report['results'].values()))
+		self.assertEqual(compare_baseline(report, report), [])
+
+	def test_differences(self):
+		'''Changed, missing and reordered zettels should be reported'''
+		library = roundtrip.canonical_library(roundtrip.random_library(10, seed = 3))
+		changed = dict(library)
+		key = next(iter(changed))
+		changed[key] = Zettel(**dict(changed[key], keyword = 'changed'))
+		self.assertEqual(roundtrip.differences(library, changed), [f"{key} keyword: {library[key].keyword!r} came back as 'changed'"])
+		self.assertEqual(roundtrip.differences(library, dict(list(library.items())[1:])), [f"{key}: missing"])
+		self.assertEqual(roundtrip.differences(library, dict(reversed(library.items()))), ['order of zettels changed'])
+
+	def test_quirks(self):
+		'''Text the importers used to lose should be kept'''
+		text = ('[title] Before index [zettel] No marker\n\nSoil\n\n[index] 3 [title] Loam [zettel] Mix: sand: clay [keyword] ;'
+			'\n[index] 4 [title] [zettel] Tip: water [keyword] worms')
+		library = Zettelkasten().import_text_zk(text, '.txt')
+		self.assertEqual([(zettel.title, zettel.zettel, zettel.keyword) for zettel in library.values() if not zettel.zettel.startswith('Section header.')],
+			[('Before index', 'No marker', ''), ('Loam', 'Mix: sand: clay', ','), ('', 'Tip: water', 'worms')])
+		self.assertEqual(Zettelkasten().import_text_zk('[index] [zettel] Tip: water: daily', '.txt').popitem()[1].title, 'Tip')
+		library = Zettelkasten().import_text_zk('44077.1;;Index card;Title page;Keyword list;Parent plant\n', '.csv')
+		self.assertEqual(list(library), ['44077.1'])
+
+	def test_main(self):
+		'''Command line should save a baseline and compare against it'''
+		baseline = os.path.join(self.folder.name, 'roundtrip.json')
+		self.assertEqual(roundtrip.main(['--runs', '2', '--size', '10', '--save', baseline]), 0)
+		self.assertEqual(roundtrip.main(['--runs', '2', '--size', '10', '--pairs', 'csv', '--compare', baseline, '--threshold', '100']), 0)
+
 if __name__ == '__main__':
 	# zkn = Zettelkasten(diagnostics = False)
 	loader = unittest.TestLoader()
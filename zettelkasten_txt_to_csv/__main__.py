@@ -0,0 +1,104 @@
+'''
+Command line interface for Zettelkasten txt to csv converter
+
+Run from repository root:
+python -m zettelkasten_txt_to_csv notes.txt
+python -m zettelkasten_txt_to_csv data/ "archive/*.csv" --format csv --output-dir out --workers 4
+python -m zettelkasten_txt_to_csv notes.txt --snapshot
+python -m zettelkasten_txt_to_csv notes.txt --incremental --output-dir nightly
+python -m zettelkasten_txt_to_csv data/ --pipeline --snapshot
+python -m zettelkasten_txt_to_csv export.enex --attachments attachments
+python -m zettelkasten_txt_to_csv --serve --workers 2 < requests.jsonl
+python -m zettelkasten_txt_to_csv --pick
+
+Only argparse and the converter are imported on start up. tkinter is loaded only
+for --pick, so the command runs on servers without a display.
+'''
+
+import sys
+import argparse
+from contextlib import nullcontext
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, Instruments
+from zettelkasten_txt_to_csv.batch import convert_files, find_inputs
+
+FORMATS = dict(csv = ('csv',), txt = ('txt',), both = ('csv', 'txt'), tsv = ('tsv',))
+
+def parse_arguments(argv = None):
+	'''Read command line options'''
+	parser = argparse.ArgumentParser(prog = 'python -m zettelkasten_txt_to_csv',
+		description = 'Convert zettelkasten between txt and csv, writing each output with a timestamp appended to its name.')
+	parser.add_argument('inputs', nargs = '*', help = '.txt, .csv, .snapshot, Evernote .enex or .html, or Markdown .md files, directories or glob patterns')
+	parser.add_argument('-f', '--format', choices = FORMATS, default = 'both', help = 'output format (default: both)')
+	parser.add_argument('-o', '--output-dir', help = 'write outputs here instead of next to each input')
+	parser.add_argument('-j', '--workers', type = int, default = 1,
+		help = 'worker processes, across files for several inputs or across sections for one .txt; 0 for one per CPU')
+	parser.add_argument('-p', '--pipeline', action = 'store_true',
+		help = 'read, parse and write files at the same time, parsing each once for all formats; not with --stream, --memory-map, --report, --dedup or --attachments')
+	parser.add_argument('-s', '--stream', action = 'store_true', help = 'export .txt inputs section by section to save memory')
+	parser.add_argument('-m', '--memory-map', action = 'store_true', help = 'scan .txt inputs as mapped bytes instead of decoding them whole')
+	parser.add_argument('--snapshot', action = 'store_true', help = 'also write a binary .snapshot of each library, which reloads without parsing')
+	parser.add_argument('--dedup', choices = ('report', 'flag', 'merge'),
+		help = 'find zettels with the same or nearly the same content, and report them, flag them in keywords or merge them before export')
+	parser.add_argument('--attachments', metavar = 'FOLDER',
+		help = 'store images and other attachments of notes in this folder, once per content, and add their paths to the reference')
+	parser.add_argument('-i', '--incremental', action = 'store_true',
+		help = 'export only zettels of .txt inputs that are new or changed since the last --incremental run, keeping their keys; not with --stream, --memory-map or --pipeline')
+	parser.add_argument('-z', '--compress', action = 'store_true', help = 'gzip outputs')
+	parser.add_argument('--force', action = 'store_true', help = 'convert even if outputs are newer than the input')
+	parser.add_argument('--serve', action = 'store_true',
+		help = 'keep --workers warm and convert files named by JSON lines on stdin, writing results to stdout, see service.py')
+	parser.add_argument('--pick', action = 'store_true', help = 'choose input file with a dialog')
+	parser.add_argument('-d', '--diagnostics', action = 'store_true', help = 'print diagnostics information')
+	parser.add_argument('--report', help = 'write stage timers and counters of each file to this JSON file')
+	parser.add_argument('--profile', help = 'write cProfile stats of this process to this file, workers are not included')
+	arguments = parser.parse_args(argv)
+	if arguments.pipeline and (arguments.stream or arguments.memory_map or arguments.report or arguments.dedup or arguments.attachments):
+		parser.error('--pipeline cannot be combined with --stream, --memory-map, --report, --dedup or --attachments')
+	if arguments.serve and (arguments.inputs or arguments.pick or arguments.pipeline or arguments.profile):
+		parser.error('--serve reads files to convert from stdin, it takes no inputs, --pick, --pipeline or --profile')
+	if arguments.incremental and (arguments.stream or arguments.memory_map or arguments.pipeline):
+		parser.error('--incremental cannot be combined with --stream, --memory-map or --pipeline')
+	if arguments.stream and arguments.dedup: parser.error('--dedup needs the whole library, it cannot be combined with --stream')
+	if not (arguments.inputs or arguments.pick or arguments.serve): parser.error('no inputs, give files, directories or glob patterns, or --pick for a dialog')
+	return arguments
+
+def save_reports(file_path, results):
+	'''Write stage timers and counters of each converted file as JSON'''
+	import json
+	reports = {result['file']: result['report'] for result in results}
+	with open(file_path, 'w', encoding = 'utf-8') as my_file: json.dump(reports, my_file, indent = 1)
+	return file_path
+
+def main(argv = None):
+	'''Convert inputs given on the command line, returns exit status'''
+	arguments = parse_arguments(argv)
+	if arguments.serve:
+		from zettelkasten_txt_to_csv.service import serve # json and multiprocessing are only loaded when used
+		return 1 if serve(workers = None if arguments.workers == 0 else arguments.workers) else 0
+	inputs = arguments.inputs
+	if arguments.pick: inputs = [Zettelkasten().find_file()]
+
+	files = list(dict.fromkeys(file_path for path in inputs if path for file_path in find_inputs(path)))
+	if not files:
+		print('Error: No .txt, .csv, .snapshot or notes input found')
+		return 2
+
+	# one file gets its sections parsed in parallel, several files get one process each
+	workers = None if arguments.workers == 0 else arguments.workers
+	section_workers, workers = (workers, 1) if len(files) == 1 else (1, workers)
+	formats = FORMATS[arguments.format] + (('snapshot',) if arguments.snapshot else ())
+	with Instruments().profile(arguments.profile) if arguments.profile else nullcontext():
+		if arguments.pipeline:
+			from zettelkasten_txt_to_csv.pipeline import convert_pipeline # asyncio is only loaded when used
+			results = convert_pipeline(files, formats, arguments.output_dir, None if arguments.workers == 0 else arguments.workers,
+				arguments.force, compress = arguments.compress)
+		else:
+			results = convert_files(files, formats, arguments.output_dir, workers, arguments.force,
+				compress = arguments.compress, stream = arguments.stream, section_workers = section_workers, memory_map = arguments.memory_map,
+				diagnostics = arguments.diagnostics, report = bool(arguments.report), dedup = arguments.dedup,
+				attachments = arguments.attachments, incremental = arguments.incremental)
+	if arguments.report: save_reports(arguments.report, results)
+	return 1 if any(result['error'] for result in results) else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,112 @@
+'''
+Attachment store for Zettelkasten txt to csv converter
+
+Images and other files of notes, base64 resources of an Evernote export or
+data: and local images of html and Markdown, are written once per content
+into a content addressed folder:
+
+attachments/ab/ab12...ef.png      sha256 of the contents, under its first two digits
+
+The same image in many notes is stored once, and contents already in the
+store from an earlier run, under any ending, are not written again. Decoding, hashing and writing run on
+a pool of threads, a bounded number of attachments ahead of the importer, each
+giving a future of the stored path for the zettel's reference field.
+
+with AttachmentStore('attachments') as store:
+	future = store.add(base64_text, 'image/png')
+'''
+
+import os
+import hashlib
+import binascii
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try: from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import thread_count # imported as part of the package
+except ImportError: from zettelkasten_txt_to_csv import thread_count # run as script from this folder
+
+PENDING = 4 # attachments queued per thread, the importer waits beyond this
+
+def read_bytes(path):
+	with open(path, 'rb') as my_file: return my_file.read()
+
+def file_ending(mime = '', file_name = ''):
+	'''Ending of the stored file, from the original name or else the mime type'''
+	ending = os.path.splitext(file_name)[1]
+	if not ending and mime: ending = mimetypes.guess_extension(mime.split(';')[0].strip()) or ''
+	return ending.lower()
+
+class AttachmentStore:
+	'''Content addressed folder of attachments written by a pool of threads, see module docstring
+	Close, or use as a context manager, to wait for every write'''
+
+	def __init__(self, folder, threads = None):
+		'''folder: root of the store, created when the first attachment is written
+		threads: decoding and writing, None for the ThreadPoolExecutor default'''
+		self.folder = folder
+		threads = thread_count(threads)
+		self.executor = ThreadPoolExecutor(threads)
+		self.slots = threading.BoundedSemaphore(PENDING * threads)
+		self.lock = threading.Lock()
+		self.paths = {} # digest -> stored path, for attachments met in this run
+		self.written, self.skipped = 0, 0
+
+	def add(self, data, mime = '', file_name = ''):
+		'''Future of the stored path of base64 text data'''
+		return self.submit(binascii.a2b_base64, data, file_ending(mime, file_name))
+
+	def add_file(self, path):
+		'''Future of the stored path of a copy of the file at path'''
+		return self.submit(read_bytes, path, file_ending(file_name = path))
+
+	def submit(self, load, source, ending):
+		self.slots.acquire() # wait for the pool rather than queue every attachment of a notebook
+		try: future = self.executor.submit(self.store, load, source, ending)
+		except BaseException:
+			self.slots.release()
+			raise
+		future.add_done_callback(lambda _: self.slots.release())
+		return future
+
+	def store(self, load, source, ending):
+		'''Write contents of load(source) unless already stored, returns its path'''
+		contents = load(source)
+		digest = hashlib.sha256(contents).hexdigest()
+		with self.lock:
+			path = self.paths.get(digest)
+			if path is not None:
+				self.skipped += 1
+				return path
+			path = self.paths[digest] = os.path.join(self.folder, digest[:2], digest + ending)
+		stored_path = path if os.path.exists(path) else self.stored_path(digest)
+		if stored_path:
+			with self.lock:
+				self.skipped += 1
+				self.paths[digest] = stored_path
+			return stored_path
+
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp" # batch workers may share the store
+		try:
+			with open(temporary_path, 'wb') as my_file: my_file.write(contents)
+			os.replace(temporary_path, path)
+		finally:
+			if os.path.exists(temporary_path): os.remove(temporary_path)
+		with self.lock: self.written += 1
+		return path
+
+	def stored_path(self, digest):
+		'''Path of contents with this digest stored by an earlier run under another ending, or None'''
+		folder = os.path.join(self.folder, digest[:2])
+		try: names = os.listdir(folder)
+		except FileNotFoundError: return None
+		return next((os.path.join(folder, name) for name in names if name.startswith(digest) and not name.endswith('.tmp')), None)
+
+	def close(self):
+		self.executor.shutdown(wait = True)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
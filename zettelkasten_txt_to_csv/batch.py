@@ -0,0 +1,159 @@
+'''
+Batch conversion for Zettelkasten txt to csv converter
+
+Convert every .txt, .csv and notes file in a directory (or matching a glob) with a
+pool of worker processes, each with its own Zettelkasten. Files whose outputs
+are newer than the input are skipped, and a failing file is reported without
+stopping the rest of the batch.
+
+Run from repository root:
+python -m zettelkasten_txt_to_csv <directory or glob>
+'''
+
+import os
+import re
+import glob
+import time
+import itertools
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, UidAllocator, Instruments, NOTE_ENDINGS
+
+INPUT_ENDINGS = ('.txt', '.csv', '.snapshot') + NOTE_ENDINGS
+OUTPUT_PATTERN = re.compile(r'_(\d+\.\d{8}|manifest)$') # name + timestamp, written by exports
+
+def find_inputs(path):
+	'''Sorted .txt, .csv and notes files in directory or matching glob, leaving out earlier outputs
+	A file named directly is always kept, so exported csv or snapshots can be read back'''
+	if os.path.isfile(path): return [path] if path.lower().endswith(INPUT_ENDINGS) else []
+	pattern = os.path.join(glob.escape(path), '*') if os.path.isdir(path) else path
+	return sorted(file_path for file_path in glob.glob(pattern)
+		if os.path.isfile(file_path) and file_path.lower().endswith(INPUT_ENDINGS)
+		and not OUTPUT_PATTERN.search(os.path.splitext(file_path)[0]))
+
+def output_base(file_path, output_dir = None):
+	'''Input path without ending, moved into output_dir if given'''
+	base = os.path.splitext(file_path)[0]
+	return os.path.join(output_dir, os.path.basename(base)) if output_dir else base
+
+def is_up_to_date(file_path, formats, output_dir = None):
+	'''True if every format has an output at least as new as the input'''
+	base = output_base(file_path, output_dir)
+	input_time = os.path.getmtime(file_path)
+	for ending in formats:
+		outputs = [output for output in glob.glob(f"{glob.escape(base)}_*.{ending}*")
+			if re.fullmatch(rf"_\d+\.\d{{8}}\.{ending}(\.gz)?", output[len(base):])]
+		if not outputs or max(map(os.path.getmtime, outputs)) < input_time: return False
+	return True
+
+def convert_file(file_path, formats = ('csv', 'txt'), output_dir = None, compress = False,
+		stream = False, section_workers = 1, diagnostics = False, report = False, memory_map = False, dedup = None, attachments = None,
+		incremental = False):
+	'''Import one file and write each format, returns summary dictionary
+	stream: export .txt section by section instead of holding the whole library
+	section_workers: processes parsing sections of a .txt file, None for one per CPU
+	report: add stage timers and counters from Instruments to the summary
+	memory_map: scan .txt as mapped bytes, see Zettelkasten.map_sections
+	dedup: 'report', 'flag' or 'merge' duplicate zettels before export, see dedup.py.
+	Groups found are written alongside the outputs as JSON, not with stream
+	attachments: folder to store attachments of notes in, see attachments.py
+	incremental: export only new or changed zettels of a .txt and their index cards, keeping
+	keys between runs in a manifest saved beside the outputs once they are written
+	Errors are caught and returned, so one bad file does not stop a batch'''
+	start = time.perf_counter()
+	result = dict(file = file_path, zettels = 0, outputs = [], error = '')
+	instruments = Instruments() if report or diagnostics else None
+	try:
+		base = output_base(file_path, output_dir)
+		if stream and file_path.lower().endswith('.txt'):
+			result['zettels'], result['outputs'] = stream_file(file_path, base, formats, compress, instruments, memory_map)
+		else:
+			zkn = Zettelkasten(diagnostics = diagnostics, instruments = instruments)
+			if incremental and file_path.lower().endswith('.txt'):
+				zkn.library = zkn.import_txt_incremental(file_path = file_path, manifest_path = f"{base}_manifest.json")
+			elif file_path.lower().endswith('.txt'): zkn.library = zkn.import_txt_zk(file_path = file_path, workers = section_workers, memory_map = memory_map)
+			elif file_path.lower().endswith(NOTE_ENDINGS): zkn.library = zkn.import_notes_zk(file_path = file_path, attachments = attachments)
+			elif file_path.lower().endswith('.snapshot') and not dedup:
+				from zettelkasten_txt_to_csv.columnar import ColumnarLibrary # read into columns, making no zettels
+				zkn.library = ColumnarLibrary.from_snapshot(file_path)
+				zkn.master_key = zkn.timestamp()
+			else:
+				import_zk = zkn.import_snapshot_zk if file_path.lower().endswith('.snapshot') else zkn.import_csv_zk
+				zkn.library = import_zk(file_path = file_path)
+				zkn.master_key = zkn.timestamp()
+			if dedup: result['duplicates'] = deduplicate(zkn, base, dedup, result['outputs'])
+			for ending in formats:
+				export = getattr(zkn, f"export_zk_{ending}")
+				result['outputs'].append(export(base, zkn.library, compress = compress))
+			if zkn.manifest is not None: zkn.save_manifest() # only once every output is written
+			result['zettels'] = len(zkn.library)
+	except Exception as error:
+		result['error'] = f"{type(error).__name__}: {error}"
+	result['seconds'] = time.perf_counter() - start
+	if report: result['report'] = instruments.report()
+	return result
+
+def deduplicate(zkn, base, action, outputs):
+	'''Apply duplicate action to zkn.library, adding the JSON report of any groups to outputs
+	Returns number of duplicate zettels'''
+	from zettelkasten_txt_to_csv.dedup import DuplicateFinder, save_report
+	groups = DuplicateFinder(zkn = zkn).apply(zkn.library, action)
+	if groups: outputs.append(save_report(zkn.output_path(base, 'duplicates.json'), groups))
+	return sum(len(group['duplicates']) for group in groups)
+
+def stream_file(file_path, base, formats, compress = False, instruments = None, memory_map = False):
+	'''Export txt file with iter_txt_zk, reading it once per format
+	Every pass is seeded with the same time, so keys match between formats'''
+	seed = UidAllocator.format_key(UidAllocator().clock())
+	outputs = []
+	for ending in formats:
+		zkn = Zettelkasten(diagnostics = False, seed = seed, instruments = instruments)
+		counter = itertools.count()
+		pairs = (pair for pair, _ in zip(zkn.iter_txt_zk(file_path, memory_map = memory_map), counter)) # counter stops with the stream
+		outputs.append(getattr(zkn, f"export_zk_{ending}")(base, pairs, compress = compress))
+	return next(counter), outputs
+
+def convert_batch(path, formats = ('csv', 'txt'), output_dir = None, workers = None, force = False, **options):
+	'''Convert all inputs in directory or matching glob, see convert_files'''
+	return convert_files(find_inputs(path), formats, output_dir, workers, force, **options)
+
+def convert_files(inputs, formats = ('csv', 'txt'), output_dir = None, workers = None, force = False, **options):
+	'''Convert each input file, printing progress and throughput
+	workers: number of processes, None for one per CPU, 1 to convert in this process
+	force: convert even if outputs are up to date
+	options: passed on to convert_file'''
+	start = time.perf_counter()
+	pending = pending_inputs(inputs, formats, output_dir, force)
+
+	results = []
+	if workers == 1 or len(pending) < 2:
+		converted = (convert_file(file_path, formats, output_dir, **options) for file_path in pending)
+		results = [report_file(result, number, len(pending)) for number, result in enumerate(converted, 1)]
+	else:
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(workers) as executor:
+			futures = [executor.submit(convert_file, file_path, formats, output_dir, **options) for file_path in pending]
+			results = [report_file(future.result(), number, len(pending)) for number, future in enumerate(futures, 1)]
+	return report_batch(results, start)
+
+def pending_inputs(inputs, formats, output_dir = None, force = False):
+	'''Inputs to convert, leaving out those with up to date outputs unless force'''
+	if output_dir: os.makedirs(output_dir, exist_ok = True)
+	pending = [file_path for file_path in inputs if force or not is_up_to_date(file_path, formats, output_dir)]
+	print(f"Input files: {len(inputs)}, up to date: {len(inputs) - len(pending)}")
+	return pending
+
+def report_batch(results, start):
+	'''Print files converted and throughput since start, returns results'''
+	seconds = max(time.perf_counter() - start, 1e-9)
+	converted = [result for result in results if not result['error']]
+	zettels = sum(result['zettels'] for result in converted)
+	print(f"Converted {len(converted)} files, {len(results) - len(converted)} failed, in {seconds:.2f} s: "
+		f"{len(converted) / seconds:.1f} files/s, {zettels / seconds:,.0f} zettels/s")
+	return results
+
+def report_file(result, number, total):
+	'''Print progress line for one converted file'''
+	if result['error']: print(f"[{number}/{total}] Error: {result['file']}: {result['error']}")
+	else:
+		duplicates = f", {result['duplicates']} duplicates" if result.get('duplicates') else ''
+		print(f"[{number}/{total}] {result['file']}: {result['zettels']} zettels{duplicates} in {result['seconds']:.2f} s")
+	return result
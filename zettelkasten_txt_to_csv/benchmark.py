@@ -0,0 +1,445 @@
+'''
+Benchmarks for Zettelkasten txt to csv converter
+
+Benchmark suite: run_suite times each stage of the converter on synthetic
+files from 1k to 1M zettels, recording wall time, peak RSS and zettels/s,
+and compare_baseline flags regressions against a saved JSON baseline.
+The search_query stage times SEARCH_QUERIES on a SearchIndex of the library,
+so its seconds divided by their number is the time of one query.
+
+Comparisons: times the single pass tokenizer in import_txt_zk and the direct csv loader
+in import_csv_zk against the original regex paths (kept here as
+LegacyZettelkasten) on synthetic files, the buffered exporters against
+the original row by row writers, memory of Zettel records against
+the dictionaries they replace, and cold start import time of the command line.
+
+Run from repository root:
+python -m zettelkasten_txt_to_csv.benchmark
+python -m zettelkasten_txt_to_csv.benchmark --sizes 1000 100000 --save baseline.json
+python -m zettelkasten_txt_to_csv.benchmark --sizes 1000 100000 --compare baseline.json --threshold 0.2
+'''
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import compileall
+import subprocess
+import random
+import tempfile
+import tracemalloc
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, Zettel
+
+IMPORT_BUDGET = 0.025 # seconds to import the command line, interpreter start up not included
+SLOW_IMPORTS = ('tkinter', 'multiprocessing', 'concurrent.futures.process', 'hashlib', 'json', 'gzip', 'numpy')
+SUITE_SIZES = (1000, 10000, 100000) # zettels, add 1000000 for the full range
+SUITE_STAGES = ('import_txt_zk', 'import_txt_mmap', 'import_csv_zk', 'separate_into_dictionary', 'clean_text',
+	'generate_index_text', 'export_zk_csv', 'export_zk_txt', 'search_query')
+BASELINE_VERSION = 1 # layout of saved suite results
+REGRESSION_THRESHOLD = 0.2 # fraction slower, or more memory, flagged as a regression
+WORDS = ('plant', 'soil', 'water', 'light', 'compost', 'seed', 'root', 'leaf', 'mulch', 'frost',
+	'prune', 'graft', 'bloom', 'shade', 'drain', 'clay', 'loam', 'worm', 'spring', 'harvest')
+SEARCH_QUERIES = ('soil', 'plant water', 'frost bloom shade', 'comp*', 'gr*', 's*', 'keyword:mulch',
+	'keyword:root leaf', 'harvest', 'prune graft') # terms, prefixes and fields, timed together in the search_query stage
+
+def synthetic_txt(sections = 100, zettels = 100, words = 30, seed = 0):
+	'''Evernote style zettelkasten text with subtitles and [field] markers'''
+	return ''.join(synthetic_txt_parts(sections, zettels, words, seed))
+
+def synthetic_txt_parts(sections = 100, zettels = 100, words = 30, seed = 0):
+	'''Generator behind synthetic_txt, so large files can be written piece by piece'''
+	rng = random.Random(seed)
+	sentence = lambda count: ' '.join(rng.choice(WORDS) for _ in range(count))
+	for section in range(sections):
+		yield f"\n\n{sentence(2).title()} {section}\n\n"
+		for number in range(zettels):
+			yield (f"[index] {number % 7 or ''} [title] {sentence(3)}\n"
+				f"[zettel] {sentence(words)}; {sentence(words // 2)}.\n"
+				f"[reference] {sentence(2)} {1900 + number} [keyword] {rng.choice(WORDS)}\n")
+
+def write_synthetic_txt(file_path, sections = 100, zettels = 100, words = 30, seed = 0):
+	'''Write synthetic_txt to file_path'''
+	with open(file_path, 'w', encoding = 'utf-8') as my_file:
+		my_file.writelines(synthetic_txt_parts(sections, zettels, words, seed))
+	return file_path
+
+def synthetic_csv(file_path, rows = 10000, words = 30, delimiter = ',', seed = 0):
+	'''Csv zettelkasten with header row, as exported from Googlesheets'''
+	rng = random.Random(seed)
+	sentence = lambda count: ' '.join(rng.choice(WORDS) for _ in range(count))
+	with open(file_path, 'w', encoding = 'utf-8', newline = '') as my_file:
+		csv_writer = csv.writer(my_file, delimiter = delimiter)
+		csv_writer.writerow(['Index', 'Parent', 'Title', 'Zettel', 'Reference', 'Keyword'])
+		for number in range(rows):
+			csv_writer.writerow([f"{44077 + number / 1e5:.5f}", '44077.00000', sentence(3), sentence(words),
+				f"{sentence(2)} {1900 + number % 100}", rng.choice(WORDS)])
+	return file_path
+
+class LegacyZettelkasten(Zettelkasten):
+	'''Original regex paths of import_txt_zk and import_csv_zk, for comparison'''
+
+	def import_csv_zk(self, library = None, file_path = None):
+		'''Rebuild each row as [field] text and parse it with separate_into_dictionary'''
+		if library == None: library = dict()
+		if file_path == None: file_path = self.file_path
+		with open(file_path, 'r', encoding = 'utf-8') as my_file:
+			contents = csv.DictReader(my_file, delimiter=',')
+			for row in contents:
+				text = ' '.join([f"[{field_name.lower()}] {contents}" for field_name, contents in row.items()])
+				library = self.separate_into_dictionary(text, library, parent = '', field_type = 'zettel')
+		return library
+
+	def import_txt_zk(self, library = None, file_path = None):
+		'''Read txt file, split sections, then re-scan each section for fields'''
+		if library == None: library = dict()
+		if file_path == None: file_path = self.file_path
+		with open(file_path, 'r', encoding = 'utf-8') as my_file:
+			contents = my_file.read()
+
+		self.master_key = self.timestamp()
+		section_library = self.separate_into_dictionary(contents, {}, parent = self.master_key, field_type = 'section')
+		for key, sub_section in section_library.items():
+			zettel_library = self.separate_into_dictionary(sub_section['zettel'], {}, parent = key, field_type = 'zettel')
+			library.update({key: sub_section})
+			library[key]['zettel'] = self.generate_index_text(zettel_library)
+			library.update(zettel_library)
+		return library
+
+	def separate_into_dictionary(self, text, library = {}, parent = '', field_type = ''):
+		'''Extract subsections from text into dictionary using regex'''
+		if 'section' in field_type:
+			pattern = r'\n{2,3}[\w ]{1,100}\n{2,3}'
+			section_key = self.timestamp()
+		elif 'zettel' in field_type: pattern = r'\[\w{1,10}\]'
+		else: print('Field type error'); return library
+		key, end_index, field_name, field_contents = 0, 0, '', ''
+
+		for result in re.finditer(pattern, text):
+			if not end_index and 'section' in field_type:
+				start_index, end_index = 0, 0
+				field_name = ''
+			elif not end_index and 'zettel' in field_type:
+				field_name = result.group()
+				start_index, end_index = result.span()
+				continue
+
+			next_start_index = result.start()
+			field_contents = self.clean_text(text[end_index: next_start_index], False)
+			start_index, end_index = result.span()
+			if 'section' in field_type:
+				key, library = self.store_subsections(library, section_key, field_name, field_contents)
+			elif 'zettel' in field_type:
+				key, library = self.store_fields(library, key, parent, field_name, field_contents)
+			field_name = self.clean_text(result.group(), False)
+
+		field_contents = self.clean_text(text[end_index:-1], False)
+		if 'section' in field_type:
+			key, library = self.store_subsections(library, section_key, field_name, field_contents)
+		elif 'zettel' in field_type:
+			key, library = self.store_fields(library, key, parent, field_name, field_contents)
+		return {k: v for k, v in library.items() if v['zettel']}
+
+	def store_fields(self, library = {}, key = 0, parent = 0, field_name = '', field_contents = ''):
+		'''Chain of substring checks on each field name'''
+		field_name = field_name.lower()
+		if 'title' in field_name:
+			library[key]['title'] = self.clean_text(field_contents, True)
+		elif 'zettel' in field_name and ':' not in field_contents:
+			library[key]['zettel'] = self.clean_text(field_contents, True)
+		elif 'zettel' in field_name and ':' in field_contents and not library[key]['title']:
+			split_contents = re.split('[:]', field_contents)
+			library[key]['title'] = self.clean_text(split_contents[0], True)
+			library[key]['zettel'] = self.clean_text(split_contents[1], True)
+		elif 'reference' in field_name:
+			library[key]['reference'] = field_contents
+		elif 'keyword' in field_name:
+			library[key]['keyword'] = field_contents
+		elif 'parent' in field_name:
+			library[key]['parent'] = field_contents
+		elif 'index' in field_name:
+			key = self.timestamp() if len(field_contents) < 3 else field_contents
+			if key in library.keys(): print('Error: Duplicate key when assigning index')
+			else: library[key] = dict(parent = parent, title = '', zettel = '', reference = '', keyword = '')
+		else: print('Error: Field not identified')
+		return key, library
+
+	def export_zk_csv(self, file_path, library):
+		'''Write one row at a time'''
+		csv_output = open(file_path + '_' + str(self.master_key) + '.csv','w', newline='')
+		csv_writer = csv.writer(csv_output , delimiter=';')
+		for key, dictionary in library.items():
+			csv_writer.writerow([key, dictionary['parent'], dictionary['title'], dictionary['zettel'],
+				dictionary['reference'], dictionary['keyword']])
+		csv_output.close()
+		return True
+
+	def export_zk_txt(self, file_path, library):
+		'''Write one f-string at a time'''
+		txt_output = open(file_path + '_' + str(self.master_key) + '.txt','w', newline='')
+		for key, dictionary in library.items():
+			txt_output.write(f"[index] {key} [parent] {dictionary['parent']} [title] {dictionary['title']}\
+				\n[zettel] {dictionary['zettel']} \n[reference] {dictionary['reference']} \n[keyword] {dictionary['keyword']}\n\n")
+		txt_output.close()
+
+	def generate_index_text(self, zettel_library):
+		'''Index card text from dictionary zettels'''
+		index_contents = 'Section header. '
+		for key, value in zettel_library.items():
+			index_contents += f"{key}{', ' + value['title'] if value['title'] else ''}. "
+		return index_contents
+
+	def clean_text(self, text, capitals = False):
+		'''Translation table rebuilt on every call'''
+		text = " ".join(text.split())
+		if len(text) > 1:
+			text = text.translate(str.maketrans(';', ','))
+			return text[0].upper() + text[1:] if capitals else text
+		else: return text
+
+def best_time(function, repeat = 3):
+	'''Best wall time of several runs, and the last result'''
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = function()
+		times.append(time.perf_counter() - start)
+	return min(times), result
+
+def compare_tokenizer(sections = 200, zettels = 250, repeat = 3):
+	'''Time legacy and single pass import_txt_zk on the same synthetic file'''
+	with tempfile.TemporaryDirectory() as folder:
+		file_path = os.path.join(folder, 'synthetic.txt')
+		with open(file_path, 'w', encoding = 'utf-8') as my_file:
+			my_file.write(synthetic_txt(sections, zettels))
+		size = os.path.getsize(file_path)
+
+		legacy_time, legacy = best_time(lambda: LegacyZettelkasten(seed = 44077).import_txt_zk(file_path = file_path), repeat)
+		new_time, new = best_time(lambda: Zettelkasten(seed = 44077).import_txt_zk(file_path = file_path), repeat)
+
+	print(f"Synthetic file: {sections} sections x {zettels} zettels, {size / 1e6:.1f} MB")
+	print(f"Legacy regex path: {legacy_time:.3f} s ({len(legacy) / legacy_time:,.0f} zettels/s)")
+	print(f"Single pass lexer: {new_time:.3f} s ({len(new) / new_time:,.0f} zettels/s)")
+	print(f"Speedup: {legacy_time / new_time:.2f}x, same zettel count: {len(legacy) == len(new)}")
+	return legacy_time, new_time
+
+def compare_csv_import(rows = 5000, repeat = 3):
+	'''Time legacy and direct import_csv_zk on the same synthetic file'''
+	with tempfile.TemporaryDirectory() as folder:
+		file_path = synthetic_csv(os.path.join(folder, 'synthetic.csv'), rows)
+		legacy_time, legacy = best_time(lambda: LegacyZettelkasten(seed = 44077).import_csv_zk(file_path = file_path), repeat)
+		new_time, new = best_time(lambda: Zettelkasten(seed = 44077).import_csv_zk(file_path = file_path), repeat)
+
+	print(f"Synthetic csv: {rows:,} rows")
+	print(f"Legacy row to text path: {legacy_time:.3f} s ({len(legacy) / legacy_time:,.0f} zettels/s)")
+	print(f"Direct column loader: {new_time:.3f} s ({len(new) / new_time:,.0f} zettels/s)")
+	print(f"Speedup: {legacy_time / new_time:.2f}x, same zettel count: {len(legacy) == len(new)}")
+	return legacy_time, new_time
+
+def compare_export(count = 200000, repeat = 3):
+	'''Time legacy and buffered exporters writing the same library'''
+	library = {f"{44077 + number / 1e5:.5f}": Zettel('44077.00000', f"Title {number}", ' '.join(WORDS),
+		'Reference 1900', 'keyword') for number in range(count)}
+	with tempfile.TemporaryDirectory() as folder:
+		file_path = os.path.join(folder, 'export')
+		for ending in ('csv', 'txt'):
+			legacy, new = LegacyZettelkasten(), Zettelkasten()
+			legacy.master_key, new.master_key = 'legacy', 'new'
+			legacy_time = best_time(lambda: getattr(legacy, f"export_zk_{ending}")(file_path, library), repeat)[0]
+			new_time = best_time(lambda: getattr(new, f"export_zk_{ending}")(file_path, library), repeat)[0]
+			gzip_time = best_time(lambda: getattr(new, f"export_zk_{ending}")(file_path, library, compress = True), repeat)[0]
+			print(f"Export {ending}, {count:,} zettels: legacy {legacy_time:.3f} s, buffered {new_time:.3f} s "
+				f"({legacy_time / new_time:.2f}x, {count / new_time:,.0f} zettels/s), gzip {gzip_time:.3f} s")
+
+def traced_size(build):
+	'''Bytes allocated by build() and still held by its result'''
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	result = build()
+	size = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	del result
+	return size
+
+def compare_memory(count = 100000):
+	'''Memory of a library of dictionaries against the same library of Zettel records
+	Field strings are shared between both, so only the per-zettel overhead is measured'''
+	rows = [(str(44077 + number / 1e5), 'Parent', f"Title {number}", 'Zettel text', 'Reference', 'keyword')
+		for number in range(count)]
+	dictionary_size = traced_size(lambda: {key: dict(parent = parent, title = title, zettel = zettel,
+		reference = reference, keyword = keyword) for key, parent, title, zettel, reference, keyword in rows})
+	zettel_size = traced_size(lambda: {key: Zettel(parent, title, zettel, reference, keyword)
+		for key, parent, title, zettel, reference, keyword in rows})
+
+	print(f"{count:,} zettels as dictionaries: {dictionary_size / 1e6:.1f} MB")
+	print(f"{count:,} zettels as Zettel records: {zettel_size / 1e6:.1f} MB")
+	print(f"Saving: {1 - zettel_size / dictionary_size:.0%}")
+	return dictionary_size, zettel_size
+
+def import_time(module = 'zettelkasten_txt_to_csv.__main__', repeat = 3):
+	'''Best cumulative time to import module in a fresh interpreter, read from -X importtime,
+	and the modules it left loaded. Bytecode is compiled first, so only a cold start is measured'''
+	root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	compileall.compile_dir(os.path.join(root, 'zettelkasten_txt_to_csv'), quiet = 1)
+	package = module.split('.')[0]
+	command = [sys.executable, '-X', 'importtime', '-c', f"import sys, {module}; print(' '.join(sys.modules))"]
+	best = None
+	for _ in range(repeat):
+		process = subprocess.run(command, cwd = root, capture_output = True, text = True, check = True)
+		# top level lines only, their cumulative column already includes everything they import
+		seconds = sum(int(cumulative) / 1e6 for cumulative, name
+			in re.findall(r'^import time:\s*\d+ \|\s*(\d+) \| (\S+)$', process.stderr, re.MULTILINE)
+			if name.split('.')[0] == package)
+		best = seconds if best is None else min(best, seconds)
+	return best, set(process.stdout.split())
+
+def check_import_time(module = 'zettelkasten_txt_to_csv.__main__', budget = IMPORT_BUDGET):
+	'''Compare import time with budget and make sure slow optional modules stay unloaded'''
+	seconds, modules = import_time(module)
+	slow = [name for name in SLOW_IMPORTS if name in modules]
+	print(f"Import {module}: {seconds * 1000:.1f} ms, budget {budget * 1000:.0f} ms")
+	if slow: print(f"Error: Loaded on import: {', '.join(slow)}")
+	return seconds <= budget and not slow
+
+def peak_rss():
+	'''Peak resident set size of this process in MB, None where resource is missing (Windows)'''
+	try: import resource
+	except ImportError: return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3 # bytes on macOS, kB elsewhere
+
+def separate_library(zkn, contents):
+	'''Sections then zettels with separate_into_dictionary, as the original import_txt_zk did'''
+	library = {}
+	sections = zkn.separate_into_dictionary(contents, {}, parent = '', field_type = 'section')
+	for key, section in sections.items():
+		library[key] = section
+		library.update(zkn.separate_into_dictionary(section['zettel'], {}, parent = key, field_type = 'zettel'))
+	return library
+
+def prepare_stage(stage, txt_path, csv_path):
+	'''Inputs of one suite stage, returns function to time and zettel count (None to count its result)'''
+	zkn = Zettelkasten(seed = 44077)
+	if stage == 'import_txt_zk': return lambda: Zettelkasten(seed = 44077).import_txt_zk(file_path = txt_path), None
+	if stage == 'import_txt_mmap': return lambda: Zettelkasten(seed = 44077).import_txt_zk(file_path = txt_path, memory_map = True), None
+	if stage == 'import_csv_zk': return lambda: Zettelkasten(seed = 44077).import_csv_zk(file_path = csv_path), None
+	if stage == 'separate_into_dictionary':
+		with open(txt_path, 'r', encoding = 'utf-8') as my_file: contents = my_file.read()
+		return lambda: separate_library(Zettelkasten(seed = 44077), contents), None
+
+	library = zkn.import_txt_zk(file_path = txt_path)
+	if stage == 'clean_text':
+		texts = [text for zettel in library.values() for text in (zettel.title, zettel.zettel, zettel.reference, zettel.keyword)]
+		return lambda: [zkn.clean_text(text) for text in texts], len(library)
+	if stage == 'generate_index_text':
+		sections = defaultdict(dict)
+		for key, zettel in library.items(): sections[zettel.parent][key] = zettel
+		return lambda: [zkn.generate_index_text(section) for section in sections.values()], len(library)
+	if stage == 'search_query':
+		from zettelkasten_txt_to_csv.search import SearchIndex
+		index = SearchIndex()
+		index.update(library)
+		return lambda: [index.query(text) for text in SEARCH_QUERIES], len(library)
+	if stage in ('export_zk_csv', 'export_zk_txt'):
+		export, file_path = getattr(zkn, stage), os.path.join(os.path.dirname(txt_path), 'export')
+		return lambda: export(file_path, library), len(library)
+	raise ValueError(f"Unknown benchmark stage: {stage}")
+
+def measure_stage(stage, txt_path, csv_path, repeat = 3):
+	'''Best wall time, zettels/s and peak RSS of one stage'''
+	function, zettels = prepare_stage(stage, txt_path, csv_path)
+	seconds, result = best_time(function, repeat)
+	if zettels is None: zettels = len(result)
+	return dict(seconds = seconds, zettels = zettels, zettels_per_second = zettels / seconds, peak_rss_mb = peak_rss())
+
+def run_suite(sizes = SUITE_SIZES, stages = SUITE_STAGES, per_section = 100, words = 30, repeat = 3, isolate = True):
+	'''Time each stage on synthetic files of each size, returns report for save_baseline
+	per_section: zettels per section, words: length of zettel text
+	isolate: measure each stage in a fresh process, so peak RSS belongs to that stage and its inputs'''
+	results = {}
+	context = multiprocessing.get_context('spawn')
+	with tempfile.TemporaryDirectory() as folder:
+		for size in sizes:
+			txt_path = write_synthetic_txt(os.path.join(folder, 'synthetic.txt'), max(1, size // per_section), min(size, per_section), words)
+			csv_path = synthetic_csv(os.path.join(folder, 'synthetic.csv'), size, words)
+			for stage in stages:
+				if isolate:
+					with ProcessPoolExecutor(1, mp_context = context) as executor:
+						result = executor.submit(measure_stage, stage, txt_path, csv_path, repeat).result()
+				else: result = measure_stage(stage, txt_path, csv_path, repeat)
+				results[f"{stage}/{size}"] = result
+				rss = 'n/a' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:,.0f} MB"
+				print(f"{stage:>25} {size:>9,}: {result['seconds']:8.3f} s {result['zettels_per_second']:>12,.0f} zettels/s, peak RSS {rss}")
+	return dict(version = BASELINE_VERSION, python = platform.python_version(), platform = platform.platform(),
+		per_section = per_section, words = words, results = results)
+
+def save_baseline(file_path, report):
+	'''Write suite report as JSON'''
+	with open(file_path, 'w', encoding = 'utf-8') as my_file: json.dump(report, my_file, indent = 1)
+	return file_path
+
+def load_baseline(file_path):
+	'''Read suite report written by save_baseline'''
+	with open(file_path, 'r', encoding = 'utf-8') as my_file: report = json.load(my_file)
+	if report.get('version') != BASELINE_VERSION: raise ValueError(f"Baseline version not recognised: {file_path}")
+	return report
+
+def compare_baseline(baseline, report, threshold = REGRESSION_THRESHOLD):
+	'''Regressions of report against baseline: zettels/s down or peak RSS up by more than threshold
+	Only stages and sizes measured in both are compared'''
+	regressions = []
+	for name, result in report['results'].items():
+		old = baseline['results'].get(name)
+		if old is None: continue
+		speed = result['zettels_per_second'] / old['zettels_per_second'] - 1
+		if speed < -threshold: regressions.append(f"{name}: {speed:+.0%} zettels/s")
+		if result['peak_rss_mb'] and old['peak_rss_mb']:
+			memory = result['peak_rss_mb'] / old['peak_rss_mb'] - 1
+			if memory > threshold: regressions.append(f"{name}: {memory:+.0%} peak RSS")
+	return regressions
+
+def run_comparisons():
+	'''Legacy against current paths, and the import time budget'''
+	compare_tokenizer()
+	print()
+	compare_csv_import()
+	print()
+	compare_export()
+	print()
+	compare_memory()
+	print()
+	check_import_time()
+
+def main(argv = None):
+	'''Run comparisons, or the suite if sizes, save or compare are given. Returns exit status'''
+	parser = argparse.ArgumentParser(prog = 'python -m zettelkasten_txt_to_csv.benchmark')
+	parser.add_argument('--sizes', type = int, nargs = '+', help = f"zettels per synthetic file (default: {' '.join(map(str, SUITE_SIZES))})")
+	parser.add_argument('--stages', nargs = '+', choices = SUITE_STAGES, default = SUITE_STAGES)
+	parser.add_argument('--per-section', type = int, default = 100, help = 'zettels per section')
+	parser.add_argument('--words', type = int, default = 30, help = 'words in each zettel')
+	parser.add_argument('--repeat', type = int, default = 3, help = 'runs per stage, best is kept')
+	parser.add_argument('--save', help = 'write results to this JSON baseline')
+	parser.add_argument('--compare', help = 'flag regressions against this JSON baseline')
+	parser.add_argument('--threshold', type = float, default = REGRESSION_THRESHOLD)
+	arguments = parser.parse_args(argv)
+	if not (arguments.sizes or arguments.save or arguments.compare):
+		run_comparisons()
+		return 0
+
+	report = run_suite(arguments.sizes or SUITE_SIZES, arguments.stages, arguments.per_section, arguments.words, arguments.repeat)
+	if arguments.save: print(f"Saved baseline: {save_baseline(arguments.save, report)}")
+	if arguments.compare:
+		regressions = compare_baseline(load_baseline(arguments.compare), report, arguments.threshold)
+		for regression in regressions: print(f"Regression: {regression}")
+		print(f"{len(regressions)} regressions beyond {arguments.threshold:.0%}")
+		return 1 if regressions else 0
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
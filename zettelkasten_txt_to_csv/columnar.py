@@ -0,0 +1,158 @@
+'''
+Columnar library for Zettelkasten txt to csv converter
+
+A library held as one list per field instead of one Zettel per card, for bulk
+output to spreadsheets and analysis tools:
+
+text_columns   index, parent, title, zettel, reference, keyword: text of each card
+serial         key as float64 serial day (days since 30/12/1899, as in Googlesheets),
+               NaN where the key is not a number
+
+Exports quote only the values of columns that need it, as csv.writer would,
+and format rows from the columns in C, writing the same text as csv.writer
+in about half the time. Snapshots are written column by column, giving a
+column file that reloads straight into columns. Sorting and filtering work on whole columns at
+once, with NumPy when it is installed and the array module otherwise:
+
+columns = ColumnarLibrary.from_library(zkn.library)     or from_snapshot(path), making no zettels
+august = columns.between(datetime(2020, 8, 1), datetime(2020, 9, 1)).sort()
+august.export_tsv('august.tsv')                            or export_csv, save_snapshot
+zkn.export_zk_csv(file_path, august)                       as any library, also export_zk_tsv
+'''
+
+import re
+import csv
+import math
+import datetime
+from array import array
+from operator import attrgetter, itemgetter
+try: import numpy
+except ImportError: numpy = None # optional, sort and between fall back to array and sorted
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettel, ZETTEL_FIELDS, CSV_COLUMNS, UidAllocator, UID_RESOLUTION
+from zettelkasten_txt_to_csv.snapshot import read_columns, save_columns, paused_gc
+
+EXPORT_CHUNK = 100000 # rows formatted per write
+LINE_END = '\r\n' # as csv.writer
+
+def to_serial(value):
+	'''Serial day of key text, a number, datetime or date, NaN for text that is not a number'''
+	if isinstance(value, datetime.datetime): return UidAllocator.to_ticks(value) / UID_RESOLUTION
+	if isinstance(value, datetime.date): return to_serial(datetime.datetime.combine(value, datetime.time()))
+	try: return float(value)
+	except (TypeError, ValueError): return math.nan
+
+def serial_days(keys):
+	'''float64 serial day of each key, a NumPy array if installed'''
+	try: values = array('d', map(float, keys))
+	except (TypeError, ValueError): values = array('d', map(to_serial, keys)) # some keys are not numbers
+	return numpy.frombuffer(values) if numpy else values
+
+def text_column(values):
+	'''List of values as text, lazy summaries built and missing values empty'''
+	values = list(values)
+	if set(map(type, values)) <= {str}: return values
+	return ['' if value is None else str(value) for value in values]
+
+def quoted_column(column, delimiter = ';'):
+	'''Column with values quoted as csv.writer quotes them, the column itself if none need it'''
+	special = re.compile(f"[{re.escape(delimiter)}\"\r\n]")
+	if not special.search('\x00'.join(column)): return column # one search over the whole column
+	return [f'"{value.replace(chr(34), chr(34) * 2)}"' if special.search(value) else value for value in column]
+
+class ColumnarLibrary:
+	'''Fields of a library as parallel columns, see module docstring
+	Read only, build a new one after the library changes'''
+
+	def __init__(self, text_columns, serial = None):
+		'''text_columns: a list of text per column of CSV_COLUMNS, all the same length
+		serial: serial days of the index column, worked out if None'''
+		if len(text_columns) != len(CSV_COLUMNS) or len(set(map(len, text_columns))) > 1:
+			raise ValueError(f"Expected {len(CSV_COLUMNS)} columns of equal length: {CSV_COLUMNS}")
+		self.text_columns = list(text_columns)
+		self.serial = serial_days(self.text_columns[0]) if serial is None else serial
+
+	@classmethod
+	def from_library(cls, library):
+		'''Columns of a dictionary of zettels, or of an iterable of (key, zettel) pairs'''
+		if hasattr(library, 'items'): keys, values = list(library.keys()), list(library.values())
+		else:
+			pairs = list(library)
+			keys, values = list(map(itemgetter(0), pairs)), list(map(itemgetter(1), pairs))
+		# one pass per field in C, rather than a row per zettel
+		getter = attrgetter if set(map(type, values)) <= {Zettel} else itemgetter
+		return cls([text_column(keys)] + [text_column(map(getter(field), values)) for field in ZETTEL_FIELDS])
+
+	@classmethod
+	def from_snapshot(cls, file_path):
+		'''Columns of a snapshot written by save_snapshot or export_zk_snapshot, without making zettels'''
+		with open(file_path, 'rb') as my_file: view = memoryview(my_file.read())
+		count, columns = read_columns(view)
+		with paused_gc(): return cls([column.values(view) for column in columns])
+
+	def __len__(self):
+		return len(self.text_columns[0])
+
+	def column(self, name):
+		'''Text of one column of CSV_COLUMNS'''
+		return self.text_columns[CSV_COLUMNS.index(name)]
+
+	def rows(self):
+		'''(index, parent, title, zettel, reference, keyword) of each card, as export_zk_csv writes'''
+		return zip(*self.text_columns)
+
+	def items(self):
+		'''(key, zettel) pairs, making a Zettel for each card'''
+		return zip(self.text_columns[0], map(Zettel, *self.text_columns[1:]))
+
+	def to_library(self):
+		'''Dictionary of zettels, as the import methods return'''
+		with paused_gc(): return dict(self.items())
+
+	def take(self, numbers):
+		'''New ColumnarLibrary of the cards at numbers, in that order'''
+		if numpy: numbers = numpy.asarray(numbers, dtype = numpy.intp)
+		serial = self.serial[numbers] if numpy else array('d', map(self.serial.__getitem__, numbers))
+		if numpy: numbers = numbers.tolist() # plain ints index lists fastest
+		return ColumnarLibrary([list(map(column.__getitem__, numbers)) for column in self.text_columns], serial)
+
+	def sort(self, column = 'serial', descending = False):
+		'''New ColumnarLibrary sorted by key date ('serial') or the text of a column, keeping
+		the order of equal values. Keys that are not numbers go last'''
+		if column != 'serial':
+			return self.take(sorted(range(len(self)), key = self.column(column).__getitem__, reverse = descending))
+		if numpy:
+			return self.take(numpy.argsort(-self.serial if descending else self.serial, kind = 'stable')) # NaN sorts last
+		serial = self.serial
+		if any(map(math.isnan, serial)): serial = array('d', [(-math.inf if descending else math.inf) if value != value else value for value in serial])
+		return self.take(sorted(range(len(self)), key = serial.__getitem__, reverse = descending))
+
+	def between(self, start = None, end = None):
+		'''New ColumnarLibrary of the cards with keys from start up to but not including end
+		start, end: datetime, date, serial day or key text, None for no limit'''
+		low = -math.inf if start is None else to_serial(start)
+		high = math.inf if end is None else to_serial(end)
+		if numpy: return self.take(numpy.flatnonzero((self.serial >= low) & (self.serial < high))) # NaN is never in range
+		return self.take([number for number, value in enumerate(self.serial) if low <= value < high])
+
+	def delimited_text(self, delimiter = ';', chunk_size = EXPORT_CHUNK):
+		'''Text of the rows as csv.writer writes them, chunk_size rows at a time'''
+		columns = [quoted_column(column, delimiter) for column in self.text_columns]
+		row_format = delimiter.join(['{}'] * len(columns)) + LINE_END
+		for start in range(0, len(self), chunk_size):
+			yield ''.join(map(row_format.format, *(column[start: start + chunk_size] for column in columns)))
+
+	def export_csv(self, file_path, delimiter = ';', header = False):
+		'''Write columns as csv in export_zk_csv layout, returns file_path
+		header: first row names the columns, read back by import_csv_zk either way'''
+		with open(file_path, 'w', encoding = 'utf-8', newline = '') as my_file:
+			if header: csv.writer(my_file, delimiter = delimiter).writerow(CSV_COLUMNS)
+			for text in self.delimited_text(delimiter): my_file.write(text)
+		return file_path
+
+	def export_tsv(self, file_path, header = False):
+		'''Write columns as tab separated values, see export_csv'''
+		return self.export_csv(file_path, '\t', header)
+
+	def save_snapshot(self, file_path, buffer_size = -1):
+		'''Write columns as a snapshot, reloaded by from_snapshot or import_snapshot_zk'''
+		return save_columns(file_path, self.text_columns, buffer_size)
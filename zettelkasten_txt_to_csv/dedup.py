@@ -0,0 +1,203 @@
+'''
+Duplicate detection for Zettelkasten txt to csv converter
+
+Find zettels with the same or nearly the same content under different keys,
+as when several exports are imported into one library, and merge or flag them
+before export. Nothing is compared pairwise:
+
+exact   hash of title and zettel after clean_text, ignoring case
+near    MinHash signature of word shingles, split into bands so that similar
+        zettels land in the same bucket of some band. Each zettel is only
+        checked against the first zettel of its buckets
+
+finder = DuplicateFinder()
+groups = finder.find(zkn.library)     report: kept key, duplicate keys, similarity
+finder.merge(zkn.library, groups)     or finder.flag(zkn.library, groups)
+
+Index cards of sections are left out, their text is generated from keys.
+'''
+
+import re
+import json
+import zlib
+import bisect
+import hashlib
+from array import array
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, INDEX_CARD_TEXT
+
+WORD_REGEX = re.compile(r'\w+')
+SIMILARITY = 0.8 # word shingle overlap (Jaccard) of near duplicates
+BINS = 16 # MinHash values per zettel
+BANDS = 4 # of BINS // BANDS values each, candidates share all values of one band
+SHINGLE = 3 # words per shingle
+ACTIONS = ('report', 'flag', 'merge')
+
+class DuplicateFinder:
+	'''Exact and near duplicate zettels of a library, in time linear in its size
+	Near duplicates use one permutation MinHash: every shingle is hashed once into one of
+	BINS bins keeping the smallest value, and empty bins borrow from the next filled one'''
+
+	def __init__(self, similarity = SIMILARITY, near = True, zkn = None):
+		'''similarity: shingle overlap from 0 to 1 for near duplicates
+		near: False to find exact duplicates only
+		zkn: Zettelkasten whose clean_text normalises text, a new one if None'''
+		if BINS % BANDS: raise ValueError(f"BINS ({BINS}) must be a multiple of BANDS ({BANDS})")
+		self.similarity, self.near = similarity, near
+		self.clean_text = (zkn or Zettelkasten()).clean_text
+
+	def text(self, zettel):
+		'''Normalised title and zettel, or None for index cards and empty zettels'''
+		text = zettel.zettel
+		if not isinstance(text, str): text = str(text) # lazy summary
+		if not text or text.startswith(INDEX_CARD_TEXT): return None
+		return self.clean_text(f"{zettel.title}\x1f{text}", False).casefold()
+
+	def fingerprint(self, text):
+		return hashlib.blake2b(text.encode('utf-8'), digest_size = 16).digest()
+
+	def shingles(self, text):
+		'''Hashes of each run of SHINGLE words, stable between runs and processes'''
+		words = list(map(zlib.crc32, map(str.encode, WORD_REGEX.findall(text))))
+		if len(words) < SHINGLE: return {hash(tuple(words))} if words else set()
+		return set(map(hash, zip(*(words[start:] for start in range(SHINGLE)))))
+
+	def signature(self, shingles):
+		'''BINS MinHash values of a set of shingle hashes'''
+		bits = BINS.bit_length() - 1
+		bins = [None] * BINS
+		for shingle in shingles:
+			number, value = shingle & (BINS - 1), shingle >> bits
+			if bins[number] is None or value < bins[number]: bins[number] = value
+		filled = [number for number, value in enumerate(bins) if value is not None]
+		if len(filled) == BINS: return bins
+		# empty bin takes the next filled bin to its right, marked with the distance
+		signature = []
+		for number, value in enumerate(bins):
+			if value is None:
+				donor = filled[bisect.bisect_right(filled, number) % len(filled)]
+				value = hash((bins[donor], (donor - number) % BINS))
+			signature.append(value)
+		return signature
+
+	def find(self, library):
+		'''Groups of duplicates, each a dictionary of kind ('exact' or 'near'), keep (first key
+		in library order), duplicates (other keys) and similarity (lowest shingle overlap found)'''
+		keys, texts, seen = [], [], {}
+		parents = [] # union find over distinct texts
+		exact = {} # first text number -> duplicate keys
+		for key, zettel in library.items():
+			text = self.text(zettel)
+			if text is None: continue
+			fingerprint = self.fingerprint(text)
+			number = seen.get(fingerprint)
+			if number is not None:
+				exact.setdefault(number, []).append(key)
+				continue
+			seen[fingerprint] = len(keys)
+			parents.append(len(keys))
+			keys.append(key)
+			texts.append(text)
+		del seen
+
+		similarities = {}
+		if self.near: self.find_near(texts, parents, similarities)
+
+		groups = {}
+		for number in range(len(keys)):
+			root = self.root(parents, number)
+			if root != number or number in exact: groups.setdefault(root, []).append(number)
+		report = []
+		for root, members in sorted(groups.items()):
+			duplicates = [keys[number] for number in members if number != root] + exact.get(root, [])
+			for number in members:
+				if number != root: duplicates.extend(exact.get(number, []))
+			near = any(number != root for number in members)
+			report.append(dict(kind = 'near' if near else 'exact', keep = keys[root], duplicates = duplicates,
+				similarity = round(min((similarities[number] for number in members if number != root), default = 1.0), 3)))
+		return report
+
+	def find_near(self, texts, parents, similarities):
+		'''Join near duplicate texts in parents, one band at a time to bound memory'''
+		signatures = array('q')
+		for text in texts: signatures.extend(self.signature(self.shingles(text)))
+		rows = BINS // BANDS
+		for band in range(BANDS):
+			buckets = {} # band values -> first text number
+			for number in range(len(texts)):
+				start = number * BINS + band * rows
+				first = buckets.setdefault(hash(tuple(signatures[start: start + rows])), number)
+				if first == number: continue
+				root, other_root = sorted((self.root(parents, first), self.root(parents, number)))
+				if root == other_root: continue
+				similarity = self.jaccard(texts[first], texts[number])
+				if similarity >= self.similarity:
+					parents[other_root] = root # earliest text stays the root, and is kept
+					similarities[other_root] = similarity # of the link that joined other_root to its group
+
+	def jaccard(self, text, other_text):
+		shingles, other_shingles = self.shingles(text), self.shingles(other_text)
+		return len(shingles & other_shingles) / max(len(shingles | other_shingles), 1)
+
+	def root(self, parents, number):
+		'''Representative of number's group, halving the path on the way'''
+		while parents[number] != number:
+			parents[number] = parents[parents[number]]
+			number = parents[number]
+		return number
+
+	def merge(self, library, groups):
+		'''Remove duplicates from library, keeping the first zettel of each group with the
+		references and keywords of all, pointing children of removed zettels at it and taking
+		removed zettels out of the index cards of their sections'''
+		cards = {key: self.section_card(library, key) for group in groups for key in group['duplicates']}
+		replaced = {}
+		for group in groups:
+			kept = library[group['keep']]
+			for key in group['duplicates']:
+				duplicate = library.pop(key)
+				kept.reference = join_values(kept.reference, duplicate.reference)
+				kept.keyword = join_values(kept.keyword, duplicate.keyword)
+				replaced[key] = group['keep']
+				card = library.get(cards[key])
+				if card is not None: # entry as generate_index_text writes it, after the header or another entry
+					entry = f"{key}{', ' + duplicate.title if duplicate.title else ''}. "
+					card.zettel = str(card.zettel).replace(f". {entry}", '. ', 1)
+		if replaced:
+			for zettel in library.values():
+				if zettel.parent in replaced: zettel.parent = replaced[zettel.parent]
+		return library
+
+	def section_card(self, library, key):
+		'''Key of the index card of the section holding key, following parents, None if there is none'''
+		seen = {key}
+		while key in library:
+			key = library[key].parent
+			if key in seen: return None
+			if key in library and str(library[key].zettel).startswith(INDEX_CARD_TEXT): return key
+			seen.add(key)
+		return None
+
+	def flag(self, library, groups):
+		'''Add "duplicate of <kept key>" to the keywords of each duplicate, changing nothing else'''
+		for group in groups:
+			for key in group['duplicates']:
+				zettel = library[key]
+				zettel.keyword = join_values(zettel.keyword, f"duplicate of {group['keep']}")
+		return library
+
+	def apply(self, library, action = 'report'):
+		'''Find groups and 'report' only, 'flag' or 'merge' them, returns the groups'''
+		if action not in ACTIONS: raise ValueError(f"Unknown duplicate action: {action}, expected one of {ACTIONS}")
+		groups = self.find(library)
+		if action != 'report': getattr(self, action)(library, groups)
+		return groups
+
+def join_values(values, other_values):
+	'''Comma separated values of both, each once, in order'''
+	parts = [value.strip() for text in (values, other_values) for value in (text or '').split(',')]
+	return ', '.join(dict.fromkeys(part for part in parts if part))
+
+def save_report(file_path, groups):
+	'''Write duplicate groups from DuplicateFinder.find as JSON, returns file_path'''
+	with open(file_path, 'w', encoding = 'utf-8') as my_file: json.dump(groups, my_file, indent = 1)
+	return file_path
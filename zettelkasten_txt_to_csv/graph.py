@@ -0,0 +1,173 @@
+'''
+Parent and child index for Zettelkasten txt to csv converter
+
+Every zettel names its parent: sections point at the section key, zettels at
+their section card, and an explicit [parent] field at any other card, so cards
+nest to any depth. ParentIndex numbers the keys of a loaded library once and
+keeps the links as flat arrays, so walking a subtree only touches the cards in
+it, however large the library:
+
+graph = ParentIndex(zkn.library)
+graph.subtree(key)            key and every card below it, depth first
+graph.depth(key)              0 for a top level card, -1 if on or under a cycle
+graph.ancestors(key)          parent, grandparent and so on
+graph.cycles()                lists of keys whose parents loop back on themselves
+zkn.export_zk_txt(file_path, graph.ordered_items(zkn.library))
+
+Parents that are not cards of the library, such as the section key, are kept
+as extra nodes with no parent of their own. Build a new index after the
+library changes.
+'''
+
+import itertools
+from array import array
+
+NO_PARENT = -1
+
+class ParentIndex:
+	'''Parent of each key, and children of each key as compressed sparse rows:
+	children of node n are children[offsets[n]: offsets[n + 1]], in library order'''
+
+	def __init__(self, library):
+		'''Number keys and link them in one pass over the library, a dictionary or (key, zettel) pairs'''
+		self.keys = [] # node number -> key
+		self.numbers = {} # key -> node number
+		parent_keys = []
+		for key, zettel in (library.items() if hasattr(library, 'items') else library):
+			if key in self.numbers: continue # first of repeated keys, as import_csv_zk keeps
+			self.numbers[key] = len(self.keys)
+			self.keys.append(key)
+			parent_keys.append(zettel.parent)
+		self.size = len(self.keys) # cards of the library, later nodes are parents outside it
+
+		self.parents = array('q')
+		for parent in parent_keys:
+			number = self.numbers.get(parent, NO_PARENT) if parent else NO_PARENT
+			if number == NO_PARENT and parent:
+				number = self.numbers[parent] = len(self.keys)
+				self.keys.append(parent)
+			self.parents.append(number)
+		self.parents.extend(itertools.repeat(NO_PARENT, len(self.keys) - self.size))
+
+		# count children of each node, then place each child after its earlier siblings
+		counts = array('q', bytes(8 * (len(self.keys) + 1)))
+		for parent in self.parents:
+			if parent != NO_PARENT: counts[parent + 1] += 1
+		self.offsets = array('q', itertools.accumulate(counts))
+		self.children = array('q', bytes(8 * self.offsets[-1]))
+		cursor = self.offsets[:-1]
+		for child, parent in enumerate(self.parents):
+			if parent != NO_PARENT:
+				self.children[cursor[parent]] = child
+				cursor[parent] += 1
+		self.depths = None # from analyse, on first use
+		self.cycle_list = None
+
+	def __len__(self):
+		return len(self.keys)
+
+	def __contains__(self, key):
+		return key in self.numbers
+
+	def number(self, key):
+		number = self.numbers.get(key)
+		if number is None: raise KeyError(f"Key not in parent index: {key}")
+		return number
+
+	def parent(self, key):
+		'''Parent key, or None at the top'''
+		parent = self.parents[self.number(key)]
+		return None if parent == NO_PARENT else self.keys[parent]
+
+	def child_numbers(self, number):
+		return self.children[self.offsets[number]: self.offsets[number + 1]]
+
+	def children_of(self, key):
+		'''Keys of direct children, in library order'''
+		return [self.keys[child] for child in self.child_numbers(self.number(key))]
+
+	def subtree(self, key, include_root = True):
+		'''Keys of key and all cards below it, depth first with children in library order
+		Time is proportional to the size of the subtree'''
+		root = self.number(key)
+		children, offsets = self.children, self.offsets
+		# each node has one parent, so only a cycle back to root can reach a node twice
+		top = (self.ancestor_numbers(root) or [root])[-1]
+		on_cycle = self.parents[top] == root
+		order, stack = [], [root]
+		while stack:
+			node = stack.pop()
+			order.append(node)
+			start, end = offsets[node], offsets[node + 1]
+			if start == end: continue
+			below = children[start: end]
+			below.reverse()
+			if on_cycle and root in below: below.remove(root)
+			stack.extend(below)
+		result = list(map(self.keys.__getitem__, order))
+		return result if include_root else result[1:]
+
+	def ancestors(self, key):
+		'''Parent, grandparent and so on up to the top, stopping before a cycle repeats'''
+		return [self.keys[node] for node in self.ancestor_numbers(self.number(key))]
+
+	def ancestor_numbers(self, node):
+		result, seen = [], {node}
+		node = self.parents[node]
+		while node != NO_PARENT and node not in seen:
+			seen.add(node)
+			result.append(node)
+			node = self.parents[node]
+		return result
+
+	def depth(self, key):
+		'''Number of ancestors, or -1 for keys on a cycle or below one'''
+		if self.depths is None: self.analyse()
+		return self.depths[self.number(key)]
+
+	def cycles(self):
+		'''Keys of each loop of parents, in parent order from the first key met'''
+		if self.cycle_list is None: self.analyse()
+		return self.cycle_list
+
+	def roots(self):
+		'''Keys with no parent, including parents outside the library'''
+		return [self.keys[node] for node, parent in enumerate(self.parents) if parent == NO_PARENT]
+
+	def analyse(self):
+		'''Depth of every node and the cycles, in one walk up from each node not yet met'''
+		parents = self.parents
+		depths = array('q', itertools.repeat(-2, len(self.keys))) # -2 until known
+		self.cycle_list = []
+		for start in range(len(self.keys)):
+			if depths[start] != -2: continue
+			path, on_path, node = [], {}, start
+			while node != NO_PARENT and depths[node] == -2 and node not in on_path:
+				on_path[node] = len(path)
+				path.append(node)
+				node = parents[node]
+			if node != NO_PARENT and node in on_path: # walked into a loop of this path
+				loop = path[on_path[node]:]
+				self.cycle_list.append([self.keys[member] for member in loop])
+				for member in loop: depths[member] = -1
+				del path[on_path[node]:]
+			depth = -1 if node == NO_PARENT else depths[node]
+			below_cycle = node != NO_PARENT and depth == -1
+			for member in reversed(path):
+				depth = -1 if below_cycle else depth + 1
+				depths[member] = depth
+		self.depths = depths
+		return depths
+
+	def ordered_items(self, library):
+		'''(key, zettel) pairs of library with every card right after its parent, for export
+		Cards only reachable through a cycle follow at the end'''
+		placed = bytearray(self.size)
+		for root in self.roots():
+			for key in self.subtree(root):
+				number = self.numbers[key]
+				if number < self.size:
+					placed[number] = 1
+					yield key, library[key]
+		for number in range(self.size):
+			if not placed[number]: yield self.keys[number], library[self.keys[number]]
@@ -0,0 +1,348 @@
+'''
+Evernote and Markdown import for Zettelkasten txt to csv converter
+
+Notes from other apps are read into the same sections the txt importer makes
+and stored by Zettelkasten.store_sections, so keys, index cards and parents
+come out as they would for a .txt file. Every importer streams its input:
+
+enex       Evernote export, read with an incremental XML parser. Each note is
+           made into a zettel as soon as it closes and then dropped, so a large
+           export is never held as a whole tree
+html       Evernote html export or any html page, one note per file
+markdown   one zettel per .md file, or with headings each # heading starts a
+           section, ## headings start zettels and deeper headings nest under
+           the heading above them
+
+A note written with field markers ([index] ... [title] ...) is parsed as a
+section of a .txt file, titled with the note title. Other notes are zettels of
+one section per export file or folder. Folders of notes, such as a vault of
+Markdown files, are read by a pool of threads a few files ahead of parsing.
+
+Attachments, the resources of an Evernote export and data: or local images
+of html and Markdown, are written to an AttachmentStore when a folder is given
+for them, and their paths added to the reference of the note's first zettel.
+Without one they are left out, and data: images are taken out of the text.
+
+zkn.import_notes_zk(file_path = 'vault')     or an .enex, .html or .md file
+zkn.import_notes_zk(file_path = 'export.enex', attachments = 'attachments')
+'''
+
+import os
+import re
+import itertools
+import collections
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from xml.etree.ElementTree import iterparse
+from concurrent.futures import ThreadPoolExecutor
+try: # imported as part of the package
+	from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, Zettel, NOTE_ENDINGS, parse_section_worker, thread_count
+	from zettelkasten_txt_to_csv.attachments import AttachmentStore
+except ImportError: # run as script from this folder, such as strategy.py
+	from zettelkasten_txt_to_csv import Zettelkasten, Zettel, NOTE_ENDINGS, parse_section_worker, thread_count
+	from attachments import AttachmentStore
+
+MARKER_REGEX = re.compile(r'\[index\]', re.IGNORECASE) # note written for the txt importer
+HEADING_REGEX = re.compile(r'(#{1,6})\s+(.*?)[\s#]*$') # Markdown heading line, e.g. ## Title
+IMAGE_REGEX = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)>?[^)]*\)') # Markdown image, e.g. ![alt](source "title")
+DATA_REGEX = re.compile(r'data:([^,;]*)(?:;[^,;]*)*?;base64,(.*)', re.DOTALL) # base64 data: link, mime type and data
+BLOCK_TAGS = frozenset(('p', 'div', 'br', 'li', 'tr', 'hr', 'pre', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+SKIP_TAGS = frozenset(('script', 'style'))
+META_FIELDS = {'keywords': 'keyword', 'source-url': 'reference', 'source': 'reference'} # html meta names
+FRONT_MATTER_FIELDS = dict(title = 'title', reference = 'reference', source = 'reference', url = 'reference',
+	keyword = 'keyword', keywords = 'keyword', tags = 'keyword', tag = 'keyword') # Markdown front matter names
+READ_AHEAD = 4 # files read per thread before parsing catches up
+
+class TextExtractor(HTMLParser):
+	'''Text of html or of Evernote note content, a line per block, with the title and known meta tags'''
+
+	def __init__(self):
+		super().__init__(convert_charrefs = True)
+		self.parts, self.title_parts, self.meta, self.images = [], [], {}, []
+		self.skipping, self.in_title = 0, False
+
+	def handle_starttag(self, tag, attrs):
+		if tag == 'title': self.in_title = True
+		elif tag in SKIP_TAGS: self.skipping += 1
+		elif tag == 'meta':
+			attrs = dict(attrs)
+			field = META_FIELDS.get((attrs.get('name') or '').lower())
+			if field and attrs.get('content'): self.meta[field] = attrs['content']
+		elif tag == 'img':
+			source = dict(attrs).get('src')
+			if source: self.images.append(source)
+		elif tag in BLOCK_TAGS: self.parts.append('\n')
+
+	def handle_endtag(self, tag):
+		if tag == 'title': self.in_title = False
+		elif tag in SKIP_TAGS: self.skipping = max(self.skipping - 1, 0)
+		elif tag in BLOCK_TAGS: self.parts.append('\n')
+
+	def handle_data(self, data):
+		if self.in_title: self.title_parts.append(data)
+		elif not self.skipping: self.parts.append(data)
+
+	@property
+	def text(self):
+		return ''.join(self.parts)
+
+	@property
+	def title(self):
+		return ''.join(self.title_parts).strip()
+
+def extract_text(markup):
+	'''TextExtractor fed with all of markup'''
+	extractor = TextExtractor()
+	extractor.feed(markup)
+	extractor.close()
+	return extractor
+
+def front_matter(text):
+	'''(fields, rest of text) of Markdown starting with a --- block of "name: value" lines
+	Only title, reference and keyword are kept, lists such as tags are joined with commas'''
+	lines = text.split('\n')
+	if lines[0].strip() != '---': return {}, text
+	end = next((number for number in range(1, len(lines)) if lines[number].strip() in ('---', '...')), None)
+	if end is None: return {}, text
+	values, field = {}, None
+	for line in map(str.strip, lines[1: end]):
+		if line.startswith('- '):
+			if field: values[field].append(line[2:]) # item of a list under the last name
+		elif ':' in line:
+			name, value = line.split(':', 1)
+			field = FRONT_MATTER_FIELDS.get(name.strip().lower())
+			if field: values.setdefault(field, []).extend(value.strip().strip('[]').split(',') if field == 'keyword' else [value])
+	fields = {field: ', '.join(filter(None, (value.strip().strip('"\'') for value in items))) for field, items in values.items()}
+	return fields, '\n'.join(lines[end + 1:])
+
+def read_ahead(paths, read, threads = None, ahead = READ_AHEAD):
+	'''read(path) of each path in order, run by a pool of threads at most ahead files per thread
+	in front of the caller, so a large folder is never held in memory at once'''
+	if len(paths) < 2:
+		yield from map(read, paths)
+		return
+	threads = thread_count(threads)
+	with ThreadPoolExecutor(threads) as executor:
+		window = ahead * threads
+		futures = collections.deque(executor.submit(read, path) for path in paths[:window])
+		for path in paths[window:]:
+			yield futures.popleft().result()
+			futures.append(executor.submit(read, path))
+		while futures: yield futures.popleft().result()
+
+class NoteImporter(ABC):
+	'''Shared interface of the importers: records(file_path) yields (subtitle, zettel library, count)
+	per section, the library keyed by placeholder numbers below count with parents None for the
+	section card or the number of another zettel, as parse_section_worker returns for a .txt section.
+	Subclasses give their endings and notes(path, contents), yielding a Zettel for each plain note
+	and a whole record for each section of its own'''
+	endings = ()
+
+	def __init__(self, zkn = None, threads = None):
+		'''zkn: Zettelkasten storing the notes, a new one if None
+		threads: reading files of a folder, None for the ThreadPoolExecutor default'''
+		self.zkn = zkn or Zettelkasten()
+		self.threads = threads
+		self.attachments, self.attached = None, [] # store and (zettel, futures of stored paths) while importing
+
+	def import_notes(self, library, file_path, summaries = 'eager', attachments = None):
+		'''Store sections of file or folder file_path in library as import_txt_zk does, returns library
+		attachments: AttachmentStore for attachments of the notes, None to leave them out'''
+		self.attachments, self.attached = attachments, []
+		zkn = self.zkn
+		zkn.master_key = zkn.timestamp()
+		section_key = zkn.timestamp() # parent of sections, as in import_txt_zk
+		parsed = collections.deque()
+
+		def sections():
+			for subtitle, zettel_library, count in self.records(file_path):
+				if not zettel_library: continue
+				parsed.append((zettel_library, count))
+				yield subtitle, None, False
+
+		# store_sections takes the library of each section right after the section itself
+		zkn.store_sections(library, zkn.instruments.iterate('split', sections()), section_key, iter(parsed.popleft, None), summaries)
+		self.reference_attachments()
+		return library
+
+	def attach(self, note, futures):
+		'''Reference attachments from the zettel of a note, or the first zettel of its section, once stored'''
+		zettel = note if isinstance(note, Zettel) else next(iter(note[1].values()), None)
+		if futures and zettel is not None: self.attached.append((zettel, futures))
+		return note
+
+	def reference_attachments(self):
+		'''Add stored paths to the reference of each zettel with attachments, waiting for them as needed'''
+		for zettel, futures in self.attached:
+			paths = []
+			for future in futures:
+				try: paths.append(future.result())
+				except (ValueError, OSError) as error: print(f"Error: Attachment not stored: {error}")
+			zettel.reference = ', '.join(filter(None, [zettel.reference, *dict.fromkeys(paths)]))
+		self.attached = []
+
+	def store_images(self, path, sources):
+		'''Futures of stored images from the data: links or paths, relative to the note at path, of sources
+		Other links, such as web addresses, are left alone'''
+		if self.attachments is None: return []
+		futures = []
+		for source in sources:
+			data = DATA_REGEX.match(source)
+			if data: futures.append(self.attachments.add(data.group(2), data.group(1)))
+			elif ':' not in source:
+				image_path = os.path.join(os.path.dirname(path), source.replace('%20', ' '))
+				if os.path.isfile(image_path): futures.append(self.attachments.add_file(image_path))
+		return futures
+
+	def paths(self, file_path):
+		'''file_path itself, or files with one of endings in folder file_path and below, folder by folder'''
+		if not os.path.isdir(file_path): return [file_path]
+		return [path for path in walk_files(file_path) if path.lower().endswith(self.endings)]
+
+	def records(self, file_path):
+		'''Records of every note in file or folder file_path, plain notes gathered into a section per folder'''
+		file_path = os.path.normpath(file_path)
+		top = os.path.dirname(file_path) or os.curdir
+		paths = self.paths(file_path)
+		contents = read_ahead(paths, self.read, self.threads)
+		for folder, notes in itertools.groupby(zip(paths, contents), lambda pair: os.path.dirname(pair[0])):
+			zettels = []
+			for path, content in notes:
+				for note in self.notes(path, content):
+					if isinstance(note, Zettel): zettels.append(note)
+					else: yield note
+			subtitle = os.path.relpath(folder, top) if os.path.isdir(file_path) else file_title(file_path)
+			yield self.zkn.clean_text(subtitle.replace(os.sep, '/')), dict(enumerate(zettels)), len(zettels)
+
+	def read(self, path):
+		'''Contents of one file, called from the reading threads'''
+		with open(path, 'r', encoding = 'utf-8') as my_file: return my_file.read()
+
+	@abstractmethod
+	def notes(self, path, contents):
+		'''Zettel of each plain note and record of each section in the contents of one file'''
+
+	def note(self, title, text, reference = '', keyword = ''):
+		'''Zettel of a plain note, or the record of a note written with field markers'''
+		if MARKER_REGEX.search(text): return self.text_record(title, text)
+		return self.zettel(title, text, reference, keyword)
+
+	def zettel(self, title, text, reference = '', keyword = '', parent = None):
+		clean_text = self.zkn.clean_text
+		return Zettel(parent, clean_text(title, True), clean_text(text, True), clean_text(reference), clean_text(keyword))
+
+	def text_record(self, title, text):
+		'''Record of a note written with field markers, parsed as one section of a .txt file'''
+		fields, blank = self.zkn.lex_fields(text)
+		if blank: return title, {}, 0
+		return (self.zkn.clean_text(title), *parse_section_worker(fields))
+
+def file_title(path):
+	'''File name without folder or ending'''
+	return os.path.splitext(os.path.basename(path))[0]
+
+def walk_files(folder):
+	'''Paths of all files in folder and below, folder by folder in name order'''
+	for parent, folders, files in os.walk(folder):
+		folders.sort()
+		yield from (os.path.join(parent, name) for name in sorted(files))
+
+class EnexImporter(NoteImporter):
+	'''Evernote .enex export, a section of its plain notes'''
+	endings = ('.enex',)
+
+	def read(self, path):
+		return path # parsed while it is read, see notes
+
+	def notes(self, path, source):
+		events = iterparse(source, events = ('start', 'end'))
+		_, root = next(events)
+		for event, element in events:
+			if event != 'end' or element.tag != 'note': continue
+			text = extract_text(element.findtext('content', '')).text
+			reference = element.findtext('note-attributes/source-url') or element.findtext('note-attributes/author') or ''
+			keyword = ', '.join(tag.text for tag in element.findall('tag') if tag.text)
+			title = element.findtext('title', '')
+			futures = [self.attachments.add(resource.findtext('data', ''), resource.findtext('mime', ''),
+				resource.findtext('resource-attributes/file-name', '')) for resource in element.findall('resource')] if self.attachments else []
+			root.clear() # drop finished notes and their attachments
+			yield self.attach(self.note(title, text, reference, keyword), futures)
+
+class HtmlImporter(NoteImporter):
+	'''Evernote .html export or other html pages, a zettel per file'''
+	endings = ('.html', '.htm')
+
+	def notes(self, path, contents):
+		page = extract_text(contents)
+		note = self.note(page.title or file_title(path), page.text, page.meta.get('reference', ''), page.meta.get('keyword', ''))
+		yield self.attach(note, self.store_images(path, page.images))
+
+class MarkdownImporter(NoteImporter):
+	'''Markdown files, a zettel per file or sections and zettels from headings'''
+	endings = ('.md', '.markdown')
+
+	def __init__(self, zkn = None, threads = None, headings = False):
+		'''headings: # headings start sections and deeper headings zettels, instead of a zettel per file'''
+		super().__init__(zkn, threads)
+		self.headings = headings
+
+	def notes(self, path, contents):
+		fields, text = front_matter(contents)
+		title = fields.get('title', '')
+		reference, keyword = fields.get('reference', ''), fields.get('keyword', '')
+		futures = self.store_images(path, IMAGE_REGEX.findall(text))
+		text = IMAGE_REGEX.sub(lambda image: '' if image.group(1).startswith('data:') else image.group(), text)
+		if MARKER_REGEX.search(text): notes = [self.text_record(title or file_title(path), text)]
+		elif self.headings: notes = list(self.heading_records(title or file_title(path), text.split('\n'), reference, keyword))
+		else:
+			# first line as title if it is a heading
+			lines = text.lstrip('\n').split('\n', 1)
+			heading = HEADING_REGEX.match(lines[0])
+			if heading and not title: title, text = heading.group(2), lines[-1] if len(lines) > 1 else ''
+			notes = [self.zettel(title or file_title(path), text, reference, keyword)]
+		# images of the file go with its first zettel
+		self.attach(next((note for note in notes if isinstance(note, Zettel) or note[1]), notes[0]), futures)
+		yield from notes
+
+	def heading_records(self, subtitle, lines, reference = '', keyword = ''):
+		'''Records of Markdown lines split into sections at # headings. Each deeper heading is a zettel
+		under the nearest heading above it of a lower level, text before any is a zettel of its own'''
+		zettels, open_headings, body, current = [], [], [], None # (level, number) of headings above
+
+		def finish():
+			text = '\n'.join(body).strip()
+			body.clear()
+			if current is not None: zettels[current].zettel = self.zkn.clean_text(text, True) or zettels[current].title
+			elif text: zettels.append(self.zettel('', text, reference, keyword))
+
+		for line in lines:
+			heading = HEADING_REGEX.match(line)
+			if not heading:
+				body.append(line)
+				continue
+			finish()
+			level, title = len(heading.group(1)), heading.group(2)
+			if level == 1:
+				yield self.zkn.clean_text(subtitle), dict(enumerate(zettels)), len(zettels)
+				subtitle, zettels, open_headings, current = title, [], [], None
+				continue
+			while open_headings and open_headings[-1][0] >= level: open_headings.pop()
+			current = len(zettels)
+			zettels.append(self.zettel(title, '', reference, keyword, open_headings[-1][1] if open_headings else None))
+			open_headings.append((level, current))
+		finish()
+		yield self.zkn.clean_text(subtitle), dict(enumerate(zettels)), len(zettels)
+
+IMPORTERS = (EnexImporter, HtmlImporter, MarkdownImporter)
+
+def importer_for(file_path, zkn = None, threads = None, headings = None):
+	'''Importer for the ending of file_path, or for the first note file found in folder file_path
+	headings: for Markdown, None to split a single file at its headings and give each file of a folder one zettel
+	Returns None if there are no notes to read'''
+	if os.path.isdir(file_path):
+		ending = next((os.path.splitext(path)[1].lower() for path in walk_files(file_path) if path.lower().endswith(NOTE_ENDINGS)), '')
+		if headings is None: headings = False
+	else: ending = os.path.splitext(file_path)[1].lower()
+	importer = next((importer for importer in IMPORTERS if ending in importer.endings), None)
+	if importer is MarkdownImporter: return importer(zkn, threads, headings is not False)
+	return importer and importer(zkn, threads)
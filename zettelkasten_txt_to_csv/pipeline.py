@@ -0,0 +1,120 @@
+'''
+Asyncio pipeline for Zettelkasten txt to csv converter
+
+Convert many files with reading, parsing and writing overlapped:
+
+read    threads read each input                         -> parse queue
+parse   worker processes parse text into a library      -> write queue
+write   threads write every format of a library at once
+
+Queues are bounded, so reading waits when parsing falls behind and parsing
+waits for writing, holding only a few texts and libraries at a time. Each
+input is parsed once, however many formats are written.
+
+Run from repository root:
+python -m zettelkasten_txt_to_csv <directory or glob> --pipeline
+'''
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, NOTE_ENDINGS, worker_count
+from zettelkasten_txt_to_csv.batch import output_base, pending_inputs, report_batch, report_file
+
+DONE = None # end of a queue, one per consumer
+
+def read_input(file_path):
+	'''Text of a .txt or .csv input, read as the import methods open it
+	None for snapshots and notes, which are read in place by the parsing worker'''
+	ending = os.path.splitext(file_path)[1].lower()
+	if ending == '.snapshot' or ending in NOTE_ENDINGS: return None
+	with open(file_path, 'r', encoding = 'utf-8', newline = '' if ending == '.csv' else None) as my_file:
+		return my_file.read()
+
+def parse_input(file_path, text, seed = None):
+	'''Parse one input in a worker process, returns (library, master key for output names)'''
+	zkn = Zettelkasten(seed = seed)
+	ending = os.path.splitext(file_path)[1].lower()
+	if ending == '.snapshot': library = zkn.import_snapshot_zk(file_path = file_path)
+	elif ending in NOTE_ENDINGS: library = zkn.import_notes_zk(file_path = file_path)
+	else: library = zkn.import_text_zk(text, ending)
+	if ending in ('.csv', '.snapshot'): zkn.master_key = zkn.timestamp() # as convert_file
+	return library, zkn.master_key
+
+def write_output(zkn, ending, base, library, compress = False):
+	'''Write one format, returns output path'''
+	return getattr(zkn, f"export_zk_{ending}")(base, library, compress = compress)
+
+async def run_pipeline(inputs, formats = ('csv', 'txt'), output_dir = None, workers = None,
+		threads = None, queue_size = None, compress = False, seed = None, progress = None):
+	'''Convert inputs, returns summary dictionaries as convert_file, in input order
+	workers: parsing processes, None for one per CPU
+	threads: reading and writing threads, None for one per format of each worker plus one
+	queue_size: inputs and libraries waiting between stages, None for one per worker
+	seed: fixed time for keys, see Zettelkasten
+	progress: called with each summary as it finishes'''
+	loop = asyncio.get_running_loop()
+	results = [] # in input order, each filled in as it finishes
+
+	def finish(result, error = None):
+		if error is not None: result['error'] = f"{type(error).__name__}: {error}"
+		result['seconds'] = time.perf_counter() - result.pop('start')
+		if progress: progress(result)
+
+	workers = worker_count(workers)
+	with ProcessPoolExecutor(workers) as processes:
+		queue_size = queue_size or workers
+		parse_queue, write_queue = asyncio.Queue(queue_size), asyncio.Queue(queue_size)
+		with ThreadPoolExecutor(threads or workers * len(formats) + 1) as io_threads:
+
+			async def read():
+				for file_path in inputs:
+					result = dict(file = file_path, zettels = 0, outputs = [], error = '', start = time.perf_counter())
+					results.append(result)
+					try: text = await loop.run_in_executor(io_threads, read_input, file_path)
+					except Exception as error:
+						finish(result, error)
+						continue
+					await parse_queue.put((result, text)) # waits while parsing is behind
+				for _ in range(workers): await parse_queue.put(DONE)
+
+			async def parse():
+				while (item := await parse_queue.get()) is not DONE:
+					result, text = item
+					try: library, master_key = await loop.run_in_executor(processes, parse_input, result['file'], text, seed)
+					except Exception as error:
+						finish(result, error)
+						continue
+					await write_queue.put((result, library, master_key)) # waits while writing is behind
+
+			async def write():
+				while (item := await write_queue.get()) is not DONE:
+					result, library, master_key = item
+					zkn = Zettelkasten()
+					zkn.master_key = master_key
+					base = output_base(result['file'], output_dir)
+					# every format of this library at once
+					outputs = await asyncio.gather(*(loop.run_in_executor(io_threads, write_output, zkn, ending, base, library, compress)
+						for ending in formats), return_exceptions = True)
+					result['outputs'] = [output for output in outputs if not isinstance(output, BaseException)]
+					result['zettels'] = len(library)
+					finish(result, next((output for output in outputs if isinstance(output, BaseException)), None))
+
+			writers = [asyncio.create_task(write()) for _ in range(workers)]
+			await asyncio.gather(read(), *(parse() for _ in range(workers)))
+			for _ in writers: await write_queue.put(DONE)
+			await asyncio.gather(*writers)
+	return results
+
+def convert_pipeline(inputs, formats = ('csv', 'txt'), output_dir = None, workers = None, force = False, **options):
+	'''Convert each input file with run_pipeline, printing progress and throughput as convert_files
+	force: convert even if outputs are up to date
+	options: passed on to run_pipeline'''
+	start = time.perf_counter()
+	pending = pending_inputs(inputs, formats, output_dir, force)
+	if not pending: return report_batch([], start)
+	numbers = iter(range(1, len(pending) + 1)) # progress is numbered in the order files finish
+	progress = lambda result: report_file(result, next(numbers), len(pending))
+	results = asyncio.run(run_pipeline(pending, formats, output_dir, workers, progress = progress, **options))
+	return report_batch(results, start)
@@ -0,0 +1,169 @@
+'''
+Round trip checks for Zettelkasten txt to csv converter
+
+Random libraries, with colons, semicolons, quotes, unicode and empty fields, are
+written by each exporter and read back by its importer:
+
+txt            export_zk_txt -> import_txt_zk
+txt_mmap       export_zk_txt -> import_txt_zk reading mapped bytes
+csv            export_zk_csv, ';' without header -> import_csv_zk, delimiter sniffed
+columnar_csv   columnar.ColumnarLibrary through export_zk_csv -> import_csv_zk
+snapshot       export_zk_snapshot -> import_snapshot_zk
+
+Text formats must give back the library as the importers scrub it, see canonical_library:
+whitespace collapsed, ';' as ',', titles and zettels capitalised, and cards with
+no zettel text left out. Snapshots must give it back unchanged. Field markers
+such as [title] cannot be told apart from text in .txt, so random text has none.
+
+Each direction is timed, and the report has the layout of the benchmark suite,
+so benchmark.compare_baseline flags a slower parser or exporter as well:
+
+python -m zettelkasten_txt_to_csv.roundtrip --runs 50 --size 200
+python -m zettelkasten_txt_to_csv.roundtrip --size 20000 --runs 3 --save roundtrip.json
+python -m zettelkasten_txt_to_csv.roundtrip --size 20000 --runs 3 --compare roundtrip.json
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import platform
+import tempfile
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, Zettel, UidAllocator, ZETTEL_FIELDS, INDEX_CARD_TEXT
+from zettelkasten_txt_to_csv.benchmark import save_baseline, load_baseline, compare_baseline, peak_rss, BASELINE_VERSION, REGRESSION_THRESHOLD
+
+PAIRS = ('txt', 'txt_mmap', 'csv', 'columnar_csv', 'snapshot')
+LOSSLESS = ('snapshot',) # give back exactly what was written
+TOKENS = ('plant', 'soil', 'Water', 'compost', 'note:', ':', 'see: page 2', 'a:b:c', ';', 'light; shade', ',',
+	'"quoted"', "it's", '""', '.', '...', 'naïve', 'Größe', 'ßeta', 'ǆungla', '東京', 'Ωmega', 'café', '🌱', '—',
+	'title page', 'index card', 'keyword list', '[x y]', '[]', '(1)', '44077.5', '\\', '|', '#', '<b>')
+SPACES = (' ', ' ', ' ', '  ', '\t', '\n', ' \n ', ' ')
+FIELD_LENGTHS = (0, 0, 1, 1, 2, 3, 5, 8, 13)
+RUNS = 20 # random libraries per pair
+SIZE = 50 # zettels per library
+MAX_DIFFERENCES = 5 # reported per failed round trip
+
+def random_text(rng, length = None):
+	'''Random tokens joined by random whitespace, empty for length 0'''
+	if length is None: length = rng.choice(FIELD_LENGTHS)
+	text = [rng.choice(SPACES) if rng.random() < 0.2 else '']
+	for _ in range(length): text += [rng.choice(TOKENS), rng.choice(SPACES)]
+	return ''.join(text[:-1] if rng.random() < 0.7 else text)
+
+def random_library(size = SIZE, seed = 0):
+	'''Library of size zettels with random text, keys counting up from a date in 2020 and
+	parents that are empty, another key or text'''
+	rng = random.Random(seed)
+	keys = UidAllocator(44077 + rng.random()).reserve(size)
+	library = {}
+	for key in keys:
+		parent = rng.choice(('', rng.choice(keys), random_text(rng, 1)))
+		library[key] = Zettel(parent, random_text(rng), random_text(rng), random_text(rng), random_text(rng))
+	return library
+
+def canonical_library(library, zkn = None):
+	'''Library as the text importers give it back, see module docstring'''
+	zkn = zkn or Zettelkasten()
+	canonical = {}
+	for key, zettel in library.items():
+		zettel = Zettel(*(zkn.clean_text(zettel[field], field in ('title', 'zettel')) for field in ZETTEL_FIELDS))
+		if zettel.zettel: canonical[key] = zettel
+	return canonical
+
+def export_pair(pair, zkn, file_path, library):
+	'''Write library for pair, returns output path'''
+	if pair.startswith('txt'): return zkn.export_zk_txt(file_path, library)
+	if pair == 'csv': return zkn.export_zk_csv(file_path, library)
+	if pair == 'columnar_csv':
+		from zettelkasten_txt_to_csv.columnar import ColumnarLibrary
+		return zkn.export_zk_csv(file_path, ColumnarLibrary.from_library(library))
+	if pair == 'snapshot': return zkn.export_zk_snapshot(file_path, library)
+	raise ValueError(f"Unknown round trip: {pair}, expected one of {PAIRS}")
+
+def import_pair(pair, zkn, file_path):
+	'''Read back what export_pair wrote, without the index card import_txt_zk adds for the
+	untitled section that export_zk_txt output forms'''
+	if pair.startswith('txt'):
+		library = zkn.import_txt_zk(file_path = file_path, memory_map = pair == 'txt_mmap')
+		section = next(iter(library), None)
+		if section is not None and library[section].zettel.startswith(INDEX_CARD_TEXT) and not library[section].title:
+			del library[section]
+		return library
+	if pair.endswith('csv'): return zkn.import_csv_zk(file_path = file_path)
+	return dict(zkn.import_snapshot_zk(file_path = file_path))
+
+def differences(expected, result, limit = MAX_DIFFERENCES):
+	'''Descriptions of where result differs from expected, in key order, at most limit'''
+	found = []
+	for key in expected.keys() - result.keys(): found.append(f"{key}: missing")
+	for key in result.keys() - expected.keys(): found.append(f"{key}: unexpected {dict(result[key])}")
+	for key in expected.keys() & result.keys():
+		found += [f"{key} {field}: {expected[key][field]!r} came back as {result[key][field]!r}"
+			for field in ZETTEL_FIELDS if expected[key][field] != result[key][field]]
+	if not found and list(expected) != list(result): found.append('order of zettels changed')
+	return sorted(found)[:limit]
+
+def round_trip(pair, library, folder, expected = None):
+	'''Export and import library through pair in folder
+	Returns (differences, export seconds, import seconds)'''
+	if expected is None: expected = dict(library) if pair in LOSSLESS else canonical_library(library)
+	file_path = os.path.join(folder, pair)
+	start = time.perf_counter()
+	output_path = export_pair(pair, Zettelkasten(), file_path, library)
+	middle = time.perf_counter()
+	result = import_pair(pair, Zettelkasten(), output_path)
+	end = time.perf_counter()
+	os.remove(output_path)
+	return differences(expected, result), middle - start, end - middle
+
+def fuzz(runs = RUNS, size = SIZE, seed = 0, pairs = PAIRS, verbose = False):
+	'''Round trip runs random libraries of size zettels through each pair
+	Returns report with the layout of benchmark.run_suite, results named '<pair> export/<size>'
+	and '<pair> import/<size>', and failures as (pair, seed, differences)'''
+	totals = {(pair, direction): 0.0 for pair in pairs for direction in ('export', 'import')}
+	failures, zettels = [], 0
+	with tempfile.TemporaryDirectory() as folder:
+		for run_seed in range(seed, seed + runs):
+			library = random_library(size, run_seed)
+			canonical = canonical_library(library)
+			zettels += len(library)
+			for pair in pairs:
+				found, export_seconds, import_seconds = round_trip(pair, library, folder, dict(library) if pair in LOSSLESS else canonical)
+				totals[pair, 'export'] += export_seconds
+				totals[pair, 'import'] += import_seconds
+				if found:
+					failures.append((pair, run_seed, found))
+					if verbose: print(f"Error: {pair} round trip of seed {run_seed} differs:", *found, sep = '\n  ')
+	results = {f"{pair} {direction}/{size}": dict(seconds = seconds, zettels = zettels,
+		zettels_per_second = zettels / seconds if seconds else 0.0, peak_rss_mb = peak_rss())
+		for (pair, direction), seconds in totals.items()}
+	return dict(version = BASELINE_VERSION, python = platform.python_version(), platform = platform.platform(),
+		runs = runs, seed = seed, results = results, failures = failures)
+
+def main(argv = None):
+	'''Fuzz round trips and print throughput. Returns exit status, 1 for any failure or regression'''
+	parser = argparse.ArgumentParser(prog = 'python -m zettelkasten_txt_to_csv.roundtrip')
+	parser.add_argument('--runs', type = int, default = RUNS, help = f"random libraries per pair (default: {RUNS})")
+	parser.add_argument('--size', type = int, default = SIZE, help = f"zettels in each library (default: {SIZE})")
+	parser.add_argument('--seed', type = int, default = 0, help = 'first seed, each run uses the next')
+	parser.add_argument('--pairs', nargs = '+', choices = PAIRS, default = PAIRS)
+	parser.add_argument('--save', help = 'write throughput to this JSON baseline')
+	parser.add_argument('--compare', help = 'flag throughput regressions against this JSON baseline')
+	parser.add_argument('--threshold', type = float, default = REGRESSION_THRESHOLD)
+	arguments = parser.parse_args(argv)
+
+	report = fuzz(arguments.runs, arguments.size, arguments.seed, arguments.pairs, verbose = True)
+	for name, result in report['results'].items():
+		print(f"{name:>25}: {result['seconds']:8.3f} s {result['zettels_per_second']:>12,.0f} zettels/s")
+	print(f"{len(report['failures'])} failed round trips of {arguments.runs * len(arguments.pairs)}")
+	regressions = []
+	if arguments.save: print(f"Saved baseline: {save_baseline(arguments.save, dict(report, failures = []))}")
+	if arguments.compare:
+		regressions = compare_baseline(load_baseline(arguments.compare), report, arguments.threshold)
+		for regression in regressions: print(f"Regression: {regression}")
+		print(f"{len(regressions)} regressions beyond {arguments.threshold:.0%}")
+	return 1 if report['failures'] or regressions else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
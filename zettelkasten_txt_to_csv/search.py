@@ -0,0 +1,167 @@
+'''
+Search index for Zettelkasten txt to csv converter
+
+Inverted index of a loaded library: postings of each word in title and zettel
+text, and exact maps of keyword, reference and parent values. Build it during
+import by passing index = SearchIndex() to import_txt_zk, import_csv_zk or
+iter_txt_zk, then query keys without scanning the library:
+
+index.query('soil compost')              all words
+index.query('soil compost', mode = 'or') any word
+index.query('comp*')                     words starting with comp
+index.query('keyword:soil reference:"Smith 2019" water')
+
+Saved postings are packed arrays of key numbers, unpacked one word at a time
+as queries need them, so loading does not rebuild every set. Saved indexes
+are pickles, so only load files you wrote yourself.
+'''
+
+import os
+import re
+import pickle
+import bisect
+from array import array
+from collections import defaultdict
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import INDEX_CARD_TEXT
+
+INDEX_VERSION = 1 # layout of saved index
+EMPTY = frozenset()
+WORD_REGEX = re.compile(r'\w+')
+EXACT_FIELDS = ('keyword', 'reference', 'parent') # matched whole, case insensitive except parent keys
+TERM_REGEX = re.compile(r'(\w+):"([^"]*)"|(\w+):(\S+)|(\S+)') # field:"two words", field:value or word
+
+class SearchIndex:
+	'''Inverted index of words in title and zettel text, with exact maps of other fields
+	Postings are sets of the library's own key strings, so queries are set operations in C'''
+
+	def __init__(self):
+		self.postings = defaultdict(set) # word -> keys
+		self.fields = {field: defaultdict(set) for field in EXACT_FIELDS} # field -> value -> keys
+		self.packed = {} # postings and fields from load, not yet unpacked
+		self.key_list = [] # keys by number, for unpacking
+		self.keys = set()
+		self.vocabulary = None # sorted words for prefix queries, rebuilt after changes
+
+	def __len__(self):
+		return len(self.keys)
+
+	def words(self, zettel):
+		'''Words of title and zettel text, leaving out the generated text of index cards'''
+		text = zettel.zettel
+		if not isinstance(text, str) or text.startswith(INDEX_CARD_TEXT): text = '' # lazy or generated summary
+		return set(WORD_REGEX.findall(f"{zettel.title} {text}".casefold()))
+
+	def values(self, field, value):
+		'''Exact match values of a field, keywords split on commas'''
+		if not value: return ()
+		if field == 'parent': return (value,)
+		value = ' '.join(value.split()).casefold()
+		return [keyword.strip() for keyword in value.split(',') if keyword.strip()] if field == 'keyword' else (value,)
+
+	def add(self, key, zettel):
+		'''Index one zettel under key'''
+		self.keys.add(key)
+		if self.packed: self.unpack_all() # adding to a packed posting would hide it
+		for word in self.words(zettel): self.postings[word].add(key)
+		for field, values in self.fields.items():
+			for value in self.values(field, zettel[field]): values[value].add(key)
+		self.vocabulary = None
+
+	def update(self, library):
+		'''Index every zettel of a dictionary, or iterable of (key, zettel) pairs'''
+		for key, zettel in (library.items() if hasattr(library, 'items') else library): self.add(key, zettel)
+
+	def remove(self, key, zettel):
+		'''Drop key, given the zettel as it was when indexed'''
+		self.keys.discard(key)
+		if self.packed: self.unpack_all()
+		for word in self.words(zettel): self.discard(self.postings, word, key)
+		for field, values in self.fields.items():
+			for value in self.values(field, zettel[field]): self.discard(values, value, key)
+		self.vocabulary = None
+
+	def discard(self, postings, value, key):
+		keys = postings.get(value)
+		if keys is None: return
+		keys.discard(key)
+		if not keys: del postings[value]
+
+	def lookup(self, postings, value, name = None):
+		'''Keys under value, unpacking them on first use after load'''
+		keys = postings.get(value)
+		if keys is None:
+			numbers = self.packed.pop((name, value), None)
+			if numbers is None: return EMPTY
+			keys = postings[value] = set(map(self.key_list.__getitem__, array('I', numbers)))
+		return keys
+
+	def unpack_all(self):
+		for name, value in list(self.packed):
+			self.lookup(self.fields[name] if name else self.postings, value, name)
+
+	def word(self, word):
+		'''Keys with this word in title or zettel'''
+		return self.lookup(self.postings, word.casefold())
+
+	def prefix(self, prefix):
+		'''Keys with any word starting with prefix'''
+		prefix = prefix.casefold()
+		if self.vocabulary is None:
+			self.vocabulary = sorted(set(self.postings).union(value for name, value in self.packed if name is None))
+		start = bisect.bisect_left(self.vocabulary, prefix)
+		end = bisect.bisect_left(self.vocabulary, prefix + '\U0010ffff') # past every word with this prefix
+		if end - start == 1: return self.word(self.vocabulary[start])
+		return set().union(*(self.word(word) for word in self.vocabulary[start: end]))
+
+	def field(self, field, value):
+		'''Keys whose field matches value exactly, case insensitive except parent'''
+		if field not in self.fields: raise ValueError(f"Field not indexed: {field}, expected one of {EXACT_FIELDS}")
+		matches = [self.lookup(self.fields[field], value, field) for value in self.values(field, value)]
+		return matches[0] if len(matches) == 1 else set().union(*matches)
+
+	def term(self, term):
+		'''Keys matching one query term: word, prefix* or field:value'''
+		result = TERM_REGEX.fullmatch(term)
+		field, value = (result.group(1), result.group(2)) if result.group(1) else (result.group(3), result.group(4))
+		if field in self.fields: return [self.field(field, value)]
+		words = WORD_REGEX.findall(term.casefold())
+		if not words: return []
+		# a term like "sand-silt" is all its words, prefix applies to the last one
+		last = self.prefix(words[-1]) if term.endswith('*') else self.word(words[-1])
+		return [self.word(word) for word in words[:-1]] + [last]
+
+	def query(self, text, mode = 'and'):
+		'''Keys matching all ('and') or any ('or') terms of a query, see module docstring
+		Returns a new set, empty for an empty query'''
+		if mode not in ('and', 'or'): raise ValueError(f"Unknown query mode: {mode}, expected 'and' or 'or'")
+		matches = [keys for result in TERM_REGEX.finditer(text) for keys in self.term(result.group())]
+		if not matches: return set()
+		if mode == 'or': return set().union(*matches)
+		matches.sort(key = len) # intersect from the smallest set, which bounds the work
+		return set(matches[0]).intersection(*matches[1:])
+
+	def save(self, file_path):
+		'''Write index alongside the library, replacing any earlier save only once complete'''
+		if not self.packed: self.key_list = list(self.keys) # otherwise unchanged since load, see add
+		numbers = {key: number for number, key in enumerate(self.key_list)}
+		pack = lambda keys: array('I', map(numbers.__getitem__, keys)).tobytes()
+		packed = {(None, word): pack(keys) for word, keys in self.postings.items()}
+		packed.update({(name, value): pack(keys) for name, values in self.fields.items() for value, keys in values.items()})
+		packed.update(self.packed) # still packed from load
+		temporary_path = f"{file_path}.{os.getpid()}.tmp"
+		try:
+			with open(temporary_path, 'wb') as my_file:
+				pickle.dump((INDEX_VERSION, self.key_list, packed), my_file, protocol = pickle.HIGHEST_PROTOCOL)
+			os.replace(temporary_path, file_path)
+		finally:
+			if os.path.exists(temporary_path): os.remove(temporary_path)
+		return file_path
+
+	@classmethod
+	def load(cls, file_path):
+		'''Read index written by save'''
+		with open(file_path, 'rb') as my_file: version, key_list, packed = pickle.load(my_file)
+		if version != INDEX_VERSION: raise ValueError(f"Search index version not recognised: {file_path}")
+		index = cls()
+		index.key_list, index.keys, index.packed = key_list, set(key_list), packed
+		return index
@@ -0,0 +1,112 @@
+'''
+Conversion service for Zettelkasten txt to csv converter
+
+Keep worker processes warm between conversions: one long running process reads
+a JSON request per line on stdin and writes a JSON result per line on stdout as
+each conversion finishes, so many small files cost milliseconds each instead
+of starting an interpreter for every file.
+
+request   {"id": 1, "file": "notes.txt", "formats": ["csv"], "output_dir": "out"}
+          and optionally compress, stream, memory_map, dedup, attachments or report, see convert_file
+result    {"id": 1, "file": "notes.txt", "zettels": 8, "outputs": [...], "error": "", "seconds": 0.004}
+
+The first line written is {"event": "ready", "workers": n}, once every worker has
+started and parsed a sample so its caches are filled. Results follow in the order
+conversions finish, matched to requests by id, and {"event": "closed", ...} ends
+the output after stdin ends. Requests that cannot be read get a result with an
+error straight away. Anything printed while converting goes to stderr.
+
+Run from repository root:
+python -m zettelkasten_txt_to_csv --serve --workers 4 < requests.jsonl
+'''
+
+import os
+import sys
+import json
+import threading
+from functools import partial
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten, worker_count
+from zettelkasten_txt_to_csv.batch import convert_file
+
+FORMATS = ('csv', 'txt', 'tsv', 'snapshot')
+OPTIONS = ('compress', 'stream', 'memory_map', 'dedup', 'attachments', 'report') # passed on to convert_file
+PENDING = 4 # requests queued per worker before reading waits
+WARM_TXT = '''Warm up
+
+[index] 1 [title] Soil [zettel] Ground for plants [reference] none [keyword] warm
+[index] 2 [title] Loam [zettel] Sand, silt and clay [parent] 1
+'''
+
+def warm_worker():
+	'''Start a worker process: messages to stderr, clear of the results, and a sample parsed
+	as txt and csv so field name caches and the csv sniffer are ready for the first request'''
+	sys.stdout = sys.stderr
+	zkn = Zettelkasten()
+	zkn.import_text_zk(WARM_TXT, '.txt')
+	zkn.import_text_zk('index;title;zettel\n44000.1;Warm;Cards\n', '.csv')
+
+def read_request(line):
+	'''(id, arguments of convert_file) of one request line, raises ValueError if it cannot be converted'''
+	request = json.loads(line)
+	if not isinstance(request, dict): raise ValueError('Request must be a JSON object')
+	request_id = request.pop('id', None)
+	try:
+		file_path = request.pop('file', None)
+		if not isinstance(file_path, str) or not file_path: raise ValueError('Request needs a "file" to convert')
+		formats = request.pop('formats', ['csv', 'txt'])
+		if not isinstance(formats, list) or not formats or not all(isinstance(ending, str) and ending in FORMATS for ending in formats):
+			raise ValueError(f"Unknown formats: {formats}, expected a list from {FORMATS}")
+		output_dir = request.pop('output_dir', None)
+		if output_dir is not None and not isinstance(output_dir, str): raise ValueError(f"Request output_dir must be a folder name: {output_dir}")
+		unknown = [name for name in request if name not in OPTIONS]
+		if unknown: raise ValueError(f"Unknown request fields: {', '.join(unknown)}")
+	except ValueError as error:
+		error.request_id = request_id # so the reply can still be matched
+		raise
+	return request_id, dict(file_path = file_path, formats = tuple(formats), output_dir = output_dir, **request)
+
+def serve(requests = None, output = None, workers = None, pending = PENDING):
+	'''Convert requests, lines of JSON from stdin, writing results to stdout as they finish
+	workers: warm worker processes, None for one per CPU
+	pending: requests queued per worker, reading waits beyond this
+	Returns the number of failed requests'''
+	requests = sys.stdin if requests is None else requests
+	output = sys.stdout if output is None else output
+	lock = threading.Lock()
+	counts = dict(converted = 0, failed = 0)
+
+	def reply(message, outcome = None):
+		with lock:
+			if outcome: counts[outcome] += 1
+			output.write(json.dumps(message) + '\n')
+			output.flush()
+
+	def finish(request_id, future):
+		try: result = future.result()
+		except Exception as error: result = dict(error = f"{type(error).__name__}: {error}") # worker lost
+		slots.release()
+		reply(dict(id = request_id, **result), 'failed' if result['error'] else 'converted')
+
+	workers = worker_count(workers)
+	with redirect_stdout(sys.stderr), ProcessPoolExecutor(workers, initializer = warm_worker) as executor:
+		# start every worker now rather than on the first requests, a new one is started for each busy one
+		for future in [executor.submit(os.getpid) for _ in range(workers)]: future.result()
+		reply(dict(event = 'ready', workers = workers))
+		slots = threading.BoundedSemaphore(pending * workers)
+		for line in requests:
+			if not line.strip(): continue
+			try: request_id, arguments = read_request(line)
+			except (ValueError, TypeError) as error:
+				reply(dict(id = getattr(error, 'request_id', None), error = f"{type(error).__name__}: {error}"), 'failed')
+				continue
+			try:
+				if arguments['output_dir']: os.makedirs(arguments['output_dir'], exist_ok = True)
+			except (OSError, ValueError, TypeError) as error:
+				reply(dict(id = request_id, error = f"{type(error).__name__}: {error}"), 'failed')
+				continue
+			slots.acquire()
+			executor.submit(convert_file, **arguments).add_done_callback(partial(finish, request_id))
+	reply(dict(event = 'closed', **counts))
+	return counts['failed']
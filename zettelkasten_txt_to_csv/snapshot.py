@@ -0,0 +1,232 @@
+'''
+Binary snapshot for Zettelkasten txt to csv converter
+
+Reopen a converted library without parsing csv or txt again. The snapshot holds
+one string table per column (index, then the zettel fields in export order):
+
+header   magic, version, number of columns, number of zettels
+column   bytes and characters of its text, number of strings in the table,
+         whether strings are separated, whether the column is encoded,
+         then for an encoded column the table number of each zettel,
+         byte offsets of each string in the text (strings + 1 of them),
+         character offsets too if the text is neither separated nor ascii,
+         and the utf-8 text itself, each part padded to 8 bytes
+
+Strings are joined with NUL separators unless one contains NUL, so loading
+decodes each column once and splits it in C rather than slicing one string at
+a time. Columns where values repeat, such as parent, keep each value once and
+are encoded as table numbers, so loading shares the strings between zettels.
+With lazy = True the file is mapped and only the index column decoded, each
+zettel being read from the mapping when asked for.
+
+Written by Zettelkasten.export_zk_snapshot, read by Zettelkasten.import_snapshot_zk.
+'''
+
+import gc
+import os
+import sys
+import mmap
+import struct
+import itertools
+from array import array
+from contextlib import contextmanager
+from collections.abc import Mapping
+try: # imported as part of the package
+	from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettel, ZETTEL_FIELDS, zettel_row
+except ImportError: # run as script from this folder, such as strategy.py
+	from zettelkasten_txt_to_csv import Zettel, ZETTEL_FIELDS, zettel_row
+
+MAGIC = b'ZKSNAP\r\n' # line ending catches files mangled by text mode transfers
+SNAPSHOT_VERSION = 1 # layout of saved snapshot
+HEADER = struct.Struct('<8sIIQ') # magic, version, columns, zettels
+COLUMN = struct.Struct('<QQQ??6x') # bytes, characters of text, strings in table, separated, encoded
+COLUMNS = ('index',) + ZETTEL_FIELDS
+SEPARATOR = '\x00'
+ENCODE_RATIO = 2 # encode column if each value repeats this often on average
+ALIGNMENT = 8
+SWAP = sys.byteorder != 'little' # numbers are stored little endian
+
+def as_text(value):
+	'''Field value as stored, lazy summaries are built and missing parents are empty'''
+	return value if type(value) is str else '' if value is None else str(value)
+
+def number_type(largest):
+	return 'I' if largest < 2 ** 32 else 'Q'
+
+def padding(position):
+	return bytes(-position % ALIGNMENT)
+
+@contextmanager
+def paused_gc():
+	'''Hold off cyclic garbage collection while creating many objects that will all be kept
+	Collections set off by the allocations would otherwise scan the growing library again and again'''
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled: gc.enable()
+
+def save_snapshot(file_path, library, buffer_size = -1):
+	'''Write library, a dictionary or iterable of (key, zettel) pairs, replacing any earlier
+	snapshot only once complete, returns file_path
+	A columnar.ColumnarLibrary is written straight from its columns'''
+	if hasattr(library, 'text_columns'): return save_columns(file_path, library.text_columns, buffer_size)
+	items = library.items() if hasattr(library, 'items') else library
+	rows = [(key, *zettel_row(zettel)) for key, zettel in items]
+	columns = [list(map(as_text, column)) for column in zip(*rows)] if rows else [[] for _ in COLUMNS]
+	del rows
+	return save_columns(file_path, columns, buffer_size)
+
+def save_columns(file_path, columns, buffer_size = -1):
+	'''Write snapshot of string columns, index then the zettel fields, each with a value per zettel'''
+	temporary_path = f"{file_path}.{os.getpid()}.tmp"
+	try:
+		with open(temporary_path, 'wb', buffering = buffer_size) as my_file:
+			my_file.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(COLUMNS), len(columns[0])))
+			for number, column in enumerate(columns):
+				write_column(my_file, column, encode = number > 0) # keys never repeat
+		os.replace(temporary_path, file_path)
+	finally:
+		if os.path.exists(temporary_path): os.remove(temporary_path)
+	return file_path
+
+def write_column(my_file, column, encode = True):
+	'''Write one column of strings, as a table of its distinct values if they repeat enough'''
+	table = list(dict.fromkeys(column)) if encode else column
+	encoded = encode and 0 < len(table) * ENCODE_RATIO <= len(column)
+	if not encoded: table = column
+	text = SEPARATOR.join(table)
+	separated = text.count(SEPARATOR) == max(len(table) - 1, 0)
+	if not separated: text = ''.join(table)
+	blob = text.encode('utf-8')
+	typecode = number_type(len(blob) + 1)
+	# each string starts past the end and separator of the one before
+	lengths = map(len, table) if len(blob) == len(text) else (len(value.encode('utf-8')) for value in table)
+	parts = [array(typecode, itertools.accumulate(lengths, lambda offset, length: offset + length + separated, initial = 0))]
+	if not separated and len(blob) != len(text): # ascii text has the same offsets in bytes and characters
+		parts.append(array(typecode, itertools.accumulate(map(len, table), initial = 0)))
+	if encoded:
+		numbers = {value: number for number, value in enumerate(table)}
+		parts.insert(0, array(number_type(len(table)), map(numbers.__getitem__, column)))
+
+	my_file.write(COLUMN.pack(len(blob), len(text), len(table), separated, encoded))
+	for part in parts:
+		if SWAP: part = array(part.typecode, part); part.byteswap()
+		my_file.write(part)
+		my_file.write(padding(my_file.tell()))
+	my_file.write(blob)
+	my_file.write(padding(my_file.tell()))
+
+class Column:
+	'''Parts of one column in a view of a snapshot, see module docstring'''
+	__slots__ = ('codes', 'offsets', 'characters', 'start', 'end')
+
+	def __init__(self, view, position, count):
+		'''Read column starting at position, for a snapshot of count zettels'''
+		size, length, strings, separated, encoded = COLUMN.unpack_from(view, position)
+		position += COLUMN.size
+		self.codes, self.characters = None, None
+		if encoded: self.codes, position = self.numbers(view, position, number_type(strings), count)
+		self.offsets, position = self.numbers(view, position, number_type(size + 1), strings + 1)
+		if not separated:
+			self.characters = self.offsets
+			if size != length: self.characters, position = self.numbers(view, position, number_type(size + 1), strings + 1)
+		self.start, self.end = position, position + size
+
+	def numbers(self, view, position, typecode, count):
+		'''Array of count numbers at position, a view into the file where byte order allows'''
+		end = position + array(typecode).itemsize * count
+		numbers = view[position: end].cast(typecode)
+		if SWAP: numbers = array(typecode, numbers); numbers.byteswap()
+		return numbers, end + -end % ALIGNMENT
+
+	@property
+	def next_position(self):
+		return self.end + -self.end % ALIGNMENT
+
+	def table(self, view):
+		'''All strings of the table'''
+		if len(self.offsets) < 2: return []
+		text = str(view[self.start: self.end], 'utf-8')
+		if self.characters is None: return text.split(SEPARATOR)
+		return list(map(text.__getitem__, map(slice, self.characters, self.characters[1:])))
+
+	def values(self, view):
+		'''Value of the column for every zettel'''
+		table = self.table(view)
+		return table if self.codes is None else list(map(table.__getitem__, self.codes))
+
+	def value(self, view, number):
+		'''Value of one zettel, decoded from the view alone'''
+		if self.codes is not None: number = self.codes[number]
+		return str(view[self.start + self.offsets[number]: self.start + self.offsets[number + 1] - (self.characters is None)], 'utf-8')
+
+def read_columns(view):
+	'''(number of zettels, Column of each field) in view of a snapshot'''
+	if len(view) < HEADER.size: raise ValueError('Not a zettelkasten snapshot: file too short')
+	magic, version, column_count, count = HEADER.unpack_from(view)
+	if magic != MAGIC: raise ValueError('Not a zettelkasten snapshot')
+	if version != SNAPSHOT_VERSION or column_count != len(COLUMNS): raise ValueError(f"Snapshot version not recognised: {version}")
+	position, columns = HEADER.size, []
+	for _ in range(column_count):
+		columns.append(Column(view, position, count))
+		position = columns[-1].next_position
+	return count, columns
+
+def load_snapshot(file_path, lazy = False):
+	'''Read snapshot written by save_snapshot into a dictionary of zettels
+	lazy: return a SnapshotLibrary reading zettels from the mapped file instead'''
+	if lazy: return SnapshotLibrary(file_path)
+	with open(file_path, 'rb') as my_file: view = memoryview(my_file.read())
+	count, columns = read_columns(view)
+	keys, *fields = [column.values(view) for column in columns]
+	with paused_gc(): return dict(zip(keys, map(Zettel, *fields)))
+
+class SnapshotLibrary(Mapping):
+	'''Read only library backed by a mapped snapshot, decoding each zettel when it is read
+	Only the index column is decoded on opening. Close, or use as a context manager,
+	to release the file'''
+
+	def __init__(self, file_path):
+		with open(file_path, 'rb') as my_file:
+			self.mapping = mmap.mmap(my_file.fileno(), 0, access = mmap.ACCESS_READ) if os.fstat(my_file.fileno()).st_size else b''
+		self.view = memoryview(self.mapping)
+		try:
+			count, self.columns = read_columns(self.view)
+		except ValueError:
+			self.close()
+			raise
+		self.keys_list = self.columns[0].values(self.view)
+		self.numbers = {key: number for number, key in enumerate(self.keys_list)}
+
+	def zettel(self, number):
+		return Zettel(*(column.value(self.view, number) for column in self.columns[1:]))
+
+	def __getitem__(self, key):
+		return self.zettel(self.numbers[key])
+
+	def __iter__(self):
+		return iter(self.keys_list)
+
+	def __len__(self):
+		return len(self.keys_list)
+
+	def __contains__(self, key):
+		return key in self.numbers
+
+	def items(self):
+		'''(key, zettel) pairs in file order, without looking keys up'''
+		return zip(self.keys_list, map(self.zettel, range(len(self.keys_list))))
+
+	def close(self):
+		# columns hold views into the mapping, they must go before it can close
+		self.columns = []
+		self.view.release()
+		if isinstance(self.mapping, mmap.mmap): self.mapping.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
@@ -14,7 +14,10 @@ possible because in Python functions are first class objects.
 
 from __future__ import annotations
 from typing import List, Dict
-from zettelkasten_txt_to_csv import Zettelkasten
+try: # imported as part of the package
+	from zettelkasten_txt_to_csv.zettelkasten_txt_to_csv import Zettelkasten
+except ImportError: # run as script from this folder
+	from zettelkasten_txt_to_csv import Zettelkasten
 
 class Context():
 	"""
@@ -47,7 +50,7 @@ class Context():
 
 		self._strategy = strategy
 
-	def do_some_business_logic(self) -> None:
+	def do_some_business_logic(self, data: Dict = None) -> None:
 		"""
 		The Context delegates some work to the Strategy object instead of
 		implementing multiple versions of the algorithm on its own.
@@ -56,7 +59,7 @@ class Context():
 		# ...
 
 		print("Context: Sorting data using the strategy (not sure how it'll do it)")
-		result = self._strategy.do_algorithm({})
+		result = self._strategy.do_algorithm(data or {})
 		print(len(result))
 
 		# ...
@@ -93,6 +96,35 @@ class import_txt(Strategy):
 		return self.import_txt_zk(file_path = file_path)
 
 
+class convert_pipeline(Strategy):
+	def do_algorithm(self, data: Dict) -> List:
+		# every format of every input from a single parse each, see pipeline.py
+		from zettelkasten_txt_to_csv.pipeline import convert_pipeline # needs the package, run with python -m
+		inputs = data.get('inputs') or [self.find_file()]
+		return convert_pipeline(inputs, data.get('formats', ('csv', 'txt')), data.get('output_dir'), data.get('workers'), force = True)
+
+
+class import_snapshot(Strategy):
+	def do_algorithm(self, data: Dict) -> Dict:
+		# binary snapshot written by export_zk_snapshot, read without parsing
+		file_path = data.get('file_path') or self.find_file()
+		return self.import_snapshot_zk(file_path = file_path, lazy = data.get('lazy', False))
+
+
+class import_evernote(Strategy):
+	def do_algorithm(self, data: Dict) -> Dict:
+		# .enex export read note by note, or an .html note, see notes.py
+		file_path = data.get('file_path') or self.find_file()
+		return self.import_notes_zk(file_path = file_path)
+
+
+class import_markdown(Strategy):
+	def do_algorithm(self, data: Dict) -> Dict:
+		# one .md file split at its headings, or a vault folder with a zettel per file read by several threads
+		file_path = data.get('file_path') or self.find_file()
+		return self.import_notes_zk(file_path = file_path, headings = data.get('headings'), threads = data.get('threads'))
+
+
 if __name__ == "__main__":
 	# The client code picks a concrete strategy and passes it to the context.
 	# The client should be aware of the differences between strategies in order
@@ -10,42 +10,297 @@ Extract subtitles and titles from zettel, with capitalisation
 Extract fields (parent, UID = timestamp, title, contents, reference, keyword)
 Check for duplicate keys, compiles index cards
 Write to csv or text and save with same name + timestamp
+Binary snapshots of the library reload without parsing, see snapshot.py
+Libraries held as columns, for bulk export, sorting and date ranges, see columnar.py
+Whole directories are converted by batch.py, one worker process per file
+Parent and child links of a library are indexed by graph.py, to any depth
+Evernote .enex and .html notes and Markdown vaults are read into sections by notes.py
 
-Next steps
-Accelerate timestamping
+Images and other attachments of notes are stored once per content by attachments.py
 
 Future features:
-Handle images
-Read all files in directory
-Adapt for .html output from Evernote or markdown
 Read fields from list
-Adapt for multi-depth list - currently forces everything into 2 layers
 '''
 
 import re
 import os
+import io
+import mmap
 import csv
-import time
-import tkinter as tk
-from tkinter import filedialog
+import itertools
+from operator import attrgetter, itemgetter
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+from collections.abc import MutableMapping
 from datetime import datetime, timezone
+from time import perf_counter
+
+SHEETS_EPOCH = datetime(1899, 12, 30, tzinfo = timezone.utc) # day zero in Googlesheets
+UID_RESOLUTION = 10**8 # ticks per day, matching the 8 decimal places of each key
+# subtitle on its own line, same as \n{2,3}[\w ]{1,100}\n{2,3} but starting with a literal so re can skip ahead
+SECTION_PATTERN = r'\n\n{1,2}[\w ]{1,100}\n{2,3}'
+FIELD_PATTERN = r'\[\w{1,10}\]' # field marker, e.g. [title]
+SECTION_REGEX = re.compile(SECTION_PATTERN)
+FIELD_REGEX = re.compile(FIELD_PATTERN)
+HEADER_REGEX = re.compile(r'\w{1,10}') # csv column name, as inside a field marker
+TOKEN_REGEX = re.compile(f"{FIELD_PATTERN}|{SECTION_PATTERN}") # no groups, which would defeat the skip ahead
+# same tokens over utf-8 bytes, where \w is ascii only: any multibyte character is let through, up to
+# 4 bytes per character, and tokens that are not plain ascii or are too long are checked once decoded
+MAPPED_FIELD = rb'\[(?:\w|[\x80-\xff]){1,40}\]'
+MAPPED_TOKEN_REGEX = re.compile(MAPPED_FIELD + rb'|\n\n{1,2}(?:[\w ]|[\x80-\xff]){1,400}\n{2,3}')
+MAPPED_NEWLINE = rb'(?:\r\n|\r(?!\n)|\n)' # any line ending, one newline each as text mode reads them
+MAPPED_CRLF_TOKEN_REGEX = re.compile(MAPPED_FIELD + rb'|' + MAPPED_NEWLINE + MAPPED_NEWLINE + rb'{1,2}(?:[\w ]|[\x80-\xff]){1,400}' + MAPPED_NEWLINE + rb'{2,3}')
+FIELD_NAMES = ('title', 'zettel', 'reference', 'keyword', 'parent', 'index') # precedence for partial names
+FIELD_ALIASES = {} # cache of marker spelling to field name, e.g. [Title] -> title
+SECTION_MARGIN = 106 # longest possible subtitle match, held back while streaming
+READ_CHUNK = 1 << 16 # characters read at a time while streaming
+MANIFEST_VERSION = 2 # layout of the incremental import manifest, 2 lists keys per zettel content
+WRITE_BUFFER = 1 << 20 # bytes buffered before each write to disk
+WRITE_BATCH = 1000 # zettels formatted per write in export_zk_txt
+ZETTEL_FIELDS = ('parent', 'title', 'zettel', 'reference', 'keyword') # fields of each zettel, in export order
+CSV_COLUMNS = ('index',) + ZETTEL_FIELDS # columns written by export_zk_csv
+INDEX_CARD_TEXT = 'Section header. ' # start of every section index card
+NOTE_ENDINGS = ('.enex', '.html', '.htm', '.md', '.markdown') # read by import_notes_zk, see notes.py
+SUMMARIES = ('eager', 'lazy', 'skip') # ways to build section index cards, see Zettelkasten.section_summary
+STAGES = ('read', 'split', 'tokenize', 'clean', 'keys', 'index', 'export') # timed by Instruments, in pipeline order
+
+class Zettel(MutableMapping):
+	'''One zettel of the library, with fields stored in slots rather than a dictionary per zettel
+	Fields read and write as attributes, or by name like the dictionary it replaces'''
+	__slots__ = ZETTEL_FIELDS
+
+	def __init__(self, parent = '', title = '', zettel = '', reference = '', keyword = ''):
+		self.parent, self.title, self.zettel, self.reference, self.keyword = parent, title, zettel, reference, keyword
+
+	def __getitem__(self, field):
+		if field not in ZETTEL_FIELD_SET: raise KeyError(field)
+		return getattr(self, field)
+
+	def __setitem__(self, field, value):
+		if field not in ZETTEL_FIELD_SET: raise KeyError(field)
+		setattr(self, field, value)
+
+	def __delitem__(self, field):
+		raise TypeError('Zettel fields cannot be deleted')
+
+	def __iter__(self):
+		return iter(ZETTEL_FIELDS)
+
+	def __len__(self):
+		return len(ZETTEL_FIELDS)
+
+	def __repr__(self):
+		return f"Zettel({', '.join(f'{field}={value!r}' for field, value in zip(ZETTEL_FIELDS, zettel_row(self)))})"
+
+	def __reduce__(self):
+		'''Pickle as field values only, for worker processes'''
+		return Zettel, zettel_row(self)
+
+ZETTEL_FIELD_SET = frozenset(ZETTEL_FIELDS)
+ZETTEL_ROW = attrgetter(*ZETTEL_FIELDS)
+DICTIONARY_ROW = itemgetter(*ZETTEL_FIELDS)
+
+def zettel_row(zettel):
+	'''Tuple of field values in export order, from a Zettel or a plain dictionary'''
+	return ZETTEL_ROW(zettel) if type(zettel) is Zettel else DICTIONARY_ROW(zettel)
+
+class SectionSummary:
+	'''Index card text of a section, built from its zettels the first time it is read as a string
+	Compares, formats and pickles as the plain string, so exporters need no changes'''
+	__slots__ = ('zettel_library', 'build', 'text')
+
+	def __init__(self, zettel_library, build):
+		self.zettel_library, self.build, self.text = zettel_library, build, None
+
+	def __str__(self):
+		if self.text is None:
+			self.text = self.build(self.zettel_library)
+			self.zettel_library = self.build = None # let go of the section once built
+		return self.text
+
+	def __format__(self, format_spec): return format(str(self), format_spec)
+	def __eq__(self, other): return str(self) == (str(other) if isinstance(other, SectionSummary) else other)
+	def __hash__(self): return hash(str(self))
+	def __len__(self): return len(str(self))
+	def __repr__(self): return repr(str(self))
+	def __reduce__(self): return (str, (str(self),))
+
+class UidAllocator:
+	'''Hand out strictly increasing timestamp keys in Googlesheets format without sleeping
+	seed: fixed datetime or serial day to count up from, for deterministic keys'''
+
+	def __init__(self, seed = None):
+		self.seed = seed
+		self.last = -1 if seed is None else self.to_ticks(seed) - 1
+
+	@staticmethod
+	def to_ticks(moment):
+		'''Convert datetime or serial day into integer ticks (1e-8 day, 864 microseconds)'''
+		if isinstance(moment, datetime):
+			if moment.tzinfo is None: moment = moment.replace(tzinfo = timezone.utc)
+			delta = moment - SHEETS_EPOCH
+			microseconds = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+			return microseconds * UID_RESOLUTION // (86400 * 10**6)
+		return round(float(moment) * UID_RESOLUTION)
+
+	@staticmethod
+	def format_key(ticks):
+		'''Write ticks as serial day string with 8 decimal places, e.g. 44077.22985800'''
+		return f"{ticks // UID_RESOLUTION}.{ticks % UID_RESOLUTION:08d}"
+
+	def clock(self):
+		'''Current UTC time in ticks'''
+		return self.to_ticks(datetime.now(timezone.utc))
+
+	def next_key(self):
+		'''Next key: one tick after the last, or the current time if the clock has moved on.
+		Seeded allocators never read the clock, so keys repeat exactly between runs'''
+		if self.seed is None: self.last = max(self.last + 1, self.clock())
+		else: self.last += 1
+		return self.format_key(self.last)
+
+	def skip_past(self, keys):
+		'''Make sure later keys are greater than any of these keys that are serial days'''
+		for key in keys:
+			try: self.last = max(self.last, self.to_ticks(key))
+			except ValueError: pass # explicit index that is not a number
+
+	def reserve(self, count):
+		'''Reserve a block of consecutive keys up front'''
+		return [self.next_key() for _ in range(count)]
+
+class PlaceholderUids:
+	'''Numbered stand-in keys, for parsing sections away from the main allocator'''
+
+	def __init__(self):
+		self.count = 0
+
+	def next_key(self):
+		self.count += 1
+		return self.count - 1
+
+class Instruments:
+	'''Per stage timers and counters for one or more Zettelkasten runs
+	Stage times are exclusive: time in a stage nested inside another is only counted once,
+	so the stages add up to the time spent in all of them'''
+	enabled = True
+
+	def __init__(self):
+		self.seconds = defaultdict(float)
+		self.calls = defaultdict(int)
+		self.counters = defaultdict(int)
+		self.nested = [] # time spent in inner stages of each open stage
+
+	def start(self):
+		self.nested.append(0.0)
+		return perf_counter()
+
+	def stop(self, stage, start):
+		elapsed = perf_counter() - start
+		self.seconds[stage] += elapsed - self.nested.pop()
+		self.calls[stage] += 1
+		if self.nested: self.nested[-1] += elapsed
+
+	@contextmanager
+	def timer(self, stage):
+		'''Time the body of a with statement'''
+		start = self.start()
+		try: yield
+		finally: self.stop(stage, start)
+
+	def wrap(self, stage, function):
+		'''Time every call of function'''
+		def timed(*args, **kwargs):
+			start = self.start()
+			try: return function(*args, **kwargs)
+			finally: self.stop(stage, start)
+		return timed
+
+	def iterate(self, stage, iterable):
+		'''Time each step of iterable, but not the caller's work between steps'''
+		iterator = iter(iterable)
+		while True:
+			start = self.start()
+			try: item = next(iterator)
+			except StopIteration: return
+			finally: self.stop(stage, start)
+			yield item
+
+	def count(self, counter, amount = 1):
+		self.counters[counter] += amount
+
+	def report(self):
+		'''Timers and counters as a dictionary, stages in pipeline order'''
+		stages = sorted(self.seconds, key = lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES))
+		return dict(seconds = {stage: self.seconds[stage] for stage in stages},
+			calls = {stage: self.calls[stage] for stage in stages}, counters = dict(self.counters))
+
+	def save_report(self, file_path):
+		'''Write report as JSON, returns file_path'''
+		import json
+		with open(file_path, 'w', encoding = 'utf-8') as my_file: json.dump(self.report(), my_file, indent = 1)
+		return file_path
+
+	@contextmanager
+	def profile(self, file_path = None):
+		'''Run the body of a with statement under cProfile, saving stats to file_path if given
+		The profiler is kept as self.profiler for pstats'''
+		import cProfile
+		self.profiler = cProfile.Profile()
+		self.profiler.enable()
+		try: yield self.profiler
+		finally:
+			self.profiler.disable()
+			if file_path: self.profiler.dump_stats(file_path)
+
+	def __str__(self):
+		report = self.report()
+		lines = [f"{stage:>10}: {seconds:8.4f} s in {report['calls'][stage]:,} calls" for stage, seconds in report['seconds'].items()]
+		lines += [f"{counter:>10}: {value:,}" for counter, value in report['counters'].items()]
+		return '\n'.join(lines)
+
+class NullInstruments(Instruments):
+	'''Instruments switched off: nothing is timed or counted, iterables pass straight through'''
+	enabled = False
+
+	def timer(self, stage): return nullcontext()
+	def wrap(self, stage, function): return function
+	def iterate(self, stage, iterable): return iterable
+	def count(self, counter, amount = 1): pass
+
+NULL_INSTRUMENTS = NullInstruments()
 
 class Zettelkasten:
 
-	def __init__(self, diagnostics = False):
-		'''Initialise library[key = UID] of dictionaries[keys = parent, title, contents, reference, keyword]'''
+	def __init__(self, diagnostics = False, seed = None, instruments = None):
+		'''Initialise library[key = UID] of Zettel records[keys = parent, title, contents, reference, keyword]
+		seed: optional fixed time (datetime or serial day) for deterministic keys
+		instruments: Instruments to collect stage timers and counters, or True for new ones.
+		On by default with diagnostics, otherwise off at no cost'''
 		self.diagnostics = diagnostics # switch for diagnostics information
+		if instruments is True or (instruments is None and diagnostics): instruments = Instruments()
+		self.instruments = instruments or NULL_INSTRUMENTS
+		if self.instruments.enabled:
+			# per call timers only exist when switched on, so the hot loop is untouched otherwise
+			self.clean_text = self.instruments.wrap('clean', self.clean_text)
+			self.timestamp = self.instruments.wrap('keys', self.timestamp)
+		self.uid = UidAllocator(seed)
 		self.library = {}
 		self.master_key = 0
 		self.file_path = ''
+		self.manifest = None # from last incremental import
+		self.manifest_path = ''
+		self.local_keys = {} # short index as written -> key drawn for it, see resolve_parents
+		self.titled_key = None # last zettel given a title field, whose zettel is then never split at a colon
 
 	def __str__(self):
 		'''Show some stats (number of dictionaries)'''
-		pass
+		sections = sum(1 for zettel in self.library.values() if str(zettel.zettel).startswith(INDEX_CARD_TEXT))
+		return f"Zettelkasten: {len(self.library)} zettels in {sections} sections"
 
 	def display(self):
 		'''Show all zettels'''
-		pass
+		for key, zettel in self.library.items(): print(key, zettel)
 
 	def find_file(self):
 		'''Select file with dialog and check'''
@@ -58,6 +313,9 @@ class Zettelkasten:
 			print(self.file_path)
 
 		else:
+			# tkinter is slow to import and fails without a display, so load it only for the picker
+			import tkinter as tk
+			from tkinter import filedialog
 			root = tk.Tk()
 			root.withdraw()		
 			self.file_path = filedialog.askopenfilename()
@@ -72,8 +330,13 @@ class Zettelkasten:
 		if self.diagnostics: print(new_path)
 		return new_path
 
-	def import_csv_zk(self, library = None, file_path = None):
-		'''Read csv file and save into memory'''
+	def import_csv_zk(self, library = None, file_path = None, delimiter = None, index = None):
+		'''Read csv file and save into memory, mapping each column straight to a zettel field
+		delimiter: ',' or ';' as written by export_zk_csv, detected from the file if None.
+		Header row is optional, without one columns are read in export_zk_csv order.
+		Short or missing index gets a new key, repeated keys keep their first row.
+		A parent naming a short index is pointed at the new key, see resolve_parents
+		index: search index to fill, anything with update(library) such as search.SearchIndex'''
 		# clean out library and check file type
 		if library == None: library = dict()
 		if file_path == None: file_path = self.file_path
@@ -81,19 +344,118 @@ class Zettelkasten:
 			print('Error: Wrong filetype in importing .csv')
 			return library
 
-		with open(file_path, 'r', encoding = 'utf-8') as my_file:
-			contents = csv.DictReader(my_file, delimiter=',')
-
-			# row contains zettel dictionary
-			for row in contents:
-				text = ' '.join([f"[{field_name.lower()}] {contents}" for field_name, contents in row.items()])
-				if self.diagnostics: print("Imported dict: ", text)
-				library = self.separate_into_dictionary(text, library, parent = '', field_type = 'zettel')
-			my_file.close()
+		with open(file_path, 'r', encoding = 'utf-8', newline = '') as my_file: self.read_csv_zk(library, my_file, delimiter)
+		if index is not None:
+			with self.instruments.timer('search'): index.update(library)
 		return library
 
-	def import_txt_zk(self, library = None, file_path = None):
-		'''Read txt file and save into memory'''
+	def read_csv_zk(self, library, my_file, delimiter = None):
+		'''Read rows of an open csv file or text stream into library, see import_csv_zk'''
+		if delimiter == None:
+			with self.instruments.timer('read'): delimiter = self.sniff_delimiter(my_file.read(READ_CHUNK))
+		my_file.seek(0)
+		rows = self.instruments.iterate('read', csv.reader(my_file, delimiter = delimiter))
+		first_row = next(rows, [])
+		header = self.is_csv_header(first_row)
+		columns = self.csv_columns(first_row if header else CSV_COLUMNS)
+		if not header: rows = itertools.chain([first_row], rows)
+
+		index_column = next((column for column, field in columns if field == 'index'), None)
+		columns = [(column, field, self.FIELD_HANDLERS[field]) for column, field in columns if field != 'index']
+		duplicates, local_keys = 0, {}
+		for row in rows:
+			if not row: continue
+			key = self.clean_text(row[index_column], False) if index_column is not None and index_column < len(row) else ''
+			if len(key) < 3:
+				given_key, key = key, self.timestamp()
+				if given_key: local_keys[given_key] = key
+			elif key in library:
+				duplicates += 1
+				continue
+
+			library[key] = zettel = Zettel()
+			for column, field, handler in columns:
+				field_contents = self.clean_text(row[column], False) if column < len(row) else ''
+				handler(self, library, key, '', field, field_contents)
+			if not zettel.zettel: del library[key] # clear empty entries
+		self.resolve_parents(library, local_keys)
+
+		if duplicates: print(f"Error: {duplicates} duplicate keys skipped while importing .csv")
+		self.instruments.count('duplicates', duplicates)
+		self.instruments.count('zettels', len(library))
+		return library
+
+	def import_snapshot_zk(self, library = None, file_path = None, lazy = False, index = None):
+		'''Read binary snapshot written by export_zk_snapshot, without parsing any text
+		lazy: return read only snapshot.SnapshotLibrary reading each zettel from the mapped file
+		as it is asked for, instead of a dictionary. Any library given is ignored
+		index: search index to fill, anything with update(library) such as search.SearchIndex'''
+		if file_path == None: file_path = self.file_path
+		if not file_path.lower().endswith('.snapshot'):
+			print('Error: Wrong filetype in importing .snapshot')
+			return dict() if library == None else library
+		snapshot = import_snapshot_module()
+		with self.instruments.timer('read'): zettels = snapshot.load_snapshot(file_path, lazy)
+		if lazy or library == None: library = zettels
+		else: library.update(zettels)
+		self.instruments.count('zettels', len(library))
+		if index is not None:
+			with self.instruments.timer('search'): index.update(library)
+		return library
+
+	def import_notes_zk(self, library = None, file_path = None, headings = None, threads = None, summaries = 'eager', index = None, attachments = None):
+		'''Read Evernote .enex or .html notes or Markdown into sections, as import_txt_zk, see notes.py
+		file_path: a notes file, or a folder of them with a section for the plain notes of each folder
+		headings: Markdown # headings start sections and deeper headings zettels, instead of a zettel per file.
+		None to split a single file at its headings and give each file of a folder one zettel
+		threads: reading the files of a folder ahead of parsing, and storing attachments, None for the ThreadPoolExecutor default
+		summaries, index: see import_txt_zk
+		attachments: folder to store images and other attachments in by content, see attachments.py.
+		Their paths are added to the reference field. None to leave them out'''
+		if library == None: library = dict()
+		if file_path == None: file_path = self.file_path
+		notes = import_notes_module()
+		importer = notes.importer_for(file_path, self, threads, headings)
+		if importer is None:
+			print('Error: Wrong filetype in importing notes')
+			return library
+
+		with notes.AttachmentStore(attachments, threads) if attachments else nullcontext() as store:
+			importer.import_notes(library, file_path, summaries, store)
+		if store:
+			self.instruments.count('attachments written', store.written)
+			self.instruments.count('attachments skipped', store.skipped)
+		self.instruments.count('zettels', len(library))
+		if index is not None:
+			with self.instruments.timer('search'): index.update(library)
+		return library
+
+	def sniff_delimiter(self, sample):
+		'''Pick ',' or ';' from a sample of csv text'''
+		try: return csv.Sniffer().sniff(sample, delimiters = ',;').delimiter
+		except csv.Error: return ';' if sample.count(';') > sample.count(',') else ','
+
+	def is_csv_header(self, row):
+		'''Header row if most of its cells name a zettel field, each a single word as in a field
+		marker, so a first row of text such as "index card" is not taken for a header'''
+		return sum(bool(HEADER_REGEX.fullmatch(cell.strip()) and self.field_name(cell.strip())) for cell in row) * 2 > len(row)
+
+	def csv_columns(self, names):
+		'''(column number, field) for each known column name'''
+		columns = []
+		for column, name in enumerate(names):
+			field = self.field_name(name.strip())
+			if field: columns.append((column, field))
+			else: print(f"Error: Field not identified in column {column}: {name}")
+		return columns
+
+	def import_txt_zk(self, library = None, file_path = None, workers = 1, memory_map = False, summaries = 'eager', index = None):
+		'''Read txt file and save into memory
+		workers: number of processes parsing sections, None for one per CPU.
+		Output is identical to the serial path for the same seed
+		memory_map: scan the file mapped as bytes instead of decoding it whole, see map_sections
+		summaries: 'eager', 'lazy' or 'skip' index card text of each section, see section_summary
+		index: search index to fill, anything with update(library) such as search.SearchIndex'''
 		# Clean out library
 		if library == None: library = dict()
 
@@ -103,41 +465,380 @@ class Zettelkasten:
 			print('Error: Wrong filetype in importing .txt')
 			return library
 
-		with open(file_path, 'r', encoding = 'utf-8') as my_file:
-		    contents = my_file.read()
-		    if self.diagnostics: print("During import \n", contents)
-		    my_file.close()
-
 		self.master_key = self.timestamp()
+		section_key = self.timestamp() # parent of sections, as in separate_into_dictionary
 
-		# Extract subsections from text into dictionary
-		section_library = {}
-		section_library = self.separate_into_dictionary(contents, section_library, parent = self.master_key, field_type = 'section')
-		if self.diagnostics: print(len(section_library), " Sections extracted \n", section_library)
-		
-		# Extract zettels from text into dictionary
-		for key, sub_section in section_library.items():
-			zettel_library = {} # Prevent RuntimeError: dictionary changed size during iteration
-			zettel_library = self.separate_into_dictionary(sub_section['zettel'],
-				zettel_library , parent = key, field_type = 'zettel')
-			library.update({key: sub_section})
-			library[key]['zettel'] = self.generate_index_text(zettel_library)
-			library.update(zettel_library)
+		# Extract subsections and their zettels in a single pass over the text
+		with self.open_sections(file_path, memory_map) as sections:
+			sections = self.instruments.iterate('split', sections)
+			if workers == 1: self.store_sections(library, sections, section_key, summaries = summaries)
+			else:
+				from concurrent.futures import ProcessPoolExecutor
+				sections = list(sections)
+				pending = [fields for title, fields, blank in sections if not blank]
+				workers = worker_count(workers)
+				with ProcessPoolExecutor(workers) as executor:
+					chunksize = max(1, len(pending) // (4 * workers))
+					parsed = executor.map(parse_section_worker, pending, chunksize = chunksize)
+					self.store_sections(library, sections, section_key, parsed, summaries)
 
+		self.instruments.count('zettels', len(library))
+		if index is not None:
+			with self.instruments.timer('search'): index.update(library)
 		if self.diagnostics:
 			print("Library full")
 			for key, value in library.items(): print(key, value)
-			# Check for duplicates and merge dictionaries
-			print('Duplicates: ', set(section_library.keys()).intersection(set(zettel_library.keys())))
+			print(self.instruments)
+
+		return library
+
+	def import_text_zk(self, text, ending, library = None):
+		'''Parse text already read from a .txt or .csv file, as import_txt_zk or import_csv_zk
+		would read the file, for callers doing their own reading such as pipeline.py
+		ending: '.txt' or '.csv', txt text with newlines translated as open() does'''
+		if library == None: library = dict()
+		if ending == '.csv': return self.read_csv_zk(library, io.StringIO(text, newline = ''))
+		if ending != '.txt': raise ValueError(f"Unknown text ending: {ending}, expected '.txt' or '.csv'")
+		self.master_key = self.timestamp()
+		section_key = self.timestamp() # parent of sections, as in import_txt_zk
+		self.store_sections(library, self.instruments.iterate('split', self.lex_sections(text)), section_key)
+		self.instruments.count('zettels', len(library))
+		return library
 
+	@contextmanager
+	def open_sections(self, file_path, memory_map = False, chunk_size = None):
+		'''Open txt file as a stream of (subtitle, fields, blank) sections, see lex_sections
+		memory_map: scan mapped bytes with map_sections
+		chunk_size: read text in chunks with read_sections, otherwise the whole text is read at once'''
+		if memory_map:
+			with open(file_path, 'rb') as my_file, self.instruments.timer('read'):
+				# empty files cannot be mapped
+				mapping = mmap.mmap(my_file.fileno(), 0, access = mmap.ACCESS_READ) if os.fstat(my_file.fileno()).st_size else b''
+			sections = self.map_sections(mapping)
+			try: yield sections
+			finally:
+				sections.close() # release views of the mapping before closing it
+				if mapping: mapping.close()
+			return
+
+		with open(file_path, 'r', encoding = 'utf-8') as my_file:
+			if chunk_size:
+				yield ((title, *self.lex_fields(text)) for title, text in self.read_sections(my_file, chunk_size))
+				return
+			with self.instruments.timer('read'): contents = my_file.read()
+		if self.diagnostics: print("During import \n", contents)
+		yield self.lex_sections(contents)
+
+	def store_sections(self, library, sections, section_key, parsed = None, summaries = 'eager'):
+		'''Store each section's index card followed by its zettels
+		sections: (subtitle, fields, blank) from lex_sections
+		parsed: (zettel library, placeholder count) per non-blank section from parse_section_worker,
+		otherwise sections are parsed here
+		summaries: see section_summary'''
+		for title, fields, blank in sections:
+			key = self.timestamp()
+			if blank: continue # clear empty entries
+
+			with self.instruments.timer('tokenize'):
+				if parsed is None: zettel_library = self.parse_section(fields, parent = key)
+				else: zettel_library = self.assign_keys(*next(parsed), parent = key)
+			if self.instruments.enabled: self.instruments.count('duplicates', len(library.keys() & zettel_library.keys()))
+			with self.instruments.timer('index'):
+				library[key] = Zettel(parent = section_key, title = title,
+					zettel = self.section_summary(zettel_library, summaries))
+			library.update(zettel_library)
+		return library
+
+	def assign_keys(self, zettel_library, count, parent):
+		'''Swap numbered placeholders from parse_section_worker for timestamps, drawn in the
+		same order as parsing here would have drawn them'''
+		with self.instruments.timer('keys'): keys = self.uid.reserve(count)
+		library = {}
+		for key, zettel in zettel_library.items():
+			if isinstance(key, int): key = keys[key]
+			if zettel.parent is None: zettel.parent = parent
+			elif isinstance(zettel.parent, int): zettel.parent = keys[zettel.parent] # resolved in the worker
+			library[key] = zettel
+		return library
+
+	def import_txt_incremental(self, library = None, file_path = None, manifest_path = None):
+		'''Read only what changed in txt file since the manifest was saved, see save_manifest
+		Unchanged sections are skipped without parsing and keep their keys. Zettels in changed
+		sections keep their key if their content was seen before, and only new or changed
+		zettels are returned, with the index cards of their sections'''
+		if library == None: library = dict()
+		if file_path == None: file_path = self.file_path
+		if not file_path.lower().endswith('.txt'):
+			print('Error: Wrong filetype in importing .txt')
+			return library
+		if manifest_path == None: manifest_path = self.extract_filepath(file_path) + '_manifest.json'
+
+		old_manifest = self.load_manifest(manifest_path)
+		old_sections = old_manifest['sections']
+		old_titles = {section['title']: section for section in old_sections.values()}
+		old_zettels = defaultdict(list) # zettels with the same content hand out their keys in order
+		for section in old_sections.values():
+			for content, keys in section['zettels'].items(): old_zettels[content].extend(keys)
+
+		# new keys must not repeat a key from a previous run
+		self.uid.skip_past(section['key'] for section in old_sections.values())
+		self.uid.skip_past(itertools.chain.from_iterable(old_zettels.values()))
+		self.master_key = self.timestamp()
+		section_key = old_manifest['parent'] or self.timestamp() # parent of sections
+		with open(file_path, 'r', encoding = 'utf-8') as my_file:
+			read = [(self.content_hash(title, text), title, text) for title, text in self.instruments.iterate('split', self.read_sections(my_file))]
+
+		# keys of unchanged sections stay theirs, wherever they are in the file
+		sections, used_keys, skipped = {}, set(), 0
+		for section_hash, title, text in read:
+			if section_hash in old_sections:
+				old_section = old_sections[section_hash]
+				used_keys.add(old_section['key'])
+				used_keys.update(itertools.chain.from_iterable(old_section['zettels'].values()))
+		for section_hash, title, text in read:
+			if section_hash in old_sections:
+				sections[section_hash] = old_sections[section_hash]
+				skipped += 1
+				continue
+			with self.instruments.timer('tokenize'): fields, blank = self.lex_fields(text)
+			if blank: continue # clear empty entries
+
+			# section keeps its key if its subtitle is unchanged
+			old_section = old_titles.get(title, {})
+			key = old_section.get('key')
+			if key is None or key in used_keys: key = self.timestamp()
+			used_keys.add(key)
+
+			zettel_library, new_zettels, zettel_hashes, placeholders = {}, {}, {}, {}
+			with self.instruments.timer('tokenize'): parsed = parse_section_worker(fields)[0]
+			for placeholder, zettel in parsed.items():
+				given_key = placeholder if isinstance(placeholder, str) else ''
+				# a parent resolved to a placeholder is hashed by its number within the section
+				row = (f"#{value}" if isinstance(value, int) else value or '' for value in zettel_row(zettel))
+				zettel_hash = self.content_hash(given_key, *row)
+				# repeated content takes the keys it had in this section first, then any other
+				old_keys = itertools.chain(old_section.get('zettels', {}).get(zettel_hash, ()), old_zettels.get(zettel_hash, ()))
+				zettel_key = next((old_key for old_key in old_keys if old_key not in used_keys), None)
+				if zettel_key is None:
+					zettel_key = given_key or self.timestamp()
+					new_zettels[zettel_key] = zettel
+				if zettel.parent is None: zettel.parent = key
+				used_keys.add(zettel_key)
+				placeholders[placeholder] = zettel_key
+				zettel_library[zettel_key] = zettel
+				zettel_hashes.setdefault(zettel_hash, []).append(zettel_key)
+			for zettel in zettel_library.values():
+				if isinstance(zettel.parent, int): zettel.parent = placeholders.get(zettel.parent, key)
+
+			with self.instruments.timer('index'):
+				library[key] = Zettel(parent = section_key, title = title,
+					zettel = self.generate_index_text(zettel_library))
+			library.update(new_zettels)
+			sections[section_hash] = dict(key = key, title = title, zettels = zettel_hashes)
+
+		if self.diagnostics:
+			print(f"Sections unchanged: {skipped}")
+			print(f"New or changed zettels: {len(library)}")
+		self.manifest = dict(version = MANIFEST_VERSION, parent = section_key, sections = sections)
+		self.manifest_path = manifest_path
+		return library
+
+	def content_hash(self, *parts):
+		'''Fingerprint of text parts for the incremental manifest'''
+		import hashlib
+		return hashlib.sha1('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+	def load_manifest(self, manifest_path):
+		'''Read manifest of previous incremental import, or empty manifest if none'''
+		import json
+		manifest = dict(version = MANIFEST_VERSION, parent = '', sections = {})
+		if os.path.exists(manifest_path):
+			with open(manifest_path, 'r', encoding = 'utf-8') as my_file:
+				saved = json.load(my_file)
+			if saved.get('version') == 1: # one key per zettel content
+				for section in saved['sections'].values(): section['zettels'] = {content: [key] for content, key in section['zettels'].items()}
+				manifest = dict(saved, version = MANIFEST_VERSION)
+			elif saved.get('version') == MANIFEST_VERSION: manifest = saved
+			else: print('Error: Manifest version not recognised, importing everything')
+		return manifest
+
+	def save_manifest(self, manifest_path = None):
+		'''Write manifest of last incremental import, once its output has been exported'''
+		import json
+		if manifest_path == None: manifest_path = self.manifest_path
+		with self.open_output(manifest_path) as my_file:
+			json.dump(self.manifest, my_file)
+		return manifest_path
+
+	def iter_txt_zk(self, file_path = None, chunk_size = READ_CHUNK, memory_map = False, summaries = 'eager', index = None):
+		'''Stream txt file as (key, dictionary) pairs, holding at most one section in memory
+		Section index card is yielded before its zettels, in the same order as import_txt_zk.
+		Keys are allocated in reading order, so differ from import_txt_zk for the same seed
+		memory_map: scan the file mapped as bytes instead of reading chunks, see map_sections
+		summaries: see section_summary
+		index: search index filled as each section is read, anything with update(library)'''
+		if file_path == None: file_path = self.file_path
+		if not file_path.lower().endswith('.txt'):
+			print('Error: Wrong filetype in importing .txt')
+			return iter(())
+
+		# assign master_key now, so exporters can name their file before the first zettel
+		self.master_key = self.timestamp()
+		return self.stream_txt_zk(file_path, chunk_size, memory_map, summaries, index)
+
+	def stream_txt_zk(self, file_path, chunk_size = READ_CHUNK, memory_map = False, summaries = 'eager', index = None):
+		'''Generator behind iter_txt_zk'''
+		section_key = self.timestamp() # parent of sections, as in separate_into_dictionary
+		with self.open_sections(file_path, memory_map, chunk_size) as sections:
+			for title, fields, blank in self.instruments.iterate('split', sections):
+				key = self.timestamp()
+				if blank: continue # clear empty entries
+				with self.instruments.timer('tokenize'): zettel_library = self.parse_section(fields, parent = key)
+				with self.instruments.timer('index'):
+					index_card = Zettel(parent = section_key, title = title, zettel = self.section_summary(zettel_library, summaries))
+				if index is not None:
+					with self.instruments.timer('search'): index.update({key: index_card, **zettel_library})
+				yield key, index_card
+				yield from zettel_library.items()
+
+	def read_sections(self, my_file, chunk_size = READ_CHUNK):
+		'''Read file in chunks and yield (subtitle, raw text) of each section as its end is found
+		Splits exactly as separate_into_dictionary does on the whole text'''
+		pattern = SECTION_REGEX
+		buffer, title, position, eof = '', '', 0, False
+		while not eof:
+			with self.instruments.timer('read'): chunk = my_file.read(chunk_size)
+			eof = not chunk
+			buffer += chunk
+			start = 0
+			for result in pattern.finditer(buffer, position):
+				# a subtitle near the end of the buffer may still grow with the next chunk
+				if not eof and result.end() > len(buffer) - SECTION_MARGIN:
+					position = result.start()
+					break
+				yield title, buffer[start: result.start()]
+				title = self.clean_text(result.group(), False)
+				start = position = result.end()
+			else: position = max(start, len(buffer) - SECTION_MARGIN)
+
+			# keep only the unfinished section
+			buffer = buffer[start:]
+			position -= start
+
+		yield title, buffer
+
+	def tokenize(self, text, start = 0, end = None):
+		'''Yield (kind, span) of each subtitle ('section') and field marker ('field') in one pass'''
+		for result in TOKEN_REGEX.finditer(text, start, len(text) if end is None else end):
+			span = result.span()
+			yield 'field' if text[span[0]] == '[' else 'section', span
+
+	def lex_sections(self, text):
+		'''Split whole text into sections and their fields with a single tokenize pass
+		Yields (subtitle, fields, blank) per section, see lex_fields'''
+		title, start, markers = '', 0, []
+		for kind, span in self.tokenize(text):
+			if kind == 'field':
+				markers.append(span)
+				continue
+			yield (title, *self.section_fields(text, start, span[0], markers))
+			title = self.clean_text(text[span[0]: span[1]], False)
+			start, markers = span[1], []
+
+		yield (title, *self.section_fields(text, start, len(text), markers))
+
+	def map_sections(self, mapping):
+		'''lex_sections over utf-8 bytes such as a memory map, without decoding the whole file
+		Only subtitles and field contents are decoded, straight from views of the mapping.
+		Windows and old Mac line endings are read as the newlines text mode would make of them'''
+		with memoryview(mapping) as view:
+			title, start, markers = '', 0, []
+			for kind, span in self.tokenize_mapped(mapping):
+				if kind == 'field':
+					markers.append(span)
+					continue
+				yield (title, *self.mapped_fields(view, start, span[0], markers))
+				title = self.clean_text(str(view[span[0]: span[1]], 'utf-8'), False)
+				start, markers = span[1], []
+
+			yield (title, *self.mapped_fields(view, start, len(mapping), markers))
+
+	def tokenize_mapped(self, mapping):
+		'''tokenize over utf-8 bytes, yields the same tokens as tokenize over the decoded text'''
+		pattern = MAPPED_CRLF_TOKEN_REGEX if mapping.find(b'\r') >= 0 else MAPPED_TOKEN_REGEX
+		position = 0
+		while True:
+			result = pattern.search(mapping, position)
+			if result is None: return
+			start, end = result.span()
+			kind = 'field' if mapping[start] == 0x5b else 'section' # '['
+			token = result.group()
+			if not token.isascii() or (end - start > 12 if kind == 'field' else len(token.strip(b'\r\n')) > 100):
+				# wider byte pattern matched, so check the text pattern before trusting it
+				text = token.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+				if not (FIELD_REGEX if kind == 'field' else SECTION_REGEX).fullmatch(text):
+					position = start + 1
+					continue
+			yield kind, (start, end)
+			position = end
+
+	def mapped_fields(self, view, start, end, markers):
+		'''section_fields over a memoryview, decoding each field name and contents once'''
+		if not markers: return [], not str(view[start: end], 'utf-8').strip()
+		fields = []
+		for (marker_start, marker_end), next_start in zip(markers, [span[0] for span in markers[1:]] + [end]):
+			fields.append((str(view[marker_start: marker_end], 'utf-8').lower(), str(view[marker_end: next_start], 'utf-8')))
+		return fields, False
+
+	def lex_fields(self, text):
+		'''Fields of a single section's text, returns (fields, blank)'''
+		markers = [span for kind, span in self.tokenize(text)]
+		return self.section_fields(text, 0, len(text), markers)
+
+	def section_fields(self, text, start, end, markers):
+		'''Pair each field marker with the raw text up to the next marker
+		fields: list of (field name, raw contents), text before the first marker is dropped
+		blank: True if section has no text at all'''
+		if not markers: return [], not text[start: end].strip()
+		fields = []
+		for (marker_start, marker_end), next_start in zip(markers, [span[0] for span in markers[1:]] + [end]):
+			fields.append((text[marker_start: marker_end].lower(), text[marker_end: next_start]))
+		return fields, False
+
+	def parse_section(self, fields, parent = ''):
+		'''Store (field name, raw contents) pairs of one section as a library of zettels'''
+		library, key = {}, 0
+		self.local_keys, self.titled_key = {}, None
+		for field_name, field_contents in fields:
+			# same scrub as the whole section received in separate_into_dictionary
+			field_contents = " ".join(field_contents.split()).replace(';', ',')
+			key, library = self.store_fields(library, key, parent, field_name, field_contents)
+
+		self.resolve_parents(library, self.local_keys)
+		# clear empty entries
+		return {k: v for k, v in library.items() if v.zettel}
+
+	def resolve_parents(self, library, local_keys):
+		'''Point parents that name a short index, such as "[parent] 1", at the key drawn for that
+		index, so cards nest under each other to any depth instead of only under their section'''
+		if local_keys:
+			for zettel in library.values():
+				if zettel.parent in local_keys: zettel.parent = local_keys[zettel.parent]
 		return library
 
 	def generate_index_text(self, zettel_library):
 		'''Create index card text involving keys and titles of each component card'''
-		index_contents = 'Section header. '
-		for key, value in zettel_library.items():
-			index_contents += f"{key}{', ' + value['title'] if value['title'] else ''}. "
-		return index_contents
+		return ''.join([INDEX_CARD_TEXT] + [f"{key}{', ' + value.title if value.title else ''}. "
+			for key, value in zettel_library.items()])
+
+	def section_summary(self, zettel_library, summaries = 'eager'):
+		'''Index card text of a section
+		summaries: 'eager' builds it now, 'lazy' returns a SectionSummary that builds it when
+		first read as a string, 'skip' leaves it empty when only the zettels are needed'''
+		if summaries == 'eager': return self.generate_index_text(zettel_library)
+		if summaries == 'lazy': return SectionSummary(zettel_library, self.generate_index_text)
+		if summaries == 'skip': return ''
+		raise ValueError(f"Unknown summaries option: {summaries}, expected one of {SUMMARIES}")
 
 	def separate_into_dictionary(self, text, library = {}, parent = '', field_type = ''):
 		'''Extract subsections from text into dictionary using regex
@@ -146,17 +847,15 @@ class Zettelkasten:
 		parent: manually specifies parent of zettel. Overwritten if parent in field_type
 		field_type: index, parent, zettel, reference'''
 		if 'section' in field_type:
-			pattern = r'\n{2,3}[\w ]{1,100}\n{2,3}'
+			pattern = SECTION_REGEX
 			section_key = self.timestamp()
-		elif 'zettel' in field_type: pattern = r'\[\w{1,10}\]'
+		elif 'zettel' in field_type: pattern = FIELD_REGEX
 		else: print('Field type error'); return library
 		key, end_index, field_name, field_contents = 0, 0, '', ''
-		search_results = re.finditer(pattern, text)
+		search_results = pattern.finditer(text)
 
 		# iterate through results and find each field marker
 		for result in search_results:
-			if self.diagnostics: print(f"Key: {key}, search result: {result}")
-			
 			# for sections, capture set of text before first subtitle
 			if not end_index and 'section' in field_type:
 				start_index, end_index = 0, 0
@@ -172,7 +871,6 @@ class Zettelkasten:
 			next_start_index = result.start()
 			field_contents =  self.clean_text(text[end_index: next_start_index], False)
 			start_index, end_index = result.span()
-			if self.diagnostics: print(result, '\n', start_index, field_name, field_contents)
 
 			# store in dictionary according to section or zettel
 			if 'section' in field_type:
@@ -184,8 +882,7 @@ class Zettelkasten:
 			field_name = self.clean_text(result.group(), False)
 
 		# capture final entry
-		field_contents = self.clean_text(text[end_index:-1], False)
-		if self.diagnostics: print(field_contents)
+		field_contents = self.clean_text(text[end_index:], False)
 		if 'section' in field_type:
 			key, library = self.store_subsections(library, section_key, field_name, field_contents)
 		elif 'zettel' in field_type:
@@ -198,8 +895,7 @@ class Zettelkasten:
 		'''Store chunk of text in dictionary with section heading as title and section as zettel'''
 		key = self.timestamp()
 		if key in library.keys(): print('Error: Duplicate key while storing subsection')
-		library[key] = dict(parent = parent, title = field_name,
-			zettel = field_contents, reference = '', keyword = '')
+		library[key] = Zettel(parent = parent, title = field_name, zettel = field_contents)
 
 		return key, library
 
@@ -211,79 +907,169 @@ class Zettelkasten:
 		field_name: string - index, parent, zettel, reference
 		field_contents: string body of field
 		'''
-		field_name = field_name.lower()
+		field = self.field_name(field_name)
 
-		if self.diagnostics: print(f"Key: {key}, field_name: {field_name}, contents: {field_contents}")
+		if field and field != 'index' and key not in library:
+			key = self.store_index(library, key, parent, 'index', '') # text before the first [index] starts a zettel
+		if field: key = self.FIELD_HANDLERS[field](self, library, key, parent, field, field_contents)
+		else:
+			print('Error: Field not identified')
+			self.instruments.count('unidentified fields')
 
-		if 'title' in field_name:
-			library[key]['title'] = self.clean_text(field_contents, True)
+		return key, library
 
-		elif 'zettel' in field_name and ':' not in field_contents:
-			library[key]['zettel'] = self.clean_text(field_contents, True)
-		
-		# split contents into title and zettel if colon present and title empty
-		elif 'zettel' in field_name and ':' in field_contents and not library[key]['title']:
-			if self.diagnostics: print('Splitting title')
-			split_contents = re.split('[:]', field_contents)
-			library[key]['title'] = self.clean_text(split_contents[0], True)
-			library[key]['zettel'] = self.clean_text(split_contents[1], True)
+	def field_name(self, field_name):
+		'''Look up field for a marker such as [Title], matching partial names like [subtitle] once per spelling'''
+		field = FIELD_ALIASES.get(field_name)
+		if field is None:
+			lower_name = field_name.lower()
+			field = next((name for name in FIELD_NAMES if name in lower_name), '')
+			FIELD_ALIASES[field_name] = field
+		return field
 
-		elif 'reference' in field_name:
-			library[key]['reference'] = field_contents
+	def store_title(self, library, key, parent, field, field_contents):
+		'''Capitalised title'''
+		library[key].title = self.clean_text(field_contents, True)
+		self.titled_key = key
+		return key
 
-		elif 'keyword' in field_name:
-			library[key]['keyword'] = field_contents
+	def store_zettel(self, library, key, parent, field, field_contents):
+		'''Capitalised zettel, split at the first colon into title and zettel if the zettel
+		has no title field, so exported zettels containing colons read back unchanged'''
+		zettel = library[key]
+		if ':' not in field_contents or zettel.title or key == self.titled_key:
+			zettel.zettel = self.clean_text(field_contents, True)
 
-		elif 'parent' in field_name:
-			library[key]['parent'] = field_contents
+		else:
+			self.instruments.count('title splits')
+			title, contents = field_contents.split(':', 1)
+			zettel.title = self.clean_text(title, True)
+			zettel.zettel = self.clean_text(contents, True)
+		return key
 
-		elif 'index' in field_name: # create new dictionary entry at each instance of 'index'
-			key = self.timestamp() if len(field_contents) < 3 else field_contents
-			if key in library.keys(): print('Error: Duplicate key when assigning index')
-			else: library[key] = dict(parent = parent, title = '', zettel = '', reference = '', keyword = '')
-			if self.diagnostics: print("Index assigned: ", key, library[key])
+	def store_text(self, library, key, parent, field, field_contents):
+		'''Reference, keyword or parent stored as is'''
+		setattr(library[key], field, field_contents) # field is one of the interned FIELD_NAMES
+		return key
 
-		else: print('Error: Field not identified')
+	def store_index(self, library, key, parent, field, field_contents):
+		'''Create new dictionary entry at each instance of index'''
+		key = self.timestamp() if len(field_contents) < 3 else field_contents
+		if field_contents and len(field_contents) < 3: self.local_keys[field_contents] = key
+		if key in library.keys():
+			print('Error: Duplicate key when assigning index')
+			self.instruments.count('duplicates')
+		else: library[key] = Zettel(parent = parent)
+		return key
 
-		return key, library
+	FIELD_HANDLERS = dict(title = store_title, zettel = store_zettel, reference = store_text,
+		keyword = store_text, parent = store_text, index = store_index)
 
 	def clean_text(self, text, capitals = False):
-		'''Scrub string of double spaces, colons, and capitalize'''
-		text = " ".join(text.split()) # remove double spaces
-
-		if len(text) > 1: # empty/short strings create index errors
-			text = text.translate(str.maketrans(';', ',')) # replace certain characters
-			return text[0].upper() + text[1:] if capitals else text
-		else: return text
+		'''Scrub string of double spaces and semicolons, and capitalize'''
+		text = " ".join(text.split()).replace(';', ',') # remove double spaces, replace is faster than a translate table
+		return text[0].upper() + text[1:] if capitals and text else text # empty strings create index errors
 
 	def timestamp(self):
-		'''Generate timestamp in Googlesheets format UTC (counts days from 30/12/1899)'''
-
-		time.sleep(0.01) # 0.01s necessary to allow timestamp to update to new value
-		python_timestamp = datetime.now(timezone.utc) - datetime(1899, 12, 30, tzinfo = timezone.utc)
-		sheets_timestamp = python_timestamp.days + python_timestamp.seconds/(3600*24) + python_timestamp.microseconds/(3600*24*1000000)
-		if self.diagnostics: print(python_timestamp.seconds)
-		return '{:.8f}'.format(sheets_timestamp)
-
-	def export_zk_csv(self, file_path, library):
-		'''Write dictionary from memory to csv'''
-		csv_output = open(file_path + '_' + str(self.master_key) + '.csv','w', newline='')
-		csv_writer = csv.writer(csv_output , delimiter=';')
-
-		for key, dictionary in library.items():
-			csv_writer.writerow([key, dictionary['parent'], dictionary['title'], dictionary['zettel'], 
-				dictionary['reference'], dictionary['keyword']])
-		csv_output.close()
-		return True
-
-	def export_zk_txt(self, file_path, library):
-		'''Write dictionary from memory to txt'''
-		txt_output = open(file_path + '_' + str(self.master_key) + '.txt','w', newline='')
-		for key, dictionary in library.items():
-			txt_output.write(f"[index] {key} [parent] {dictionary['parent']} [title] {dictionary['title']}\
-				\n[zettel] {dictionary['zettel']} \n[reference] {dictionary['reference']} \n[keyword] {dictionary['keyword']}\n\n")
-		txt_output.close()
-		pass
+		'''Generate timestamp in Googlesheets format UTC (counts days from 30/12/1899)
+		Keys are unique and strictly increasing within this Zettelkasten'''
+		return self.uid.next_key()
+
+	def library_items(self, library):
+		'''Iterate (key, zettel) pairs from a dictionary or a stream of pairs'''
+		return library.items() if hasattr(library, 'items') else library
+
+	@contextmanager
+	def open_output(self, output_path, compress = False, buffer_size = WRITE_BUFFER):
+		'''Open utf-8 text output that only appears at output_path once fully written
+		Writes go to a temporary file alongside, renamed into place on success and removed on error.
+		compress: gzip on the fly'''
+		temporary_path = f"{output_path}.{os.getpid()}.tmp"
+		raw_output = open(temporary_path, 'xb', buffering = buffer_size)
+		try:
+			with raw_output: # not closed by GzipFile
+				if compress: import gzip
+				stream = gzip.GzipFile(fileobj = raw_output, mode = 'wb') if compress else raw_output
+				# closing flushes the last writes, which can fail too, such as on a full disk
+				with io.TextIOWrapper(stream, encoding = 'utf-8', newline = '') as text_output: yield text_output
+			os.replace(temporary_path, output_path)
+		finally:
+			if os.path.exists(temporary_path): os.remove(temporary_path)
+
+	def output_path(self, file_path, ending, compress = False):
+		'''Output file name: same name + timestamp'''
+		return f"{file_path}_{self.master_key}.{ending}{'.gz' if compress else ''}"
+
+	def export_zk_csv(self, file_path, library, compress = False, buffer_size = WRITE_BUFFER, delimiter = ';', ending = 'csv'):
+		'''Write dictionary from memory to csv, returns output path
+		library: dictionary, iterable of (key, dictionary) pairs such as iter_txt_zk, or columnar.ColumnarLibrary
+		compress: write .csv.gz instead'''
+		output_path = self.output_path(file_path, ending, compress)
+		with self.instruments.timer('export'), self.open_output(output_path, compress, buffer_size) as csv_output:
+			if hasattr(library, 'delimited_text'):
+				for text in library.delimited_text(delimiter): csv_output.write(text) # whole columns at a time
+				return output_path
+			csv_writer = csv.writer(csv_output, delimiter = delimiter)
+			# writerows pulls rows lazily, so streams are never held in memory
+			csv_writer.writerows((key, *zettel_row(dictionary)) for key, dictionary in self.library_items(library))
+		return output_path
+
+	def export_zk_tsv(self, file_path, library, compress = False, buffer_size = WRITE_BUFFER):
+		'''Write tab separated values for spreadsheets and analysis tools, see export_zk_csv'''
+		return self.export_zk_csv(file_path, library, compress, buffer_size, delimiter = '\t', ending = 'tsv')
+
+	def export_zk_txt(self, file_path, library, compress = False, buffer_size = WRITE_BUFFER, batch_size = WRITE_BATCH):
+		'''Write dictionary from memory to txt, returns output path
+		library: dictionary, or iterable of (key, dictionary) pairs such as iter_txt_zk
+		compress: write .txt.gz instead
+		batch_size: zettels joined into each write'''
+		output_path = self.output_path(file_path, 'txt', compress)
+		with self.instruments.timer('export'), self.open_output(output_path, compress, buffer_size) as txt_output:
+			items = iter(self.library_items(library))
+			while True:
+				batch = []
+				for key, dictionary in itertools.islice(items, batch_size):
+					parent, title, zettel, reference, keyword = zettel_row(dictionary)
+					batch.append(f"[index] {key} [parent] {parent} [title] {title}\
+				\n[zettel] {zettel} \n[reference] {reference} \n[keyword] {keyword}\n\n")
+				if not batch: break
+				txt_output.write(''.join(batch))
+		return output_path
+
+	def export_zk_snapshot(self, file_path, library, compress = False, buffer_size = WRITE_BUFFER):
+		'''Write library as binary snapshot for fast reload, returns output path
+		compress is ignored, snapshots stay uncompressed so they can be memory mapped'''
+		save_snapshot = import_snapshot_module().save_snapshot
+		output_path = self.output_path(file_path, 'snapshot')
+		with self.instruments.timer('export'): save_snapshot(output_path, library, buffer_size)
+		return output_path
+
+def import_snapshot_module():
+	'''snapshot.py, loaded only when snapshots are used'''
+	try: from zettelkasten_txt_to_csv import snapshot # imported as part of the package
+	except ImportError: import snapshot # run as script from this folder
+	return snapshot
+
+def import_notes_module():
+	'''notes.py, loaded only when notes are imported'''
+	try: from zettelkasten_txt_to_csv import notes # imported as part of the package
+	except ImportError: import notes # run as script from this folder
+	return notes
+
+def worker_count(workers = None):
+	'''Processes for a pool: workers, or one per CPU if None'''
+	return workers or os.cpu_count() or 1
+
+def thread_count(threads = None):
+	'''Threads for a pool: threads, or the ThreadPoolExecutor default if None'''
+	return threads or min(32, (os.cpu_count() or 1) + 4)
+
+def parse_section_worker(fields):
+	'''Parse one section in a worker process, returns (zettel library, number of keys drawn)
+	Keys drawn are numbered placeholders and parents are None, see Zettelkasten.assign_keys'''
+	zkn = Zettelkasten()
+	zkn.uid = PlaceholderUids()
+	return zkn.parse_section(fields, parent = None), zkn.uid.count
 
 if __name__ == '__main__':
 	zkn = Zettelkasten(diagnostics = False)